@@ -5,9 +5,14 @@ Oradock project is an Oracle Database 11g manager system integrated with Docker,
 For more information, please visit https://github.com/rafaelmariotti/oradock
 
 Usage:
-    oradock.py (restore | restart) DATABASE MEMORY SERVICE_NAME [options]
+    oradock.py (restore | restart | clone) DATABASE MEMORY SERVICE_NAME [options]
     oradock.py create database DATABASE PASSWORD MEMORY SERVICE_NAME [options]
     oradock.py create image IMAGE_NAME PASSWORD [options]
+    oradock.py fleet MANIFEST [options]
+    oradock.py refresh CONTAINER_NAME DATABASE [options]
+    oradock.py status CONTAINER_NAME [options]
+    oradock.py daemon [options]
+    oradock.py jobs [JOB_ID] [options]
     oradock.py (-h | --help)
     oradock.py --version
 
@@ -16,10 +21,22 @@ Operations:
                                         Restore and recovery database backup files.
     restart
                                         Restart and configure a container that already has datafiles restored.
+    clone
+                                        Start a new container from a copy-on-write clone of datafiles already restored under --datafile-dir, as a golden copy.
     create database
                                         Create a new empty database.
     create image
                                         Create an Oracle image.
+    refresh
+                                        Bring databases of a running container, restored with --open-mode=read-only, up to date with the backup pieces written since the day before their last checkpoint, as s3 and database clocks may be in different time zones.
+    fleet
+                                        Restore, restart or create databases in many containers at the same time, as described by a manifest.
+    status
+                                        Show if each database of a container is open and registered at the listener, with its startup time.
+    daemon
+                                        Run oradock as a service that queues restore, restart and create database jobs sent to its unix socket, keeping docker and s3 connections open between them.
+    jobs
+                                        Show status and duration of the jobs of an oradock daemon.
  
 Arguments:
     DATABASE
@@ -32,6 +49,12 @@ Arguments:
                                         Main service name for each database, separate by comma.
     IMAGE_NAME
                                         Image name to build.
+    MANIFEST
+                                        JSON file with a list of containers to provision. Each container sets its 'operation' (restore, restart, clone or create), 'database', 'memory', 'service_name', 'password' and any other long option (e.g. 'port', 'datafile_dir', 'image_name', 'container_name').
+    CONTAINER_NAME
+                                        Container to check or refresh.
+    JOB_ID
+                                        Job of the oradock daemon to show, with the duration of each phase.
 
 Options:
     -k ORADOCK_HOME, --oradock-home=ORADOCK_HOME
@@ -58,10 +81,34 @@ Restore options:
                                         s3 bucket directory to download the backup files.
     -S SECRET_KEY, --s3-secret-key=SECRET_KEY
                                         Secret key to download from s3 bucket.
+    -E S3_ENDPOINT, --s3-endpoint=S3_ENDPOINT
+                                        S3 compatible endpoint to download from instead of aws (e.g. http://localhost:9000).
+    -T DOWNLOAD_PARALLEL, --download-parallel=DOWNLOAD_PARALLEL
+                                        Number of backup files downloaded at the same time from s3, among all databases [default: 4].
+    -Z CHUNK_SIZE, --download-chunk-size=CHUNK_SIZE
+                                        Size in mb of each byte range downloaded from big backup files, which are resumed by range if interrupted [default: 256].
     -P PARALLEL, --parallel=PARALLEL
-                                        Set the parallel level to restore backups [default: 1]. 
-
-Restore, restart & create database options:
+                                        Set the parallel level to restore backups, or 'auto' to choose the RMAN channels of each database from host cpus, memory and backup pieces [default: 1]. 
+    -L, --pipeline
+                                        Start the container and restore the controlfile as soon as spfile and controlfile are downloaded, while the other backup files are downloaded from s3. Datafiles are restored as soon as all pieces of their full or level 0 backup set are downloaded, and the remaining datafiles once all backup files are downloaded.
+    -Y CACHE_DIR, --cache-dir=CACHE_DIR
+                                        Shared backup cache directory. Files downloaded from s3 are kept in there and linked into each backup directory.
+    --cache-size=CACHE_SIZE
+                                        Size limit in gb of the backup cache, removing least recently used files not in use by other runs at the end of each run [default: 500].
+    -M MONITOR_INTERVAL, --monitor-interval=MONITOR_INTERVAL
+                                        Seconds between checks of RMAN progress of each channel while restoring, or 0 to disable it [default: 30].
+    --progress-file=PROGRESS_FILE
+                                        File to append RMAN progress of each channel as JSON lines.
+    -U UNTIL_TIME, --until-time=UNTIL_TIME
+                                        Recover databases until this time ('YYYY-MM-DD HH:MM:SS' in host time zone), restoring from the newest spfile and controlfile backups before it.
+    --backup-sets=BACKUP_SETS
+                                        Backup pieces to download: all, or needed to download only the newest full or level 0 backup of each datafile before --until-time and the incremental and archivelog backups after it, as listed by the restored controlfile. needed requires --pipeline [default: all].
+    --backup-index-ttl=INDEX_TTL
+                                        Minutes to reuse the backup index of a s3 bucket, saved in its backup directory, instead of listing the bucket again [default: 0].
+    --open-mode=OPEN_MODE
+                                        Open restored databases read-write, or read-only as a standby that the refresh operation can recover further with newer backups [default: read-write].
+
+Restore, restart, clone & create database options:
     -D DATAFILE_DIR, --datafile-dir=DATAFILE_DIR
                                         Base directory where datafiles will be stored and separated by directories [default: /data].
     -i IMAGE_NAME, --image-name=IMAGE_NAME
@@ -70,6 +117,16 @@ Restore, restart & create database options:
                                         Database port which container will use [default: 1521].
     -C CONTAINER_NAME, --container-name=CONTAINER_NAME
                                         Set the container name to create [default: oradock-db-$DATABASE].
+    -R DATABASE_PARALLEL, --database-parallel=DATABASE_PARALLEL
+                                        Number of databases restored, restarted or created at the same time inside the container, and opened at the same time when it starts again [default: 1].
+    --report-file=REPORT_FILE
+                                        JSON file to save the duration, bytes moved and throughput of each phase of the run.
+    --prometheus-file=PROMETHEUS_FILE
+                                        File to save the same run report in prometheus text format (e.g. for node exporter textfile collector).
+    --large-pages=LARGE_PAGES
+                                        Use HugePages for the SGA of each database: true (when there are enough HugePages), only (fails when there are not) or false [default: true].
+    --numa-node=NUMA_NODE
+                                        Bind the container cpus and memory to a NUMA node, or 'auto' to choose the node with most free memory.
     -F, --force-pull
                                         Forces a docker pull to update the image that oradock is using.
 
@@ -79,7 +136,27 @@ General options:
 
 Funny options:
     --animation=ANIMATION_NUMBER
-                                        Choose your own animation while creating Oracle docker image, between 1 and 2 [default: 1].
+                                        Choose your own animation while creating Oracle docker image, between 1 and 2, or 0 to disable it [default: 1].
+
+Fleet options:
+    --fleet-parallel=FLEET_PARALLEL
+                                        Number of containers provisioned at the same time [default: 2].
+
+Clone options:
+    --clone-dir=CLONE_DIR
+                                        Base directory where cloned datafiles are stored and separated by directories, as in --datafile-dir [default: $DATAFILE_DIR/clones/$CONTAINER_NAME].
+    --clone-method=CLONE_METHOD
+                                        How datafiles are cloned: reflink (copy-on-write files, on btrfs or xfs), overlay (overlayfs mount on top of the golden copy, which restart mounts again after a host reboot when --datafile-dir is the clone directory. Unmount it before removing the clone), copy (full copy) or auto (reflink, copying files when it is not supported) [default: auto].
+
+Daemon options:
+    --daemon-socket=DAEMON_SOCKET
+                                        Unix socket of the oradock daemon. The daemon listens on it, and restore, restart and create database operations are sent to it as jobs when it is set.
+    --job-parallel=JOB_PARALLEL
+                                        Number of jobs the daemon runs at the same time [default: 2].
+    --memory-limit=MEMORY_LIMIT
+                                        Memory percent of the host shared by all running jobs. Jobs wait in queue while their memory is not free [default: 100].
+    --download-bandwidth=DOWNLOAD_BANDWIDTH
+                                        Download bandwidth in mb/s from s3 shared by all jobs, or 0 for no limit [default: 0].
 """
 
 __author__  = 'Rafael dos Santos Mariotti <rafael.s.mariotti@gmail.com>'
@@ -87,6 +164,8 @@ __version__ = 'oradock v1.0'
 
 try:
     import logging
+    import logging.handlers
+    import codecs
     import collections
     import sys
     import os
@@ -94,14 +173,28 @@ try:
     import errno
     import time
     import socket
+    import threading
+    import json
+    import calendar
+    import copy
+    import contextlib
+    import hashlib
+    import fcntl
+    import stat
+    import queue
+    import tarfile
+    import subprocess
+    import socketserver
+    import http.server
+    import http.client
     import boto.exception
-    from multiprocessing import Process, Manager
+    from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, FIRST_EXCEPTION
+    from urllib.parse import urlparse
+    from fnmatch import fnmatch
     from docopt import docopt
     from shutil import copyfile
-    from shutil import copytree
-    from shutil import rmtree
     from shutil import chown
-    from boto.s3.connection import S3Connection
+    from boto.s3.connection import S3Connection, OrdinaryCallingFormat
     from docker import Client
     from docker import errors as docker_error
 except ImportError as error: #check for all modules
@@ -120,9 +213,17 @@ def set_log(log_level): #set log level to print
 ## s3 functions
 
 
-def create_s3conn(access_key, secret_key): #open s3 connection
+def create_s3conn(access_key, secret_key, s3_endpoint=None): #open s3 connection
     try:
-        s3connection=S3Connection(access_key, secret_key)
+        if s3_endpoint is None:
+            s3connection=S3Connection(access_key, secret_key)
+        else: #s3 compatible storage (e.g. a local s3 stand-in)
+            endpoint=urlparse(s3_endpoint)
+            s3connection=S3Connection(access_key, secret_key,
+                                      host=endpoint.hostname,
+                                      port=endpoint.port,
+                                      is_secure=(endpoint.scheme=='https'),
+                                      calling_format=OrdinaryCallingFormat())
     except boto.exception.AWSConnectionError as error:
         logging.error('unexpected response while trying connect to aws s3 [%s]' % error.args[0])
         sys.exit(-1)
@@ -144,16 +245,124 @@ def retrieve_s3bucket_info(s3connection, s3_bucket_name): #get s3 bucket files
     return s3_bucket_conn
 
 
-def download_file(s3_file, file_dest_path): #download a single file from s3 bucket
+def acquire_s3conn(args): #daemon jobs take an open connection from its pool
+    if args.get('s3_pool') is not None:
+        return args['s3_pool'].acquire(args['--s3-access-key'], args['--s3-secret-key'], args['--s3-endpoint'])
+    return create_s3conn(args['--s3-access-key'], args['--s3-secret-key'], args['--s3-endpoint'])
+
+
+def release_s3conn(args, s3connection):
+    if args.get('s3_pool') is not None:
+        args['s3_pool'].release(s3connection, args['--s3-access-key'], args['--s3-secret-key'], args['--s3-endpoint'])
+    else:
+        s3connection.close()
+
+
+s3_thread_data=threading.local()
+
+def retrieve_thread_s3file(s3_file, access_key, secret_key, s3_endpoint): #boto connections are not thread safe, so each download thread keeps its own
+    if getattr(s3_thread_data, 'connection', None) is None:
+        s3_thread_data.connection=create_s3conn(access_key, secret_key, s3_endpoint)
+        s3_thread_data.buckets={}
+    s3_bucket_name=s3_file.bucket.name
+    if s3_bucket_name not in s3_thread_data.buckets:
+        s3_thread_data.buckets[s3_bucket_name]=s3_thread_data.connection.get_bucket(s3_bucket_name, validate=False)
+    thread_s3_file=s3_thread_data.buckets[s3_bucket_name].new_key(s3_file.name)
+    thread_s3_file.size=s3_file.size
+    return thread_s3_file
+
+
+class BandwidthLimiter(object): #token bucket shared by all download threads
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second=bytes_per_second
+        self.tokens=bytes_per_second
+        self.last_time=time.time()
+        self.lock=threading.Lock()
+
+    def consume(self, size):
+        with self.lock:
+            now=time.time()
+            self.tokens=min(self.bytes_per_second, self.tokens+(now-self.last_time)*self.bytes_per_second)
+            self.last_time=now
+            self.tokens-=size
+            wait_time=-self.tokens/self.bytes_per_second if self.tokens < 0 else 0
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+download_limiter=None #set by the daemon, so all jobs share its download bandwidth
+
+class RangeWriter(object): #file object that writes a downloaded byte range at its offset into the preallocated file
+    def __init__(self, file_descriptor, offset):
+        self.file_descriptor=file_descriptor
+        self.offset=offset
+
+    def write(self, data):
+        if download_limiter is not None:
+            download_limiter.consume(len(data))
+        data=memoryview(data)
+        while len(data) > 0:
+            written_bytes=os.pwrite(self.file_descriptor, data, self.offset)
+            self.offset+=written_bytes
+            data=data[written_bytes:]
+
+    def flush(self):
+        pass
+
+
+def read_download_journal(journal_path, s3_file): #returns all byte ranges already downloaded
+    downloaded_ranges=set()
+    try:
+        with open(journal_path, 'r') as journal:
+            if journal.readline().strip() != '# %s %s' % (s3_file.size, s3_file.etag): #s3 file changed since the last attempt
+                return None
+            for line in journal:
+                (start, end)=line.strip().split('-')
+                downloaded_ranges.add((int(start), int(end)))
+    except (OSError, ValueError):
+        return None
+    return downloaded_ranges
+
+
+def prepare_download(s3_file, file_dest_path, chunk_size): #preallocate the file and returns the byte ranges left to download
+    file_part_path=file_dest_path+'.part'
+    journal_path=file_part_path+'.journal'
+    file_size_mb=str(round(int(s3_file.size)/(1024*1024),2))
+
     if os.path.exists(file_dest_path):
-        if os.path.getsize(file_dest_path) != s3_file.size:
-            logging.warning('file \'%s\' already exists and is corrupted. Downloading again (%s mb)' % (file_dest_path, str(round(int(s3_file.size)/(1024*1024),2))))
+        if not check_downloaded_file(s3_file, file_dest_path):
+            logging.warning('file \'%s\' already exists and is corrupted. Downloading again (%s mb)' % (file_dest_path, file_size_mb))
+            os.remove(file_dest_path)
         else:
             logging.warning('file \'%s\' already exists' % file_dest_path)
-            return
-    else:
-        logging.info('downloading file \'%s\' (%s mb)' % (file_dest_path, str(round(int(s3_file.size)/(1024*1024),2))))
+            return None
+
+    all_ranges=[(start, min(start+chunk_size, s3_file.size)-1) for start in range(0, s3_file.size, chunk_size)]
+    downloaded_ranges=None
+    if os.path.exists(file_part_path) and os.path.getsize(file_part_path) == s3_file.size:
+        downloaded_ranges=read_download_journal(journal_path, s3_file)
 
+    if downloaded_ranges is None:
+        logging.info('downloading file \'%s\' (%s mb)' % (file_dest_path, file_size_mb))
+        file_descriptor=os.open(file_part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            try:
+                os.posix_fallocate(file_descriptor, 0, s3_file.size)
+            except (AttributeError, OSError): #no fallocate support on this platform or filesystem
+                os.ftruncate(file_descriptor, s3_file.size)
+        finally:
+            os.close(file_descriptor)
+        with open(journal_path, 'w') as journal:
+            journal.write('# %s %s\n' % (s3_file.size, s3_file.etag))
+        return all_ranges
+
+    missing_ranges=[each_range for each_range in all_ranges if each_range not in downloaded_ranges]
+    logging.info('resuming download of file \'%s\' (%s of %s chunks left, %s mb)' % (file_dest_path, len(missing_ranges), len(all_ranges), file_size_mb))
+    return missing_ranges
+
+
+def download_chunk(s3_file, file_dest_path, start, end): #download a single byte range from s3 file, returns the number of bytes downloaded
+    file_part_path=file_dest_path+'.part'
     try_limit=3 #times to attempt the download
     timeout_sleep=5 #sleep time in seconds to wait after a timeout
     try_count=0
@@ -162,11 +371,19 @@ def download_file(s3_file, file_dest_path): #download a single file from s3 buck
     while(download_success==False and try_count<try_limit):
         try:
             try_count = try_count + 1
-            s3_file.get_contents_to_filename(file_dest_path)
-            if os.path.getsize(file_dest_path) != s3_file.size:
-                logging.warning('file \'%s\' is corrupted. Downloading again (attempt: %s of %s)' % (file_dest_path, str(round(int(s3_file.size)/(1024*1024),2)), str(try_count), str(try_limit)))
-            else:
-                download_success=True
+            file_descriptor=os.open(file_part_path, os.O_WRONLY)
+            try:
+                chunk_writer=RangeWriter(file_descriptor, start)
+                s3_file.get_contents_to_file(chunk_writer, headers={'Range':'bytes=%s-%s' % (start, end)})
+                if chunk_writer.offset != end+1:
+                    logging.warning('chunk %s-%s of file \'%s\' is incomplete. Downloading again (attempt: %s of %s)' % (start, end, file_dest_path, str(try_count), str(try_limit)))
+                    continue
+                os.fsync(file_descriptor)
+            finally:
+                os.close(file_descriptor)
+            with open(file_part_path+'.journal', 'a') as journal: #data is synced before the range is recorded as done
+                journal.write('%s-%s\n' % (start, end))
+            download_success=True
         except boto.exception.S3ResponseError as error:
             logging.error('unexpected response from s3 [%s]' % error.args[1])
             sys.exit(-1)
@@ -177,15 +394,44 @@ def download_file(s3_file, file_dest_path): #download a single file from s3 buck
             logging.error('error while copying data from s3 [%s]' % error.args[1])
             sys.exit(-1)
         except boto.exception.S3PermissionsError as error:
-            logging.error('permission denied on s3 file \'\' [%s]' % error.args[0])
+            logging.error('permission denied on s3 file \'%s\' [%s]' % (s3_file.name, error.args[0]))
             sys.exit(-1)
         except socket.timeout as error:
-            logging.warning('timeout occurred. Download attempt: %s of %s' %(try_count, try_limit))
+            logging.warning('timeout occurred on file \'%s\'. Download attempt: %s of %s' %(file_dest_path, try_count, try_limit))
             time.sleep(timeout_sleep)
 
     if(download_success==False):
-        logging.error('s3 download timeout reached or file is corrupted. Please check your connection and s3 bucket information')
+        logging.error('s3 download timeout reached or file is corrupted. Please check your connection and s3 bucket information. Running oradock again will resume the download')
+        sys.exit(-1)
+    return end-start+1
+
+
+def finish_download(download_info): #all chunks downloaded, so the file gets its final name
+    s3_file=download_info.get('s3_file')
+    file_dest_path=download_info.get('file_dest_path')
+    file_part_path=file_dest_path+'.part'
+    if os.path.getsize(file_part_path) != s3_file.size:
+        logging.error('file \'%s\' is corrupted after download. Please remove it and try again' % file_part_path)
         sys.exit(-1)
+    if download_info.get('cache_file'): #file downloaded into the backup cache
+        save_cache_checksum(s3_file, file_part_path, file_dest_path)
+    os.rename(file_part_path, file_dest_path)
+    os.remove(file_part_path+'.journal')
+    download_info['finished']=True
+    logging.debug('file \'%s\' downloaded' % file_dest_path)
+    for backup_file_path in download_info.get('backup_file_paths'):
+        link_cached_file(file_dest_path, backup_file_path)
+    download_info['cache_lock']=unlock_cache_file(download_info.get('cache_lock'))
+
+
+def download_thread_chunk(download_info, start, end, access_key, secret_key, s3_endpoint): #download worker
+    thread_s3_file=retrieve_thread_s3file(download_info.get('s3_file'), access_key, secret_key, s3_endpoint)
+    downloaded_bytes=download_chunk(thread_s3_file, download_info.get('file_dest_path'), start, end)
+    with download_info.get('lock'):
+        download_info['pending_chunks']-=1
+        if download_info.get('pending_chunks')==0:
+            finish_download(download_info)
+    return downloaded_bytes
 
 
 def get_s3_full_path_dir(s3_bucket):
@@ -194,30 +440,561 @@ def get_s3_full_path_dir(s3_bucket):
     return s3_full_path_dir,s3_bucket_name
 
 
-def download_s3(database_list, backup_dir, access_key, secret_key): #download all files from s3 bucket
-    s3connection=create_s3conn(access_key, secret_key)
+def list_s3_backup_files(database_list, s3connection): #backup pieces selected by the backup index of each database, among all databases
+    s3_file_list=[]
+    for database, info in database_list.items():
+        if info.get('s3_bucket') == '-': #database restored from local backup files only
+            continue
+        (s3_full_path_dir,s3_bucket_name)=get_s3_full_path_dir(info.get('s3_bucket'))
+        s3_bucket_conn=s3connection.get_bucket(s3_bucket_name, validate=False)
+        for piece in info.get('backup_index').get('pieces'):
+            s3_file=s3_bucket_conn.new_key(piece.get('key'))
+            s3_file.size=piece.get('size')
+            s3_file.etag=piece.get('etag')
+            s3_file_list.append((s3_file, info.get('backup_directory') +'/'+ piece.get('name')))
+    return s3_file_list
+
+
+def download_s3_files(s3_file_list, access_key, secret_key, s3_endpoint, download_parallel, chunk_size_mb, cache_dir=None): #download engine, shared by all databases
+    s3_total_size=sum(s3_file.size for s3_file, file_dest_path in s3_file_list)
+    logging.info('downloading %s backup files (%s mb) using %s parallel downloads' % (len(s3_file_list), str(round(s3_total_size/(1024*1024),2)), download_parallel))
+
+    downloaded_bytes=0
+    cache_files={}
+    waiting_files=[] #cache files locked by other runs
+    start_time=time.time()
+
+    def start_download(download_info, executor): #returns the chunk downloads of the file, none when it is already downloaded
+        download_ranges=prepare_download(download_info.get('s3_file'), download_info.get('file_dest_path'), int(chunk_size_mb)*1024*1024)
+        if download_ranges is None:
+            download_info['finished']=True
+            for backup_file_path in download_info.get('backup_file_paths'):
+                link_cached_file(download_info.get('file_dest_path'), backup_file_path)
+            download_info['cache_lock']=unlock_cache_file(download_info.get('cache_lock'))
+            return []
+        download_info['pending_chunks']=len(download_ranges)
+        if len(download_ranges)==0:
+            finish_download(download_info)
+        return [executor.submit(download_thread_chunk, download_info, start, end, access_key, secret_key, s3_endpoint) for start, end in download_ranges]
+
+    try:
+        with ThreadPoolExecutor(max_workers=int(download_parallel)) as executor:
+            download_list=[]
+            try:
+                for s3_file, file_dest_path in s3_file_list: #big files are split in byte ranges, so all workers can share them
+                    download_info={'s3_file':s3_file, 'file_dest_path':file_dest_path, 'backup_file_paths':[], 'cache_file':False, 'cache_lock':None, 'finished':False, 'lock':threading.Lock()}
+                    if cache_dir is not None: #download into the cache, and link the file into the backup directory
+                        cache_file_path=get_cache_file_path(cache_dir, s3_file)
+                        if cache_file_path in cache_files: #same s3 file used by another database
+                            with cache_files[cache_file_path].get('lock'):
+                                cache_files[cache_file_path]['backup_file_paths'].append(file_dest_path)
+                                if cache_files[cache_file_path].get('finished'): #other runs may evict it, unless it is linked under a shared lock
+                                    cache_lock=lock_cache_file(cache_file_path, fcntl.LOCK_SH)
+                                    try:
+                                        link_cached_file(cache_file_path, file_dest_path)
+                                    finally:
+                                        unlock_cache_file(cache_lock)
+                            continue
+                        download_info.update({'file_dest_path':cache_file_path, 'backup_file_paths':[file_dest_path], 'cache_file':True})
+                        cache_files[cache_file_path]=download_info
+                        create_directory(os.path.dirname(cache_file_path))
+                        download_info['cache_lock']=lock_cache_file(cache_file_path, blocking=False) #kept until the file is downloaded and linked
+                        if download_info.get('cache_lock') is None:
+                            waiting_files.append(download_info)
+                            continue
+                    download_list+=start_download(download_info, executor)
+
+                for download in as_completed(download_list):
+                    downloaded_bytes+=download.result()
+
+                for download_info in waiting_files: #locks of this run are all released by now, so waiting for other runs cannot deadlock
+                    download_info['cache_lock']=lock_cache_file(download_info.get('file_dest_path'))
+                    download_list=start_download(download_info, executor)
+                    for download in as_completed(download_list):
+                        downloaded_bytes+=download.result()
+            except BaseException: #stop queued downloads as soon as one fails
+                for download in download_list:
+                    download.cancel()
+                raise
+    finally: #running chunks are finished by now, and unfinished cache files are resumed by the next run that locks them
+        for download_info in cache_files.values():
+            download_info['cache_lock']=unlock_cache_file(download_info.get('cache_lock'))
+
+    elapsed_time=max(time.time()-start_time, 0.001)
+    logging.info('download finished: %s mb in %s seconds (%s mb/s)' % (str(round(downloaded_bytes/(1024*1024),2)), str(round(elapsed_time,1)), str(round(downloaded_bytes/(1024*1024)/elapsed_time,2))))
+    return downloaded_bytes
+
+
+def download_s3(database_list, s3connection, access_key, secret_key, s3_endpoint, download_parallel, chunk_size_mb, cache_dir=None): #download all files from s3 bucket
+    s3_file_list=list_s3_backup_files(database_list, s3connection)
+    return download_s3_files(s3_file_list, access_key, secret_key, s3_endpoint, download_parallel, chunk_size_mb, cache_dir=cache_dir)
+
+
+def write_download_marker(database_list, download_marker): #restore script waits for one of these markers before restoring datafiles
+    for database, info in database_list.items():
+        if info.get('s3_bucket') != '-':
+            open(info.get('backup_directory')+download_marker, 'w').close()
+
+
+backup_sets_poll=5 #seconds between checks for the backup pieces listed by restored controlfiles
+
+def download_needed_files(database_list, backup_file_list, args): #download the pieces each controlfile needs, as soon as its database is mounted. Databases are downloaded one by one, so a restore never waits for pieces of databases that are not mounted yet
+    pending_databases=dict((database, info) for database, info in database_list.items() if info.get('s3_bucket') != '-')
+    downloaded_bytes=0
+    try:
+        while len(pending_databases)>0:
+            ready_databases=[database for database, info in pending_databases.items() if os.path.exists(info.get('backup_directory')+'/.oradock_backup_sets')]
+            if len(ready_databases)==0:
+                if args['restore_finished'].wait(backup_sets_poll): #restore scripts that failed before mounting will never list their pieces
+                    break
+                continue
+            for database in sorted(ready_databases):
+                info=pending_databases.pop(database)
+                database_file_list=[(s3_file, file_dest_path) for s3_file, file_dest_path in backup_file_list if os.path.dirname(file_dest_path)==info.get('backup_directory')]
+                downloaded_bytes+=download_s3_files(select_needed_files(database, info, database_file_list), args['--s3-access-key'], args['--s3-secret-key'], args['--s3-endpoint'], args['--download-parallel'], args['--download-chunk-size'], cache_dir=args['--cache-dir'])
+                write_download_marker({database:info}, '/.oradock_download_complete')
+    finally:
+        write_download_marker(pending_databases, '/.oradock_download_failed')
+    return downloaded_bytes
+
+
+def download_s3_pipeline(database_list, s3connection, args): #download spfile and controlfile first, and keep downloading the other files in background
+    s3_file_list=list_s3_backup_files(database_list, s3connection)
+
+    priority_paths=set()
     for database, info in database_list.items():
-        memory = info.get('memory')
-        service_name = info.get('service_name')
-        s3_bucket = info.get('s3_bucket')
-        backup_dir = info.get('backup_directory')
-        logging.debug('looking for backup files in s3 bucket \'%s\' for database %s' % (s3_bucket, database))
+        for priority_file in ['spfile', 'controlfile']:
+            priority_paths.add(info.get('backup_directory') +'/'+ info.get('backup_index').get(priority_file))
+    priority_file_list=[(s3_file, file_dest_path) for s3_file, file_dest_path in s3_file_list if file_dest_path in priority_paths]
+    backup_file_list=[(s3_file, file_dest_path) for s3_file, file_dest_path in s3_file_list if (s3_file, file_dest_path) not in priority_file_list]
+
+    for database, info in database_list.items(): #clean up markers from previous runs
+        for marker in ['/.oradock_download_complete', '/.oradock_download_failed', '/.oradock_backup_sets']:
+            if os.path.exists(info.get('backup_directory')+marker):
+                os.remove(info.get('backup_directory')+marker)
+        if info.get('s3_bucket') == '-': #local backup files are ready to restore
+            create_directory(info.get('backup_directory'))
+            open(info.get('backup_directory')+'/.oradock_download_complete', 'w').close()
+
+    logging.info('downloading spfile and controlfile backups first')
+    try:
+        with args['report'].measure('download_control_files') as phase_info:
+            phase_info['bytes']=download_s3_files(priority_file_list, args['--s3-access-key'], args['--s3-secret-key'], args['--s3-endpoint'], args['--download-parallel'], args['--download-chunk-size'], cache_dir=args['--cache-dir'])
+    except BaseException: #written on every failure, so a restore script never waits for a download that is not running
+        write_download_marker(database_list, '/.oradock_download_failed')
+        raise
+
+    def download_backup_files():
+        if args['--backup-sets']=='needed': #markers are written for each database
+            with args['report'].measure('download') as phase_info:
+                phase_info['bytes']=download_needed_files(database_list, backup_file_list, args)
+            return
+        download_marker='/.oradock_download_failed'
+        try:
+            with args['report'].measure('download') as phase_info:
+                phase_info['bytes']=download_s3_files(backup_file_list, args['--s3-access-key'], args['--s3-secret-key'], args['--s3-endpoint'], args['--download-parallel'], args['--download-chunk-size'], cache_dir=args['--cache-dir'])
+            download_marker='/.oradock_download_complete'
+        finally:
+            write_download_marker(database_list, download_marker)
+
+    download_thread=threading.Thread(name='download_s3_pipeline', target=download_backup_files)
+    download_thread.daemon=True
+    download_thread.start()
+    return download_thread
+
+
+## backup index functions
+
+
+backup_set_gap=3600 #seconds without new pieces in the same directory that split two backup sets
+
+def parse_until_time(until_time): #epoch of --until-time, in host time zone
+    if until_time is None:
+        return None
+    try:
+        return time.mktime(time.strptime(until_time, '%Y-%m-%d %H:%M:%S'))
+    except ValueError:
+        logging.error('option \'--until-time\' must be a date as \'YYYY-MM-DD HH:MM:SS\'')
+        sys.exit(-1)
+
+
+def read_backup_index(index_file, source, index_ttl): #cached index of the same backup source, while younger than index_ttl minutes
+    try:
+        with open(index_file, 'r') as index_input:
+            backup_index=json.load(index_input)
+    except (OSError, ValueError):
+        return None
+    if backup_index.get('source')!=source or time.time()-backup_index.get('listed_at', 0) > index_ttl*60:
+        return None
+    return backup_index
+
+
+def list_backup_pieces(info, s3connection, index_ttl): #name, size and time of each piece of the s3 listing or backup directory
+    s3_bucket=info.get('s3_bucket')
+    backup_dir=info.get('backup_directory')
+    pieces=[]
+    if s3_bucket == '-':
+        if os.path.isdir(backup_dir):
+            for backup_file in os.scandir(backup_dir):
+                if backup_file.is_file() and not backup_file.name.startswith('.') and not backup_file.name.endswith(('.part', '.journal')):
+                    backup_file_stat=backup_file.stat()
+                    pieces.append({'key':None, 'name':backup_file.name, 'directory':'', 'size':backup_file_stat.st_size, 'etag':None, 'modified':backup_file_stat.st_mtime})
+        return {'source':backup_dir, 'listed_at':time.time(), 'pieces':sorted(pieces, key=lambda piece: piece.get('modified'))}
+
+    if index_ttl > 0:
+        backup_index=read_backup_index(backup_dir+'/.oradock_backup_index.json', s3_bucket, index_ttl)
+        if backup_index is not None:
+            logging.info('using backup index of \'%s\' listed %s minutes ago' % (s3_bucket, str(round((time.time()-backup_index.get('listed_at'))/60, 1))))
+            return backup_index
+
+    logging.debug('looking for backup files in s3 bucket \'%s\'' % s3_bucket)
+    (s3_full_path_dir,s3_bucket_name)=get_s3_full_path_dir(s3_bucket)
+    s3_bucket_conn=retrieve_s3bucket_info(s3connection, s3_bucket_name)
+    if s3_bucket_conn is None:
+        logging.error('s3 bucket \'%s\' does not exists. Please, review your bucket name and access/secret key' % s3_bucket_name)
+        sys.exit(-1)
+    for s3_file in s3_bucket_conn.list(s3_full_path_dir,''):
+        s3_file_name = s3_file.name.split('/')[-1]
+        if s3_file_name == '': #directory placeholder
+            continue
+        pieces.append({'key':s3_file.name,
+                       'name':s3_file_name,
+                       'directory':os.path.dirname(s3_file.name[len(s3_full_path_dir):].lstrip('/')),
+                       'size':s3_file.size,
+                       'etag':s3_file.etag,
+                       'modified':calendar.timegm(time.strptime(s3_file.last_modified[:19], '%Y-%m-%dT%H:%M:%S'))})
+    return {'source':s3_bucket, 'listed_at':time.time(), 'pieces':sorted(pieces, key=lambda piece: piece.get('modified'))}
+
+
+def group_backup_sets(pieces): #pieces of each directory, split where no piece was written for backup_set_gap seconds
+    backup_sets=[]
+    open_sets={}
+    for piece in pieces:
+        backup_set=open_sets.get(piece.get('directory'))
+        if backup_set is None or piece.get('modified')-backup_set.get('end') > backup_set_gap:
+            backup_set={'start':piece.get('modified'), 'end':piece.get('modified'), 'pieces':[]}
+            open_sets[piece.get('directory')]=backup_set
+            backup_sets.append(backup_set)
+        backup_set['end']=piece.get('modified')
+        backup_set['pieces'].append(piece)
+    return backup_sets
+
+
+def find_newest_piece(backup_set, name_pattern, until_epoch):
+    matching_pieces=[piece for piece in backup_set.get('pieces') if fnmatch(piece.get('name').lower(), name_pattern.lower()) and piece.get('modified') <= until_epoch]
+    if len(matching_pieces)==0:
+        return None
+    return matching_pieces[-1]
+
+
+def select_backup_pieces(backup_index, spfile_name, controlfile_name, until_time): #newest spfile and controlfile before until_time. Upload times can not tell which backup sets are needed, so all pieces are selected
+    backup_sets=group_backup_sets(backup_index.get('pieces'))
+    until_epoch=parse_until_time(until_time)
+    if until_epoch is None:
+        until_epoch=float('inf')
+
+    for set_number in reversed(range(len(backup_sets))):
+        spfile=find_newest_piece(backup_sets[set_number], spfile_name, until_epoch)
+        controlfile=find_newest_piece(backup_sets[set_number], controlfile_name, until_epoch)
+        if spfile is not None and controlfile is not None:
+            break
+    else:
+        return None
+
+    return {'spfile':spfile.get('name'),
+            'controlfile':controlfile.get('name'),
+            'backup_sets':len(backup_sets),
+            'pieces':list(backup_index.get('pieces'))}
+
+
+def read_backup_sets(backup_directory): #backup pieces of the restored controlfile, written by the restore script once the database is mounted. Returns None when the controlfile does not have a full or level 0 backup of every datafile
+    backup_sets={'base_sets':0, 'missing_datafiles':0, 'known':set(), 'needed':set()}
+    with open(backup_directory+'/.oradock_backup_sets', 'r') as backup_sets_file:
+        for line in backup_sets_file:
+            fields=line.strip().split('|')
+            if fields[0]=='ORADOCK_BASE':
+                backup_sets['base_sets']+=1
+            elif fields[0]=='ORADOCK_MISSING' and len(fields)==2:
+                backup_sets['missing_datafiles']=int(fields[1])
+            elif fields[0]=='ORADOCK_PIECE' and len(fields)==5:
+                backup_sets['known'].add(fields[3])
+                if fields[4]=='Y':
+                    backup_sets['needed'].add(fields[3])
+    if backup_sets.get('base_sets')==0 or backup_sets.get('missing_datafiles')>0:
+        return None
+    return backup_sets
+
+
+def select_needed_files(database, info, s3_file_list): #pieces the restored controlfile needs, and pieces uploaded after the controlfile backup, which it does not know about yet
+    backup_sets=read_backup_sets(info.get('backup_directory'))
+    if backup_sets is None:
+        logging.warning('controlfile of database %s does not have a full or level 0 backup of every datafile. Downloading all backup pieces' % database)
+        return s3_file_list
+    piece_modified=dict((piece.get('name'), piece.get('modified')) for piece in info.get('backup_index').get('pieces'))
+    missing_pieces=backup_sets.get('needed')-set(piece_modified.keys())
+    if len(missing_pieces)>0: #pieces renamed when they were uploaded can not be matched
+        logging.warning('backup pieces %s needed by controlfile of database %s are not in s3. Downloading all backup pieces' % (', '.join(sorted(missing_pieces)[:5]), database))
+        return s3_file_list
+    controlfile_modified=piece_modified.get(info.get('backup_index').get('controlfile'))
+    needed_file_list=[]
+    for s3_file, file_dest_path in s3_file_list:
+        piece_name=os.path.basename(file_dest_path)
+        if piece_name in backup_sets.get('needed') or (piece_name not in backup_sets.get('known') and piece_modified.get(piece_name, 0) >= controlfile_modified):
+            needed_file_list.append((s3_file, file_dest_path))
+    logging.info('database %s needs %s of %s backup pieces (%s mb left out), as listed by its controlfile' % (database, len(needed_file_list), len(s3_file_list), str(round((sum(s3_file.size for s3_file, file_dest_path in s3_file_list)-sum(s3_file.size for s3_file, file_dest_path in needed_file_list))/(1024*1024),2))))
+    return needed_file_list
+
+
+def index_backup_files(args, database_list, s3connection): #resolves spfile, controlfile and backup pieces of each database before downloading anything, returning the selection of each database
+    backup_selections={}
+    for database, info in database_list.items():
+        backup_index=list_backup_pieces(info, s3connection, int(args['--backup-index-ttl']))
+        backup_selection=select_backup_pieces(backup_index, args['--spfile-name'], args['--control-file-name'], args['--until-time'])
+        if backup_selection is None:
+            logging.error('could not find spfile \'%s\' and controlfile \'%s\' backups of database %s%s' % (args['--spfile-name'], args['--control-file-name'], database, '' if args['--until-time'] is None else ' before '+args['--until-time']))
+            sys.exit(-1)
+        create_directory(info.get('backup_directory'))
+        backup_index['selected']=[piece.get('name') for piece in backup_selection.get('pieces')]
+        write_file_atomically(info.get('backup_directory')+'/.oradock_backup_index.json', json.dumps(backup_index, indent=2)+'\n')
+
+        backup_selections[database]=backup_selection
+        logging.info('database %s restores spfile \'%s\' and controlfile \'%s\' from %s backup pieces' % (database, backup_selection.get('spfile'), backup_selection.get('controlfile'), len(backup_selection.get('pieces'))))
+    return backup_selections
+
+
+def set_backup_selection(database_list, backup_selections):
+    for database, backup_selection in backup_selections.items():
+        database_list[database]['backup_index']=backup_selection
+        database_list[database]['backup_pieces']=dict((piece.get('name'), piece.get('size')) for piece in backup_selection.get('pieces')) #used to plan rman channels before files are downloaded
 
-        (s3_full_path_dir,s3_bucket_name)=get_s3_full_path_dir(s3_bucket)
-        s3_bucket_conn=retrieve_s3bucket_info(s3connection, s3_bucket_name)
-        create_directory(backup_dir)
 
-        for s3_file in s3_bucket_conn.list(s3_full_path_dir,''):
-            s3_file_name = s3_file.name.split('/')[-1]
-            file_dest_path = backup_dir +'/'+ s3_file_name
-            download_file(s3_file, file_dest_path)
-    s3connection.close
+def select_refresh_pieces(backup_index, checkpoint_epoch): #whole backup sets still being written after the database checkpoint, so incremental backups and archived logs come with all their pieces
+    return [piece for backup_set in group_backup_sets(backup_index.get('pieces')) if backup_set.get('end') >= checkpoint_epoch for piece in backup_set.get('pieces')]
+
+
+def index_refresh_files(args, database_list, s3connection): #backup pieces newer than the checkpoint of each database, which is left out of the refresh when there are none
+    refresh_margin=24*60*60 #seconds before the checkpoint, since the database clock and s3 upload times may be in different time zones. Pieces already downloaded are only checked again
+    for database, info in list(database_list.items()):
+        backup_index=list_backup_pieces(info, s3connection, int(args['--backup-index-ttl']))
+        checkpoint=info.get('checkpoint')
+        refresh_pieces=select_refresh_pieces(backup_index, parse_until_time(checkpoint.get('time'))-refresh_margin)
+        if len(refresh_pieces)==0:
+            logging.info('database %s is up to date: there are no backup pieces since the day before its checkpoint at %s (scn %s)' % (database, checkpoint.get('time'), checkpoint.get('scn')))
+            del database_list[database]
+            continue
+        if info.get('s3_bucket')!='-':
+            backup_index['selected']=[piece.get('name') for piece in refresh_pieces]
+            write_file_atomically(info.get('backup_directory')+'/.oradock_backup_index.json', json.dumps(backup_index, indent=2)+'\n')
+
+        info['backup_index']={'pieces':refresh_pieces}
+        info['backup_pieces']=dict((piece.get('name'), piece.get('size')) for piece in refresh_pieces)
+        logging.info('database %s refreshes from its checkpoint at %s (scn %s) with %s of %s backup pieces (%s mb)' % (database, checkpoint.get('time'), checkpoint.get('scn'), len(refresh_pieces), len(backup_index.get('pieces')), str(round(sum(info['backup_pieces'].values())/(1024*1024),2))))
+
+
+## backup cache functions
+
+
+def compute_file_checksum(file_path, hash_type=hashlib.md5):
+    file_checksum=hash_type()
+    with open(file_path, 'rb') as file_to_check:
+        for data in iter(lambda: file_to_check.read(8*1024*1024), b''):
+            file_checksum.update(data)
+    return file_checksum.hexdigest()
+
+
+def check_downloaded_file(s3_file, file_path): #compare checksums when they are known, otherwise only sizes
+    if os.path.getsize(file_path) != s3_file.size:
+        return False
+    s3_file_md5=s3_file.etag.strip('"')
+    if s3_file_md5.find('-')!=-1: #multipart upload etags are not a md5 from the file content
+        if not os.path.exists(file_path+'.md5'):
+            return True
+        with open(file_path+'.md5', 'r') as checksum_file:
+            s3_file_md5=checksum_file.read().strip()
+    return compute_file_checksum(file_path) == s3_file_md5
+
+
+def get_cache_file_path(cache_dir, s3_file): #cache files are addressed by s3 key and etag
+    cache_key=hashlib.sha1(('%s/%s:%s' % (s3_file.bucket.name, s3_file.name, s3_file.etag)).encode('utf-8')).hexdigest()
+    return cache_dir +'/'+ cache_key[:2] +'/'+ cache_key
+
+
+def save_cache_checksum(s3_file, file_path, cache_file_path):
+    file_md5=compute_file_checksum(file_path)
+    if s3_file.etag.strip('"').find('-')==-1 and file_md5 != s3_file.etag.strip('"'):
+        os.remove(file_path)
+        os.remove(file_path+'.journal')
+        logging.error('checksum of file \'%s\' does not match s3 etag. Please try again' % s3_file.name)
+        sys.exit(-1)
+    with open(cache_file_path+'.md5', 'w') as checksum_file:
+        checksum_file.write(file_md5+'\n')
+
+
+def lock_cache_file(cache_file_path, lock_type=fcntl.LOCK_EX, blocking=True): #returns the locked file of a cache entry, or None when another run holds it and blocking is False
+    lock_file=open(cache_file_path+'.lock', 'a')
+    try:
+        try:
+            fcntl.flock(lock_file.fileno(), lock_type | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not blocking:
+                lock_file.close()
+                return None
+            logging.info('waiting for another run using cache file \'%s\'' % cache_file_path)
+            fcntl.flock(lock_file.fileno(), lock_type)
+    except BaseException:
+        lock_file.close()
+        raise
+    return lock_file
+
+
+def unlock_cache_file(lock_file): #always returns None, to clear the reference to the lock
+    if lock_file is not None:
+        lock_file.close()
+    return None
+
+
+def link_cached_file(cache_file_path, file_dest_path): #hardlink or reflink the cached file, copying only when both fail
+    os.utime(cache_file_path) #most recently used
+    if os.path.exists(file_dest_path) and os.path.samefile(cache_file_path, file_dest_path):
+        return
+    file_tmp_path=file_dest_path+'.link'
+    if os.path.exists(file_tmp_path):
+        os.remove(file_tmp_path)
+    try:
+        os.link(cache_file_path, file_tmp_path)
+    except OSError as error:
+        if error.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            logging.error('error linking cached file \'%s\' to \'%s\'. %s' % (cache_file_path, file_dest_path, str(error)))
+            sys.exit(-1)
+        try:
+            with open(cache_file_path, 'rb') as cache_file, open(file_tmp_path, 'wb') as dest_file:
+                fcntl.ioctl(dest_file.fileno(), 0x40049409, cache_file.fileno()) #FICLONE
+        except OSError:
+            copyfile(cache_file_path, file_tmp_path)
+    os.replace(file_tmp_path, file_dest_path)
+    logging.debug('file \'%s\' linked from cache \'%s\'' % (file_dest_path, cache_file_path))
+
+
+def evict_cache(cache_dir, cache_size): #remove least recently used files until the cache fits its size, once at the end of a run
+    cache_files=[]
+    for root, directories, files in os.walk(cache_dir):
+        for each_file in files:
+            if each_file.endswith(('.md5', '.part', '.journal', '.link', '.lock')):
+                continue
+            cache_file_path=root +'/'+ each_file
+            cache_file_stat=os.stat(cache_file_path)
+            cache_files.append((cache_file_stat.st_mtime, cache_file_stat.st_size, cache_file_path))
+
+    total_size=sum(cache_file_size for cache_file_mtime, cache_file_size, cache_file_path in cache_files)
+    for cache_file_mtime, cache_file_size, cache_file_path in sorted(cache_files):
+        if total_size <= cache_size:
+            break
+        if os.path.exists(cache_file_path+'.part'): #downloaded again by another run
+            continue
+        cache_lock=lock_cache_file(cache_file_path, blocking=False)
+        if cache_lock is None: #downloaded or linked by another run
+            continue
+        try: #lock files are kept, so runs waiting on them do not lock a removed file
+            if os.path.exists(cache_file_path):
+                logging.debug('removing file \'%s\' from cache' % cache_file_path)
+                os.remove(cache_file_path)
+            if os.path.exists(cache_file_path+'.md5'):
+                os.remove(cache_file_path+'.md5')
+        finally:
+            unlock_cache_file(cache_lock)
+        total_size-=cache_file_size
+    if total_size > cache_size:
+        logging.warning('backup cache \'%s\' is bigger than its size limit, since all files are in use' % cache_dir)
+
+
+## run report functions
+
+
+class RunReport(object): #duration, bytes moved and throughput of each phase of a restore, restart or create run
+    def __init__(self, operation):
+        self.operation=operation
+        self.container_name=None
+        self.started_at=time.time()
+        self.phases=[]
+        self.settings={} #choices made during the run, as the rman channels of each database
+        self.lock=threading.Lock()
+
+    def add_phase(self, phase, elapsed_time, database=None, bytes_moved=None):
+        phase_info={'phase':phase, 'database':database, 'elapsed_time':round(elapsed_time, 3), 'bytes':bytes_moved, 'throughput_mb_s':None}
+        if bytes_moved is not None and elapsed_time > 0:
+            phase_info['throughput_mb_s']=round(bytes_moved/(1024*1024)/elapsed_time, 2)
+        with self.lock:
+            self.phases.append(phase_info)
+        logging.debug('phase \'%s\'%s finished in %s seconds' % (phase, '' if database is None else ' of database '+database, str(round(elapsed_time, 1))))
+
+    @contextlib.contextmanager
+    def measure(self, phase, database=None): #the caller may set 'bytes' in the yielded dict
+        phase_info={'bytes':None}
+        start_time=time.time()
+        try:
+            yield phase_info
+        finally:
+            self.add_phase(phase, time.time()-start_time, database, phase_info.get('bytes'))
+
+    def to_dict(self):
+        with self.lock:
+            return {'operation':self.operation,
+                    'container':self.container_name,
+                    'started_at':time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+                    'elapsed_time':round(time.time()-self.started_at, 3),
+                    'settings':dict(self.settings),
+                    'phases':list(self.phases)}
+
+    def to_prometheus(self):
+        report=self.to_dict()
+        metrics=[('oradock_phase_duration_seconds', 'elapsed_time', 'Duration of each oradock phase.'),
+                 ('oradock_phase_bytes', 'bytes', 'Bytes moved by each oradock phase.'),
+                 ('oradock_phase_throughput_mb_per_second', 'throughput_mb_s', 'Throughput of each oradock phase.')]
+        lines=[]
+        for metric_name, phase_key, metric_help in metrics:
+            lines.append('# HELP %s %s' % (metric_name, metric_help))
+            lines.append('# TYPE %s gauge' % metric_name)
+            for phase_info in report.get('phases'):
+                if phase_info.get(phase_key) is None:
+                    continue
+                lines.append('%s{operation="%s",container="%s",database="%s",phase="%s"} %s' % (metric_name, report.get('operation'), report.get('container'), phase_info.get('database') or '', phase_info.get('phase'), phase_info.get(phase_key)))
+        lines.append('# HELP oradock_run_duration_seconds Duration of the whole oradock run.')
+        lines.append('# TYPE oradock_run_duration_seconds gauge')
+        lines.append('oradock_run_duration_seconds{operation="%s",container="%s"} %s' % (report.get('operation'), report.get('container'), report.get('elapsed_time')))
+        return '\n'.join(lines)+'\n'
+
+
+def write_file_atomically(file_path, content):
+    try:
+        with open(file_path+'.tmp', 'w') as file_tmp:
+            file_tmp.write(content)
+        os.replace(file_path+'.tmp', file_path)
+    except OSError as error:
+        logging.error('error writing file \'%s\'. %s' % (file_path, str(error)))
+
+
+def write_run_report(args):
+    report=args.get('report')
+    if report is None:
+        return
+    report.container_name=args['--container-name']
+    if args['--report-file'] is not None:
+        write_file_atomically(args['--report-file'], json.dumps(report.to_dict(), indent=2)+'\n')
+        logging.info('run report saved at \'%s\'' % args['--report-file'])
+    if args['--prometheus-file'] is not None:
+        write_file_atomically(args['--prometheus-file'], report.to_prometheus())
 
 
 ## all preprocess
 
 
+def resolve_container_name(args): #resolved before pre-flight checks, which run at the same time and only read args
+    if args['--container-name'].find('oradock-db-$DATABASE')==0:
+        args['--container-name']='oradock-db-'+args['DATABASE'].replace(',', '-')
+
+
 def preprocess_restore_args(args):
+    resolve_container_name(args)
     if args['--s3-bucket'] is None:
         args['--s3-bucket']='-'+',-'*args['DATABASE'].count(',')
     else:
@@ -228,16 +1005,36 @@ def preprocess_restore_args(args):
     
 
 def preprocess_restart_args(args):
+    resolve_container_name(args)
     args['--s3-bucket']='-'+',-'*args['DATABASE'].count(',')
     args['--backup-directory']='-'+',-'*args['DATABASE'].count(',')
     args['--datafile-dir']=args['--datafile-dir'].replace('/,',',').rstrip('/')
     args['--oradock-home']=args['--oradock-home'].rstrip('/')
 
 
+def preprocess_clone_args(args): #golden copy stays at --datafile-dir, and the container uses the clone directory as its datafile directory
+    preprocess_restart_args(args)
+    if args['--clone-dir'].find('$DATAFILE_DIR')==0:
+        args['--clone-dir']=args['--datafile-dir']+'/clones/'+args['--container-name']
+    args['clone_from']=args['--datafile-dir']
+    args['--datafile-dir']=args['--clone-dir'].rstrip('/')
+
+
+def preprocess_refresh_args(args): #memory and services were set when the databases were restored
+    preprocess_restore_args(args)
+    args['MEMORY']='-'+',-'*args['DATABASE'].count(',')
+    args['SERVICE_NAME']='-'+',-'*args['DATABASE'].count(',')
+    args['--container-name']=args['CONTAINER_NAME']
+
+
 def preprocess_create_image_args(args):
     args['--oradock-home']=args['--oradock-home'].rstrip('/')
+    if args['--oinstall-dir'].find('$ORADOCK_HOME')==0:
+        args['--oinstall-dir']=args['--oradock-home']+'/conf/dockerfile/config_files/database'
+    args['--oinstall-dir']=args['--oinstall-dir'].rstrip('/')
 
 def preprocess_create_database_args(args):
+    resolve_container_name(args)
     args['--s3-bucket']='-'+',-'*args['DATABASE'].count(',')
     args['--backup-directory']='-'+',-'*args['DATABASE'].count(',')
     args['--oradock-home']=args['--oradock-home'].rstrip('/')
@@ -253,35 +1050,22 @@ def check_args_count(arg1, arg2): #check 2 input options
         sys.exit(-1)
 
 
-def check_s3_bucket(s3_access_key, s3_secret_key, s3_bucket, database):
-    if (s3_access_key is None and not s3_secret_key is None):# or (not args['--s3-access-key'] is None and args['--s3-secret-key'] is None):
+def check_s3_bucket(s3_access_key, s3_secret_key, s3_bucket, database): #bucket and backup directory are checked when they are listed by the backup index
+    if (s3_access_key is None and not s3_secret_key is None):
         logging.error('please provide a valid s3 access and secret key')
         sys.exit(-1)
-    s3connection=create_s3conn(s3_access_key,s3_secret_key)
     if not s3_bucket is None:
-        for s3_bucket_list in s3_bucket.split(','): #check conn to s3 and if bucket exists
-            s3_bucket_name=s3_bucket_list.split('/')[2]
-            s3_full_path_dir='/'.join(s3_bucket_list.split('/')[s3_bucket_list.split('/').index(s3_bucket_name)+1:])
-            logging.debug('checking for bucket \'%s\'' % s3_bucket_name)
-            try:
-                s3_bucket_conn=s3connection.lookup(s3_bucket_name)
-            except boto.exception.S3PermissionsError as error:
-                logging.error('permission denied at bucket %s [%s]' % (s3_bucket_name, error.args[0]))
-                sys.exit(-1)
-            except boto.exception.S3ResponseError as error:
-                logging.error('unexpected response from s3 [%s]' % error.args[1])
-                sys.exit(-1)
-            except boto.exception.S3DataError as error:
-                logging.error('error while retrieving data from s3 [%s]' % error.args[0])
-                sys.exit(-1)
-
-            if s3_bucket_conn is None:
-                logging.error('s3 bucket \'%s\' does not exists. Please, review your bucket name and access/secret key' % s3_bucket_name)
+        for s3_bucket_list in s3_bucket.split(','):
+            if s3_bucket_list!='-' and (not s3_bucket_list.startswith('s3://') or len(s3_bucket_list.split('/')) < 3 or s3_bucket_list.split('/')[2]==''):
+                logging.error('s3 bucket \'%s\' must be written as s3://bucket/directory' % s3_bucket_list)
                 sys.exit(-1)
-            if len(list(s3_bucket_conn.list(s3_full_path_dir,'/')))==0:
-                logging.error('s3 backup directory \'%s\' does not exists' % s3_bucket_name)
         check_args_count(database, s3_bucket)
-    s3connection.close
+
+
+def check_positive_number(value, option_name):
+    if not value.isdigit() or int(value) < 1:
+        logging.error('option \'%s\' must be a positive number' % option_name)
+        sys.exit(-1)
 
 
 def check_file_or_directories_warn(file_or_dir, database):
@@ -309,37 +1093,50 @@ def check_file_or_directories_error(file_or_dir, database):
             sys.exit(-1)
 
 
-def check_memory(memory):
+def check_memory(*memory): #memory percent of all databases, among one or more containers
     total_percent_memory=0
-    for each_memory_percent in memory.split(','): #validating memory sum percent
-        total_percent_memory = total_percent_memory+int(each_memory_percent)
+    for memory_list in memory:
+        for each_memory_percent in memory_list.split(','): #validating memory sum percent
+            total_percent_memory = total_percent_memory+int(each_memory_percent)
     if total_percent_memory > 100 or total_percent_memory < 0:
         logging.error('memory exceeds server capacity')
         sys.exit(-1)
 
 
-def check_port(port):
+def check_memory_options(large_pages, numa_node):
+    if large_pages not in ('true', 'only', 'false'):
+        logging.error('option \'--large-pages\' must be true, only or false')
+        sys.exit(-1)
+    if numa_node is not None and numa_node!='auto' and not numa_node.isdigit():
+        logging.error('option \'--numa-node\' must be a node number or auto')
+        sys.exit(-1)
+
+
+def check_port_in_use(port):
     sock=socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     result=sock.connect_ex(('127.0.0.1',int(port)))
-    if int(port) < 1 or int(port) > 65535:
+    sock.close()
+    return result==0
+
+
+def check_port_number(port):
+    if not port.isdigit() or int(port) < 1 or int(port) > 65535:
         logging.error('port number exceeds the OS limit')
         sys.exit(-1)
-    elif result==0:
+
+
+def check_port(port):
+    if check_port_in_use(port):
         logging.error('port is already in use. Please change port number to a free socket')
         sys.exit(-1)
 
 
-def check_and_create_oinstall_dir(oradock_home, oinstall_dir):
-    oinstall_dir_default=oradock_home+'/conf/dockerfile/config_files/database'
-    if not os.path.exists(oinstall_dir_default):
-        if oinstall_dir.find('$ORADOCK_HOME')==0:
-            logging.error('directory with Oracle Install binary files does not exists [ %s ]' % oinstall_dir_default)
-            sys.exit(-1)
-        elif not os.path.exists(oinstall_dir):
-            logging.error('directory with Oracle Install binary files does not exists [ %s ]' % oinstall_dir)
-            sys.exit(-1)
-        logging.info('copying install directory at \'%s\' to \'%s\'' % (oinstall_dir, oinstall_dir_default))
-        copytree(oinstall_dir, oinstall_dir_default)
+def check_oinstall_dir(oradock_home, oinstall_dir): #install files are streamed from where they are, into the build context
+    if oinstall_dir.find('$ORADOCK_HOME')==0:
+        oinstall_dir=oradock_home.rstrip('/')+'/conf/dockerfile/config_files/database'
+    if not os.path.isdir(oinstall_dir):
+        logging.error('directory with Oracle Install binary files does not exists [ %s ]' % oinstall_dir)
+        sys.exit(-1)
 
 
 def check_dockerfile_template(dockerfile):
@@ -348,54 +1145,206 @@ def check_dockerfile_template(dockerfile):
         sys.exit(-1)
 
 
-def check_container(docker_client, args):
-    if args['--container-name'].find('oradock-db-$DATABASE')==0:
-        args['--container-name']='oradock-db-'+args['DATABASE'].replace(',', '-')
-    if len(docker_client.containers(all=True, filters={'name':args['--container-name']}))!=0:
-        logging.error('container \'%s\' already exists' % args['--container-name'])
+def check_container(docker_client, container_name):
+    if len(docker_client.containers(all=True, filters={'name':container_name}))!=0:
+        logging.error('container \'%s\' already exists' % container_name)
         sys.exit(-1)
 
 
 def check_image(image_name, docker_client):
-    if len(docker_client.images(name=image_name))!=0:
+    if find_image(docker_client, image_name):
         logging.error('image \'%s\' already exists' % image_name)
         sys.exit(-1)
 
 
-def check_restore_params(args, docker_client):
+def find_image(docker_client, image_name):
+    return len(docker_client.images(name=image_name))!=0
+
+
+def check_restore_params(args):
     check_s3_bucket(args['--s3-access-key'], args['--s3-secret-key'], args['--s3-bucket'], args['DATABASE'])
+    check_positive_number(args['--download-parallel'], '--download-parallel')
+    check_positive_number(args['--download-chunk-size'], '--download-chunk-size')
+    check_positive_number(args['--cache-size'], '--cache-size')
+    if args['--parallel']!='auto':
+        check_positive_number(args['--parallel'], '--parallel')
+    if not args['--monitor-interval'].isdigit():
+        logging.error('option \'--monitor-interval\' must be a number of seconds')
+        sys.exit(-1)
+    if args['--backup-sets'] not in ('all', 'needed'):
+        logging.error('option \'--backup-sets\' must be all or needed')
+        sys.exit(-1)
+    if args['--backup-sets']=='needed' and args['--pipeline']!=True: #needed pieces are read from the controlfile, restored while the other pieces are downloaded
+        logging.error('option \'--backup-sets=needed\' requires \'--pipeline\'')
+        sys.exit(-1)
+    if not args['--backup-index-ttl'].isdigit():
+        logging.error('option \'--backup-index-ttl\' must be a number of minutes')
+        sys.exit(-1)
+    parse_until_time(args['--until-time'])
+    if args['--open-mode'] not in ('read-write', 'read-only'):
+        logging.error('option \'--open-mode\' must be read-write or read-only')
+        sys.exit(-1)
     check_args_count(args['DATABASE'], args['MEMORY'])
     check_args_count(args['DATABASE'], args['SERVICE_NAME'])
     check_args_count(args['DATABASE'], args['--backup-directory'])
     check_file_or_directories_warn(args['--backup-directory'], args['DATABASE'])
     check_file_or_directories_error(args['--oradock-home'], args['DATABASE'])
     check_memory(args['MEMORY'])
-    check_port(args['--port'])
-    check_container(docker_client, args)
+    check_memory_options(args['--large-pages'], args['--numa-node'])
+    check_positive_number(args['--database-parallel'], '--database-parallel')
+    check_port_number(args['--port'])
 
 
-def check_restart_params(args, docker_client):
+def check_refresh_params(args):
+    check_s3_bucket(args['--s3-access-key'], args['--s3-secret-key'], args['--s3-bucket'], args['DATABASE'])
+    check_positive_number(args['--download-parallel'], '--download-parallel')
+    check_positive_number(args['--download-chunk-size'], '--download-chunk-size')
+    check_positive_number(args['--cache-size'], '--cache-size')
+    check_positive_number(args['--parallel'], '--parallel') #channels are not planned from memory, which is kept from the restore
+    if not args['--monitor-interval'].isdigit():
+        logging.error('option \'--monitor-interval\' must be a number of seconds')
+        sys.exit(-1)
+    if not args['--backup-index-ttl'].isdigit():
+        logging.error('option \'--backup-index-ttl\' must be a number of minutes')
+        sys.exit(-1)
+    check_args_count(args['DATABASE'], args['--backup-directory'])
+    check_file_or_directories_error(args['--oradock-home'], args['DATABASE'])
+    check_positive_number(args['--database-parallel'], '--database-parallel')
+
+
+def check_restart_params(args):
     check_args_count(args['DATABASE'], args['MEMORY'])
     check_args_count(args['DATABASE'], args['SERVICE_NAME'])
     check_file_or_directories_error(args['--oradock-home'], args['DATABASE'])
     check_memory(args['MEMORY'])
-    check_port(args['--port'])
-    check_container(docker_client, args)
+    check_memory_options(args['--large-pages'], args['--numa-node'])
+    check_positive_number(args['--database-parallel'], '--database-parallel')
+    check_port_number(args['--port'])
+
+
+def check_clone_params(args):
+    check_restart_params(args)
+    if args['--clone-method'] not in ('auto', 'reflink', 'overlay', 'copy'):
+        logging.error('option \'--clone-method\' must be auto, reflink, overlay or copy')
+        sys.exit(-1)
+    for database in args['DATABASE'].split(','):
+        golden_dir=args['--datafile-dir'].rstrip('/')+'/'+database
+        if not os.path.isdir(golden_dir+'/spfile') or not os.path.isdir(golden_dir+'/datafile'):
+            logging.error('there is no restored database at \'%s\' to clone' % golden_dir)
+            sys.exit(-1)
+
+
+def check_golden_copy(docker_client, golden_dir, database_list): #golden copy must not be changed by a running database while it is cloned
+    golden_database_dirs=[golden_dir+'/'+database for database in database_list]
+    for container in docker_client.containers():
+        for container_mount in container.get('Mounts', []):
+            mount_source=container_mount.get('Source', '').rstrip('/')
+            for golden_database_dir in golden_database_dirs:
+                if mount_source==golden_database_dir or golden_database_dir.startswith(mount_source+'/') or mount_source.startswith(golden_database_dir+'/'):
+                    logging.error('golden copy \'%s\' is in use by running container \'%s\'. Please stop it before cloning' % (golden_database_dir, ','.join(container.get('Names', [])).lstrip('/')))
+                    sys.exit(-1)
 
 
 def check_create_image_params(args, docker_client):
-    check_and_create_oinstall_dir(args['--oradock-home'], args['--oinstall-dir'])
+    check_oinstall_dir(args['--oradock-home'], args['--oinstall-dir'])
     check_dockerfile_template(args['--dockerfile-template'])
     check_image(args['IMAGE_NAME'], docker_client)
 
 
-def check_create_database_params(args, docker_client):
+def check_create_database_params(args):
     check_args_count(args['DATABASE'], args['MEMORY'])
     check_args_count(args['DATABASE'], args['SERVICE_NAME'])
     check_file_or_directories_error(args['--oradock-home'], args['DATABASE'])
     check_memory(args['MEMORY'])
-    check_port(args['--port'])
-    check_container(docker_client, args)
+    check_memory_options(args['--large-pages'], args['--numa-node'])
+    check_positive_number(args['--database-parallel'], '--database-parallel')
+    check_port_number(args['--port'])
+
+
+def check_fleet_params(fleet_args_list):
+    if len(fleet_args_list)==0:
+        logging.error('fleet manifest has no containers')
+        sys.exit(-1)
+    container_names=[fleet_args['--container-name'] for fleet_args in fleet_args_list]
+    if len(set(container_names))!=len(container_names):
+        logging.error('container names must be unique in fleet manifest')
+        sys.exit(-1)
+    ports=[fleet_args['--port'] for fleet_args in fleet_args_list]
+    if len(set(ports))!=len(ports):
+        logging.error('ports must be unique in fleet manifest')
+        sys.exit(-1)
+    check_memory(*[fleet_args['MEMORY'] for fleet_args in fleet_args_list]) #all containers share the host memory
+    for fleet_args in fleet_args_list:
+        check_memory_options(fleet_args['--large-pages'], fleet_args['--numa-node'])
+
+
+## pre-flight functions
+
+
+def get_filesystem_path(path): #nearest existing directory, for paths created later
+    path=os.path.abspath(path)
+    while not os.path.exists(path):
+        path=os.path.dirname(path)
+    return path
+
+
+def check_disk_space(args, database_list): #backup pieces left to download and datafiles restored from them must fit in their filesystems
+    required_space=collections.OrderedDict()
+    def require_space(path, required_bytes):
+        filesystem_path=get_filesystem_path(path)
+        filesystem=os.stat(filesystem_path).st_dev
+        if filesystem not in required_space:
+            required_space[filesystem]={'path':filesystem_path, 'bytes':0, 'usage':[]}
+        required_space[filesystem]['bytes']+=required_bytes
+        required_space[filesystem]['usage'].append(path)
+
+    for database, info in database_list.items():
+        backup_pieces=info.get('backup_pieces', {})
+        if info.get('s3_bucket')!='-': #pieces kept by previous runs are not downloaded again
+            download_bytes=0
+            for piece_name, piece_size in backup_pieces.items():
+                piece_path=info.get('backup_directory')+'/'+piece_name
+                if not os.path.exists(piece_path) or os.path.getsize(piece_path)!=piece_size:
+                    download_bytes+=piece_size
+            require_space(args['--cache-dir'] if args['--cache-dir'] is not None else info.get('backup_directory'), download_bytes)
+        if args.get('refresh')!=True: #a refresh recovers datafiles already in place
+            require_space(args['--datafile-dir']+'/'+database, sum(backup_pieces.values())) #datafiles are at least as big as their backup pieces
+
+    for filesystem, filesystem_space in required_space.items():
+        filesystem_stat=os.statvfs(filesystem_space.get('path'))
+        free_bytes=filesystem_stat.f_bavail*filesystem_stat.f_frsize
+        logging.debug('filesystem of \'%s\' needs %s mb and has %s mb free' % (filesystem_space.get('path'), str(round(filesystem_space.get('bytes')/(1024*1024),2)), str(round(free_bytes/(1024*1024),2))))
+        if filesystem_space.get('bytes') > free_bytes:
+            logging.error('filesystem of %s needs %s mb, but has only %s mb free' % (', '.join(filesystem_space.get('usage')), str(round(filesystem_space.get('bytes')/(1024*1024),2)), str(round(free_bytes/(1024*1024),2))))
+            sys.exit(-1)
+
+
+def check_backup_files(args, database_list, s3connection): #returns the backup selection of each database, set into the database settings after all checks
+    with args['report'].measure('index_backup_files'):
+        backup_selections=index_backup_files(args, database_list, s3connection)
+    selected_database_list=dict((database, dict(info)) for database, info in database_list.items())
+    set_backup_selection(selected_database_list, backup_selections)
+    check_disk_space(args, selected_database_list)
+    return backup_selections
+
+
+def create_preflight_checks(args, database_list, docker_client): #checks shared by restore, restart and create database
+    return {'container':(check_container, (docker_client, args['--container-name'])),
+            'port':(check_port, (args['--port'],)),
+            'image_found':(find_image, (docker_client, args['--image-name'])),
+            'memory_plan':(plan_memory, (args, database_list))}
+
+
+def run_preflight_checks(preflight_checks): #runs all checks at the same time, stopping at the first one that fails, and returns their results
+    executor=ThreadPoolExecutor(max_workers=len(preflight_checks))
+    try:
+        check_list=dict((executor.submit(check_function, *check_args), check_name) for check_name, (check_function, check_args) in preflight_checks.items())
+        (done_checks, pending_checks)=wait(check_list.keys(), return_when=FIRST_EXCEPTION)
+        for check in done_checks: #errors are logged by the check itself
+            check.result()
+        return dict((check_name, check.result()) for check, check_name in check_list.items())
+    finally: #checks do not change any settings, so the ones still running are left behind when one fails
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 ## auxiliary function
@@ -419,6 +1368,207 @@ def create_database_settings(args): #create a dict with database infos
     return database
 
 
+def create_fleet_settings(args): #create a list of arguments, one for each container in the manifest
+    fleet_arguments={'database':'DATABASE', 'memory':'MEMORY', 'service_name':'SERVICE_NAME', 'password':'PASSWORD'}
+    try:
+        with open(args['MANIFEST'], 'r') as manifest_file:
+            manifest=json.load(manifest_file)
+    except (OSError, ValueError) as error:
+        logging.error('could not read fleet manifest \'%s\' [%s]' % (args['MANIFEST'], str(error)))
+        sys.exit(-1)
+    if isinstance(manifest, dict):
+        manifest=manifest.get('containers', [])
+
+    fleet_args_list=[]
+    for container in manifest:
+        fleet_args=copy.deepcopy(args)
+        fleet_args['fleet']=False
+        fleet_args['--animation']='0' #animations from many containers would mix up
+        operation=container.get('operation', 'restore')
+        if operation not in ('restore', 'restart', 'clone', 'create'):
+            logging.error('invalid operation \'%s\' in fleet manifest' % operation)
+            sys.exit(-1)
+        fleet_args[operation]=True
+        fleet_args['database']=(operation=='create')
+
+        for key, value in container.items():
+            if key=='operation':
+                continue
+            option=fleet_arguments.get(key, '--'+key.replace('_','-'))
+            if option not in args or option in ('--fleet-parallel', '--log-level'):
+                logging.error('invalid key \'%s\' in fleet manifest' % key)
+                sys.exit(-1)
+            if isinstance(value, list):
+                value=','.join(str(each_value) for each_value in value)
+            fleet_args[option]=value if isinstance(value, bool) else str(value)
+
+        for required_option in ['DATABASE', 'MEMORY', 'SERVICE_NAME'] + (['PASSWORD'] if operation=='create' else []):
+            if fleet_args[required_option] is None:
+                logging.error('missing key \'%s\' in fleet manifest' % required_option.lower())
+                sys.exit(-1)
+        resolve_container_name(fleet_args)
+        for report_option in ['--report-file', '--prometheus-file', '--progress-file']: #one report per container when the manifest shares the same file
+            if fleet_args[report_option] is not None and report_option[2:].replace('-','_') not in container:
+                (report_path, report_extension)=os.path.splitext(fleet_args[report_option])
+                fleet_args[report_option]=report_path+'-'+fleet_args['--container-name']+report_extension
+        fleet_args['--port']=str(container['port']) if 'port' in container else None
+        fleet_args_list.append(fleet_args)
+
+    allocate_fleet_ports(fleet_args_list, int(args['--port']))
+    return fleet_args_list
+
+
+def allocate_fleet_ports(fleet_args_list, first_port): #containers without a port get the next free one
+    used_ports=set(int(fleet_args['--port']) for fleet_args in fleet_args_list if fleet_args['--port'] is not None)
+    port=first_port
+    for fleet_args in fleet_args_list:
+        if fleet_args['--port'] is not None:
+            continue
+        while port in used_ports or check_port_in_use(port):
+            port=port+1
+        fleet_args['--port']=str(port)
+        used_ports.add(port)
+        logging.debug('port %s allocated to container \'%s\'' % (port, fleet_args['--container-name']))
+
+
+def get_host_memory_mb():
+    return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')//(1024*1024)
+
+
+def read_meminfo(meminfo_file='/proc/meminfo'): #values in kb, or number of pages for HugePages_*
+    meminfo={}
+    with open(meminfo_file, 'r') as meminfo_lines:
+        for line in meminfo_lines:
+            meminfo_line=re.match(r'^(?:Node \d+ )?([\w()]+):\s+(\d+)', line)
+            if meminfo_line is not None:
+                meminfo[meminfo_line.group(1)]=int(meminfo_line.group(2))
+    return meminfo
+
+
+def read_numa_nodes(): #cpus and free memory of each numa node of the host
+    numa_nodes={}
+    node_dir='/sys/devices/system/node'
+    if not os.path.isdir(node_dir):
+        return numa_nodes
+    for node_name in os.listdir(node_dir):
+        if re.match(r'^node\d+$', node_name) is None:
+            continue
+        with open(node_dir+'/'+node_name+'/cpulist', 'r') as cpulist:
+            node_cpus=cpulist.read().strip()
+        node_meminfo=read_meminfo(node_dir+'/'+node_name+'/meminfo')
+        numa_nodes[node_name[4:]]={'cpus':node_cpus, 'free_mb':node_meminfo.get('MemFree', 0)//1024}
+    return numa_nodes
+
+
+def plan_database_memory(host_memory_mb, hugepage_mb, memory_percent, large_pages):
+    database_memory_mb=host_memory_mb*int(memory_percent)/100
+    sga_mb=int(database_memory_mb*0.6)
+    if large_pages!='false': #whole HugePages, so none is left half used
+        sga_mb=sga_mb//hugepage_mb*hugepage_mb
+    pga_mb=int(database_memory_mb*0.4)
+    return {'sga_mb':sga_mb, 'pga_mb':pga_mb, 'processes':max(150, min(2000, pga_mb//4)), 'use_large_pages':large_pages.upper()} #about 4 mb of pga for each process
+
+
+def check_fleet_memory(fleet_args_list): #containers of a fleet plan their memory at the same time from the same free memory, so their SGA must fit in the host together
+    meminfo=read_meminfo()
+    host_memory_mb=meminfo.get('MemTotal')//1024
+    hugepage_mb=meminfo.get('Hugepagesize', 2048)//1024
+    hugepages_required={'true':0, 'only':0}
+    sga_mb=0 #sga on normal pages
+    for fleet_args in fleet_args_list:
+        for memory_percent in fleet_args['MEMORY'].split(','):
+            database_plan=plan_database_memory(host_memory_mb, hugepage_mb, memory_percent, fleet_args['--large-pages'])
+            if fleet_args['--large-pages']!='false':
+                hugepages_required[fleet_args['--large-pages']]+=database_plan['sga_mb']//hugepage_mb
+            else:
+                sga_mb+=database_plan['sga_mb']
+
+    hugepages_available=meminfo.get('HugePages_Free', 0)-meminfo.get('HugePages_Rsvd', 0)
+    if hugepages_required['only'] > hugepages_available:
+        logging.error('fleet databases with large pages only need %s HugePages of %s mb for their SGA, but only %s are free. Please set vm.nr_hugepages on host' % (hugepages_required['only'], hugepage_mb, hugepages_available))
+        sys.exit(-1)
+    if hugepages_required['only']+hugepages_required['true'] > hugepages_available: #containers that get no HugePages use normal pages
+        logging.warn('fleet databases need %s HugePages of %s mb for their SGA, but only %s are free. Some SGA will use normal pages' % (hugepages_required['only']+hugepages_required['true'], hugepage_mb, hugepages_available))
+        sga_mb+=(hugepages_required['only']+hugepages_required['true']-hugepages_available)*hugepage_mb
+
+    available_mb=meminfo.get('MemAvailable', meminfo.get('MemFree'))//1024
+    if sga_mb > available_mb:
+        logging.error('fleet databases need %s mb of SGA, but only %s mb are available on host' % (sga_mb, available_mb))
+        sys.exit(-1)
+
+
+def plan_memory(args, database_list): #sga, pga and processes of each database, checked against host memory and HugePages
+    meminfo=read_meminfo()
+    host_memory_mb=meminfo.get('MemTotal')//1024
+    hugepage_mb=meminfo.get('Hugepagesize', 2048)//1024
+    memory_plan={'databases':collections.OrderedDict(), 'large_pages':args['--large-pages'], 'hugepage_mb':hugepage_mb}
+
+    for database, info in database_list.items():
+        memory_plan['databases'][database]=plan_database_memory(host_memory_mb, hugepage_mb, info.get('memory'), args['--large-pages'])
+
+    total_sga_mb=sum(database_plan['sga_mb'] for database_plan in memory_plan['databases'].values())
+    total_pga_mb=sum(database_plan['pga_mb'] for database_plan in memory_plan['databases'].values())
+    memory_plan['hugepages_required']=total_sga_mb//hugepage_mb if args['--large-pages']!='false' else 0
+    memory_plan['hugepages_available']=meminfo.get('HugePages_Free', 0)-meminfo.get('HugePages_Rsvd', 0)
+    sga_hugepages_mb=0
+    if memory_plan['hugepages_required']>memory_plan['hugepages_available']:
+        if args['--large-pages']=='only':
+            logging.error('databases need %s HugePages of %s mb for their SGA, but only %s are free. Please set vm.nr_hugepages on host' % (memory_plan['hugepages_required'], hugepage_mb, memory_plan['hugepages_available']))
+            sys.exit(-1)
+        logging.warn('databases need %s HugePages of %s mb for their SGA, but only %s are free. SGA will use normal pages' % (memory_plan['hugepages_required'], hugepage_mb, memory_plan['hugepages_available']))
+    elif args['--large-pages']!='false':
+        sga_hugepages_mb=total_sga_mb
+
+    available_mb=meminfo.get('MemAvailable', meminfo.get('MemFree'))//1024
+    if total_sga_mb-sga_hugepages_mb > available_mb: #sga is allocated at startup, pga grows on demand
+        logging.error('databases need %s mb of SGA, but only %s mb are available on host' % (total_sga_mb-sga_hugepages_mb, available_mb))
+        sys.exit(-1)
+    elif total_sga_mb-sga_hugepages_mb+total_pga_mb > available_mb:
+        logging.warn('SGA and PGA of all databases (%s mb) exceed the %s mb available on host' % (total_sga_mb-sga_hugepages_mb+total_pga_mb, available_mb))
+
+    if args['--numa-node'] is not None:
+        numa_nodes=read_numa_nodes()
+        numa_node=args['--numa-node']
+        if numa_node=='auto' and len(numa_nodes)>0:
+            numa_node=max(numa_nodes, key=lambda node: numa_nodes[node]['free_mb'])
+        if numa_node not in numa_nodes:
+            logging.error('numa node \'%s\' does not exist on host' % args['--numa-node'])
+            sys.exit(-1)
+        if numa_nodes[numa_node]['free_mb'] < total_sga_mb-sga_hugepages_mb+total_pga_mb:
+            logging.warn('numa node %s has only %s mb free for %s mb of SGA and PGA' % (numa_node, numa_nodes[numa_node]['free_mb'], total_sga_mb-sga_hugepages_mb+total_pga_mb))
+        memory_plan['numa_node']={'node':numa_node, 'cpus':numa_nodes[numa_node]['cpus']}
+
+    for database, database_plan in memory_plan['databases'].items():
+        logging.info('database %s memory: sga %s mb, pga %s mb, %s processes, use_large_pages=%s' % (database, database_plan['sga_mb'], database_plan['pga_mb'], database_plan['processes'], database_plan['use_large_pages']))
+    return memory_plan
+
+
+def plan_rman_channels(args, database_list): #number of rman channels of each database when --parallel is auto
+    cpu_count=os.cpu_count() or 1
+    concurrent_databases=min(int(args['--database-parallel']), len(database_list))
+    host_memory_mb=get_host_memory_mb()
+    channel_plan={}
+
+    for database, info in database_list.items():
+        priority_names=[info.get('backup_index').get('spfile'), info.get('backup_index').get('controlfile')]
+        piece_sizes=[size for name, size in info.get('backup_pieces').items() if name not in priority_names]
+
+        cpu_channels=max(1, cpu_count//concurrent_databases)
+        memory_channels=max(1, int(host_memory_mb*int(info.get('memory'))/100*0.4)//64) #each channel takes about 64 mb of pga for restore buffers
+        piece_channels=1
+        if len(piece_sizes)>0 and max(piece_sizes)>0: #channels beyond the biggest piece share of the backup do not finish any sooner
+            piece_channels=max(1, min(len(piece_sizes), -(-sum(piece_sizes)//max(piece_sizes))))
+        info['channels']=min(cpu_channels, memory_channels, piece_channels)
+        channel_plan[database]={'channels':info['channels'],
+                                'cpu_channels':cpu_channels,
+                                'memory_channels':memory_channels,
+                                'piece_channels':piece_channels,
+                                'backup_pieces':len(piece_sizes),
+                                'backup_mb':round(sum(piece_sizes)/(1024*1024), 1)}
+        logging.info('restoring database %s with %s rman channels (cpu limit %s, memory limit %s, backup pieces limit %s)' % (database, info['channels'], cpu_channels, memory_channels, piece_channels))
+    return channel_plan
+
+
 def create_directory(directory): #create directory to save s3 files
     if not os.path.exists(directory):
         try:
@@ -435,24 +1585,64 @@ def create_directory(directory): #create directory to save s3 files
                 sys.exit(-1)
 
 
-def change_directory_owner(directory, uid, gid):
-    if os.path.exists(directory):
-        msg_flag=0
-
-        for root, directories, files in os.walk(directory):
+def change_owner_entries(directory_fd, directory, uid, gid): #changes owner of one directory entries, returning its subdirectories opened as file descriptors. The directory descriptor is closed
+    counts={'entries':0, 'changed':0, 'errors':[]}
+    subdirectories=[]
+    try:
+        for entry in os.scandir(directory_fd): #listed by descriptor, so a directory moved or swapped while it is changed can not mix entries of another path
+            counts['entries']+=1
+            entry_path=directory+'/'+entry.name
             try:
-                os.chown(root, uid, gid)
-                for each_directory in directories:
-                    os.chown(root +'/'+ each_directory, uid, gid)
-                for each_files in files:
-                    os.chown(root + '/'+ each_files, uid, gid)
+                entry_stat=os.stat(entry.name, dir_fd=directory_fd, follow_symlinks=False)
+                if entry_stat.st_uid!=uid or entry_stat.st_gid!=gid:
+                    os.chown(entry.name, uid, gid, dir_fd=directory_fd, follow_symlinks=False)
+                    counts['changed']+=1
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    subdirectories.append((os.open(entry.name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=directory_fd), entry_path))
             except OSError as error:
-                if msg_flag==0:
-                    if error.errno == errno.EPERM:
-                        logging.warn('could not change permissions on directory \'%s\'. Permission denied' % directory)
-                    else:
-                        logging.warn('could not change permissions on directory\'%s\'. %s' % (directory, str(error)))
-                    msg_flag=1
+                counts['errors'].append((entry_path, error))
+    except OSError as error:
+        counts['errors'].append((directory, error))
+    finally:
+        os.close(directory_fd)
+    return subdirectories, counts
+
+
+def change_directory_owner(directory, uid, gid, parallel=16):
+    if not os.path.exists(directory):
+        return
+    start_time=time.time()
+    total_counts={'entries':1, 'changed':0, 'errors':[]}
+    try:
+        directory_stat=os.stat(directory, follow_symlinks=False)
+        if directory_stat.st_uid!=uid or directory_stat.st_gid!=gid:
+            os.chown(directory, uid, gid, follow_symlinks=False)
+            total_counts['changed']+=1
+        directory_fd=os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError as error:
+        total_counts['errors'].append((directory, error))
+        directory_fd=None
+
+    if directory_fd is not None:
+        with ThreadPoolExecutor(max_workers=parallel) as executor: #each subdirectory is a new task, so big trees are shared among all workers
+            pending=set([executor.submit(change_owner_entries, directory_fd, directory, uid, gid)])
+            while len(pending)>0:
+                (done, pending)=wait(pending, return_when=FIRST_COMPLETED)
+                for execution in done:
+                    (subdirectories, counts)=execution.result()
+                    total_counts['entries']+=counts['entries']
+                    total_counts['changed']+=counts['changed']
+                    total_counts['errors']+=counts['errors']
+                    pending.update(executor.submit(change_owner_entries, subdirectory_fd, subdirectory, uid, gid) for subdirectory_fd, subdirectory in subdirectories)
+
+    for error_path, error in total_counts['errors'][:10]:
+        if error.errno == errno.EPERM:
+            logging.warn('could not change permissions on \'%s\'. Permission denied' % error_path)
+        else:
+            logging.warn('could not change permissions on \'%s\'. %s' % (error_path, str(error)))
+    if len(total_counts['errors'])>10:
+        logging.warn('could not change permissions on %s more entries of directory \'%s\'' % (len(total_counts['errors'])-10, directory))
+    logging.info('changed owner of %s of %s entries in directory \'%s\' in %s seconds (%s errors)' % (total_counts['changed'], total_counts['entries'], directory, str(round(time.time()-start_time, 2)), len(total_counts['errors'])))
 
 
 def set_docker_volumes(database_list, datafile_dir, oradock_home): #configure all volumes required to start the container
@@ -479,58 +1669,424 @@ def set_docker_volumes(database_list, datafile_dir, oradock_home): #configure al
     return container_volumes, container_volumes_config
 
 
-def prepare_dockerfile(dockerfile_name, str_source, str_dest):
+def render_template(template_name, template_variables, output_name): #replaces each ${variable} of template_variables in a single pass, others are kept
     try:
-        dockerfile_template=open(dockerfile_name, 'r').read()
-        dockerfile=open(dockerfile_name+'.new','w')
-        sed_process=re.compile(str_source, re.MULTILINE)
-        dockerfile.write(sed_process.sub(str_dest, dockerfile_template))
-        dockerfile.close()
-        copyfile(dockerfile_name+'.new', dockerfile_name)
-        os.remove(dockerfile_name+'.new')
+        with open(template_name, 'r') as template_file:
+            template=template_file.read()
+        rendered_template=re.sub(r'\$\{(\w+)\}', lambda variable: str(template_variables.get(variable.group(1), variable.group(0))), template)
+        with open(output_name+'.new', 'w') as output_file:
+            output_file.write(rendered_template)
+        os.replace(output_name+'.new', output_name)
     except OSError as error:
         if error.errno == errno.ENOENT :
-            logging.error('error to create dockerfile \'%s\'. No such file or directory' % dockerfile_name)
+            logging.error('error to render template \'%s\' into \'%s\'. No such file or directory' % (template_name, output_name))
             sys.exit(-1)
         elif error.errno == errno.EACCES:
-            logging.error('error to create dockerfile \'%s\'. Permission denied' % dockerfile_name)
+            logging.error('error to render template \'%s\' into \'%s\'. Permission denied' % (template_name, output_name))
             sys.exit(-1)
         else:
-            logging.error('error to create directory \'%s\'. %s' % (dockerfile_name, str(error)))
+            logging.error('error to render template \'%s\' into \'%s\'. %s' % (template_name, output_name, str(error)))
             sys.exit(-1)
 
 
-def call_process_build(function_name, arguments, animation):
-    docker_build_log=Manager().list()
+def create_memory_parameters(database_plan): #from the memory plan of the database
+    memory_parameters=collections.OrderedDict()
+    memory_parameters['sga_max_size']='%sM' % database_plan['sga_mb']
+    memory_parameters['sga_target']='%sM' % database_plan['sga_mb']
+    memory_parameters['pga_aggregate_target']='%sM' % database_plan['pga_mb']
+    memory_parameters['processes']=str(database_plan['processes'])
+    memory_parameters['use_large_pages']=database_plan['use_large_pages']
+    return memory_parameters
+
+
+def create_file_parameters(database, datafile_dir): #files of each database under its own datafile directory
+    database_dir=datafile_dir+'/'+database
+    file_parameters=collections.OrderedDict()
+    file_parameters['control_files']='\'%s/controlfile/control01.ctl\',\'%s/controlfile/control02.ctl\'' % (database_dir, database_dir)
+    file_parameters['db_create_file_dest']='\'%s/datafile\'' % database_dir
+    for log_dest in range(1, 6):
+        file_parameters['db_create_online_log_dest_%s' % log_dest]='\'%s/redolog\'' % database_dir
+    file_parameters['db_recovery_file_dest']='\'%s/fast_recovery_area\'' % database_dir
+    file_parameters['db_recovery_file_dest_size']='50G'
+    return file_parameters
+
+
+def format_pfile(parameters, scope='*.'):
+    return ''.join('%s%s=%s\n' % (scope, parameter, value) for parameter, value in parameters.items())
+
+
+def write_pfile_rules(config_dir, database, parameters, comment_parameters): #the database script comments out these parameters from the old pfile and adds the new ones
+    comment_rules=list(comment_parameters)+[parameter for parameter in parameters if parameter not in comment_parameters]
+    write_file_atomically(config_dir+'/pfile_'+database+'.comment', ''.join(rule+'\n' for rule in comment_rules))
+    write_file_atomically(config_dir+'/pfile_'+database+'.ora', format_pfile(parameters))
+
+
+def prepare_container_config(args, database_list): #config files rendered by oradock and read by database scripts inside the container
+    config_dir=args['--oradock-home']+'/consume/'+args['--container-name']
+    create_directory(config_dir)
+    render_template(args['--oradock-home']+'/conf/listener/listener_template.ora', {'hostname':os.uname()[1]}, config_dir+'/listener.ora')
+    restore_comment_parameters=['db_file_name_convert', 'log_file_name_convert', 'db_create_online_log_dest_[0-9]+', 'local_listener',
+                                'memory_max_target', 'memory_target', 'use_large_pages', 'log_archive_config', 'log_archive_dest_[0-9]+']
+
+    for database, info in database_list.items():
+        memory_parameters=create_memory_parameters(info.get('memory_plan'))
+        if args['restore']==True:
+            parameters=create_file_parameters(database, args['--datafile-dir'])
+            parameters.update(memory_parameters)
+            write_pfile_rules(config_dir, database, parameters, restore_comment_parameters)
+            write_file_atomically(config_dir+'/backup_'+database+'.files', 'spfile=%s/%s\ncontrolfile=%s/%s\n' % (info.get('backup_directory'), info.get('backup_index').get('spfile'), info.get('backup_directory'), info.get('backup_index').get('controlfile')))
+        elif args['restart']==True and args.get('clone_from') is not None: #files of a clone move from the golden copy to its own directory
+            parameters=create_file_parameters(database, args['--datafile-dir'])
+            parameters.update(memory_parameters)
+            write_pfile_rules(config_dir, database, parameters, list(parameters.keys()))
+        elif args['restart']==True: #the default pfile is used when there is no spfile to restart from
+            write_pfile_rules(config_dir, database, memory_parameters, [])
+            default_parameters=collections.OrderedDict([('db_name', '\'%s\'' % database)])
+            default_parameters.update(create_file_parameters(database, args['--datafile-dir']))
+            default_parameters.update(memory_parameters)
+            write_file_atomically(config_dir+'/pfile_'+database+'_default.ora', format_pfile(default_parameters))
+        elif args['create']==True:
+            render_template(args['--oradock-home']+'/conf/dockerfile/config_files/pfile_template.ora', {'database':database, 'data_dir':args['--datafile-dir']}, config_dir+'/pfile_'+database+'.ora')
+            with open(config_dir+'/pfile_'+database+'.ora', 'a') as pfile:
+                pfile.write(format_pfile(memory_parameters, scope=''))
+    return config_dir
+
+
+ProgressEvent=collections.namedtuple('ProgressEvent', ['kind', 'message', 'current', 'total'])
+
+log_buffer_lines=1000 #last output lines of a docker operation kept in memory
+log_file_max_mb=16 #size of each database log file before it is rotated
+log_file_backups=4 #rotated log files kept of each database
+
+class ExecutionLog(object): #last output lines and progress events shared between a docker operation thread and the terminal
+    def __init__(self):
+        self.log=collections.deque(maxlen=log_buffer_lines)
+        self.last_event=None
+
+    def append(self, log_line):
+        self.log.append(log_line)
+
+    def emit(self, kind, message, current=None, total=None):
+        self.last_event=ProgressEvent(kind, message, current, total)
+
+    def describe_last_event(self):
+        event=self.last_event
+        if event is None:
+            return ''
+        if event.kind=='pull' and event.total:
+            return '%s: %s of %s mb' % (event.message, str(round(event.current/(1024*1024),1)), str(round(event.total/(1024*1024),1)))
+        if event.kind=='build' and event.total:
+            return '%s: step %s of %s' % (event.message, event.current, event.total)
+        if event.kind=='progress' and event.total:
+            return '%s: %s%% %s' % (event.message.split(' ')[0], str(round(event.current*100/event.total,1)), ' '.join(event.message.split(' ')[1:]))
+        return event.message[:60]
+
+
+class StreamLineReader(object): #decodes a docker output stream into lines as it arrives, keeping only the unfinished line
+    def __init__(self, max_line_size=64*1024):
+        self.decoder=codecs.getincrementaldecoder('utf-8')('replace')
+        self.buffer=''
+        self.max_line_size=max_line_size
+
+    def feed(self, data):
+        self.buffer+=self.decoder.decode(data)
+        lines=self.buffer.split('\n')
+        self.buffer=lines.pop()
+        if len(self.buffer) > self.max_line_size: #line without end of line is split, so it does not grow without limit
+            lines.append(self.buffer)
+            self.buffer=''
+        return [line.rstrip('\r') for line in lines]
+
+    def close(self):
+        self.buffer+=self.decoder.decode(b'', True)
+        lines=[self.buffer.rstrip('\r')] if self.buffer!='' else []
+        self.buffer=''
+        return lines
+
+
+def open_database_log(log_file): #rotating log file on the host, with the whole output of a database script
+    database_log=logging.getLogger('oradock.'+log_file)
+    database_log.propagate=False
+    database_log.setLevel(logging.INFO)
+    try:
+        log_handler=logging.handlers.RotatingFileHandler(log_file, maxBytes=log_file_max_mb*1024*1024, backupCount=log_file_backups)
+    except OSError as error:
+        logging.warn('could not open log file \'%s\'. %s' % (log_file, str(error)))
+        return None
+    log_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    database_log.addHandler(log_handler)
+    return database_log
+
+
+def close_database_log(database_log):
+    if database_log is None:
+        return
+    for log_handler in list(database_log.handlers):
+        database_log.removeHandler(log_handler)
+        log_handler.close()
+
+
+def call_thread_build(function_name, arguments, animation): #runs a docker operation in a thread, showing its progress
+    docker_build_log=ExecutionLog()
     arguments+=(docker_build_log,)
+    thread_error=[]
+    thread_result=[]
 
-    process=Process(name=function_name, target=function_name, args=arguments)
-    process.start()
-    animation = '-\\|/'
+    def run_function():
+        try:
+            thread_result.append(function_name(*arguments))
+        except BaseException as error: #raised again at the caller thread, including sys.exit
+            thread_error.append(error)
+
+    thread=threading.Thread(name=function_name.__name__, target=run_function)
+    thread.daemon=True
+    thread.start()
+    spinner = '-\\|/'
     idx=0
 
     man_animation=['(>\'.\')>', '<(\'.\'<)']
     if(animation=='2'):
         man_animation=['\\o/', '|o|', '\\o/', '|o|']
 
-    if (logging.getLogger().getEffectiveLevel()!=logging.DEBUG):
-        while process.exitcode is None:
-            print('\r' + animation[idx % len(animation)] + ' Executing... ' + man_animation[idx % len(man_animation)] + '', end='')
+    if (logging.getLogger().getEffectiveLevel()!=logging.DEBUG and animation!='0'):
+        while thread.is_alive():
+            progress_line='\r' + spinner[idx % len(spinner)] + ' Executing... ' + man_animation[idx % len(man_animation)] + ' ' + docker_build_log.describe_last_event()
+            print(progress_line.ljust(100), end='')
             idx = idx + 1
-            time.sleep(0.2)
+            thread.join(0.2)
+        print('\r'+' '*100, end='')
     else:
-        process.join()
+        thread.join()
     print('\r', end='')
-    return docker_build_log
+    if len(thread_error) > 0:
+        raise thread_error[0]
+    return thread_result[0]
+
+
+## clone functions
+
+
+clone_parallel=8 #files cloned at the same time, for filesystems without reflink
+
+def clone_file(source_path, dest_path, clone_method): #returns how the file was cloned
+    cloned_by='copy'
+    if clone_method in ('auto', 'reflink'):
+        try:
+            with open(source_path, 'rb') as source_file, open(dest_path, 'wb') as dest_file:
+                fcntl.ioctl(dest_file.fileno(), 0x40049409, source_file.fileno()) #FICLONE
+            cloned_by='reflink'
+        except OSError as error:
+            if clone_method=='reflink':
+                logging.error('could not reflink \'%s\'. Please use a filesystem with reflink support or another clone method [%s]' % (source_path, str(error)))
+                sys.exit(-1)
+    if cloned_by=='copy':
+        copyfile(source_path, dest_path)
+    source_stat=os.stat(source_path)
+    os.chmod(dest_path, source_stat.st_mode)
+    os.chown(dest_path, source_stat.st_uid, source_stat.st_gid)
+    return cloned_by
+
+
+def get_overlay_dir(clone_dir): #upper and work layers of an overlay clone, and the golden copy it was mounted on
+    return os.path.dirname(clone_dir)+'/.overlay/'+os.path.basename(clone_dir)
+
+
+def mount_overlay(golden_dir, clone_dir): #golden copy is the read-only lower layer, and the clone writes go to its own upper layer
+    overlay_dir=get_overlay_dir(clone_dir)
+    for directory in [overlay_dir+'/upper', overlay_dir+'/work', clone_dir]:
+        create_directory(directory)
+    golden_stat=os.stat(golden_dir)
+    os.chown(overlay_dir+'/upper', golden_stat.st_uid, golden_stat.st_gid)
+    write_file_atomically(overlay_dir+'/lowerdir', golden_dir+'\n') #overlay mounts do not survive a host reboot, so the clone is mounted again from it
+    mount_result=subprocess.run(['mount', '-t', 'overlay', 'overlay', '-o', 'lowerdir=%s,upperdir=%s,workdir=%s' % (golden_dir, overlay_dir+'/upper', overlay_dir+'/work'), clone_dir], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if mount_result.returncode!=0:
+        logging.error('could not mount overlay of \'%s\' at \'%s\' [%s]' % (golden_dir, clone_dir, mount_result.stderr.decode('utf-8', 'replace').strip()))
+        sys.exit(-1)
+
+
+def remount_overlay_clones(datafile_dir, database_list): #overlay clones restarted after a host reboot are mounted again before the container starts
+    for database in database_list:
+        clone_dir=datafile_dir+'/'+database
+        overlay_dir=get_overlay_dir(clone_dir)
+        if not os.path.exists(overlay_dir+'/lowerdir') or os.path.ismount(clone_dir):
+            continue
+        with open(overlay_dir+'/lowerdir', 'r') as lowerdir_file:
+            golden_dir=lowerdir_file.read().strip()
+        logging.info('mounting overlay clone \'%s\' of \'%s\' again' % (clone_dir, golden_dir))
+        mount_overlay(golden_dir, clone_dir)
+
+
+def clone_directory(golden_dir, clone_dir, clone_method): #clone of a restored database directory, returns how many files were cloned by each method
+    if os.path.isdir(clone_dir) and len(os.listdir(clone_dir))>0:
+        logging.error('clone directory \'%s\' already exists and is not empty' % clone_dir)
+        sys.exit(-1)
+    if clone_method=='overlay':
+        mount_overlay(golden_dir, clone_dir)
+        return {'overlay':1}
+
+    file_list=[]
+    for directory, subdirectories, files in os.walk(golden_dir):
+        dest_directory=os.path.normpath(clone_dir+'/'+os.path.relpath(directory, golden_dir))
+        create_directory(dest_directory)
+        directory_stat=os.stat(directory)
+        os.chown(dest_directory, directory_stat.st_uid, directory_stat.st_gid)
+        file_list+=[(directory+'/'+file_name, dest_directory+'/'+file_name) for file_name in files]
+
+    with ThreadPoolExecutor(max_workers=clone_parallel) as executor:
+        clone_count=collections.Counter(executor.map(lambda file_paths: clone_file(file_paths[0], file_paths[1], clone_method), file_list))
+    logging.info('cloned \'%s\' into \'%s\' (%s)' % (golden_dir, clone_dir, ', '.join('%s files by %s' % (count, cloned_by) for cloned_by, count in sorted(clone_count.items())) or 'no files'))
+    return dict(clone_count)
+
+
+## image build context functions
+
+
+base_image_repository='oradock_base' #images built from the layers above the settings marker, tagged with their build context digest
+settings_marker='#password and host settings come last' #dockerfile lines from this comment on are built on top of the base image
+
+def split_dockerfile(dockerfile): #base and settings lines of the dockerfile. Templates without the settings marker are all base
+    with open(dockerfile, 'r') as dockerfile_input:
+        dockerfile_lines=dockerfile_input.readlines()
+    for line_number, line in enumerate(dockerfile_lines):
+        if line.startswith(settings_marker):
+            return dockerfile_lines[:line_number], dockerfile_lines[line_number:]
+    return dockerfile_lines, None
+
+
+def list_settings_context(settings_lines, context_files): #files added by the settings lines, so the base layers are not sent again
+    settings_sources=set()
+    for line in settings_lines:
+        if re.match(r'^(ADD|COPY)\s', line):
+            settings_sources.update(line.split()[1:-1])
+    return [(context_name, context_path) for context_name, context_path in context_files if context_name in settings_sources]
+
+
+def find_base_image(docker_client, base_image_name, context_digest): #image labeled with the same build context digest, so its layers need no build
+    for image in docker_client.images(filters={'label':'oradock.build_context=%s' % context_digest}):
+        if base_image_name in (image.get('RepoTags') or []):
+            return image.get('Id')
+    return None
+
+
+def split_image_name(image_name): #repository and tag, where a registry port is not taken for a tag
+    (repository, separator, tag)=image_name.rpartition(':')
+    if separator=='' or '/' in tag:
+        return image_name, None
+    return repository, tag
+
+
+def list_build_context(dockerfile, config_files_dir, oinstall_dir): #files sent to docker build, as (name inside context, path)
+    context_files=[('Dockerfile', dockerfile), ('config_files', config_files_dir)]
+    for context_dir, context_name in [(config_files_dir, 'config_files'), (oinstall_dir, 'config_files/database')]:
+        if context_name=='config_files/database':
+            context_files.append((context_name, context_dir))
+        for root, directories, files in os.walk(context_dir):
+            directories.sort()
+            if root==config_files_dir and 'database' in directories: #install files come from oinstall dir
+                directories.remove('database')
+            root_name=context_name+root[len(context_dir):]
+            for each_name in directories+sorted(files):
+                context_files.append((root_name+'/'+each_name, root+'/'+each_name))
+    return context_files
+
+
+def hash_build_context(context_files, context_cache_file): #sha256 of each file is kept while its size and mtime do not change
+    try:
+        with open(context_cache_file, 'r') as cache_file:
+            context_cache=json.load(cache_file)
+    except (OSError, ValueError):
+        context_cache={}
+
+    context_hash=hashlib.sha256()
+    new_context_cache={}
+    rehashed_files=0
+    for context_name, context_path in context_files:
+        file_stat=os.stat(context_path)
+        file_hash=''
+        if os.path.isfile(context_path):
+            cached_file=context_cache.get(context_path)
+            if cached_file is not None and cached_file[0]==file_stat.st_size and cached_file[1]==file_stat.st_mtime:
+                file_hash=cached_file[2]
+            else:
+                file_hash=compute_file_checksum(context_path, hashlib.sha256)
+                rehashed_files+=1
+            new_context_cache[context_path]=[file_stat.st_size, file_stat.st_mtime, file_hash]
+        context_hash.update(('%s %o %s\n' % (context_name, file_stat.st_mode, file_hash)).encode('utf-8'))
+
+    write_file_atomically(context_cache_file, json.dumps(new_context_cache))
+    logging.debug('build context has %s entries, %s files hashed again' % (len(context_files), rehashed_files))
+    return context_hash.hexdigest()
+
+
+class TarStreamWriter(object): #file object that hands tar blocks to the docker build request, as they are written
+    def __init__(self):
+        self.blocks=queue.Queue(maxsize=64)
+        self.aborted=threading.Event() #set when the build request stops reading the stream
+
+    def write(self, data):
+        if self.aborted.is_set():
+            raise OSError(errno.EPIPE, 'build context is not read anymore')
+        self.blocks.put(bytes(data))
+        return len(data)
+
+
+def normalize_tar_member(tar_info): #owner of the host files must not change docker cache of ADD layers
+    tar_info.uid=tar_info.gid=0
+    tar_info.uname=tar_info.gname='root'
+    return tar_info
+
+
+def stream_build_context(context_files): #tar stream of the build context, without copying files first
+    tar_writer=TarStreamWriter()
+    tar_error=[]
+
+    def write_tar():
+        try:
+            with tarfile.open(fileobj=tar_writer, mode='w|') as context_tar:
+                for context_name, context_path in context_files:
+                    context_tar.add(context_path, arcname=context_name, recursive=False, filter=normalize_tar_member)
+        except (OSError, tarfile.TarError) as error:
+            tar_error.append(error)
+        finally:
+            tar_writer.blocks.put(None)
+
+    tar_thread=threading.Thread(name='stream_build_context', target=write_tar)
+    tar_thread.daemon=True
+    tar_thread.start()
+    tar_finished=False
+    try:
+        while True:
+            tar_block=tar_writer.blocks.get()
+            if tar_block is None:
+                tar_finished=True
+                break
+            yield tar_block
+    finally: #stream closed before its end: tar thread stops at its next write, and draining the queue unblocks it
+        if not tar_finished:
+            tar_writer.aborted.set()
+            while tar_writer.blocks.get() is not None:
+                pass
+        tar_thread.join()
+    if len(tar_error)>0:
+        logging.error('error sending build context [%s]' % str(tar_error[0]))
+        sys.exit(-1)
 
 
 ## docker function
 
 
-def docker_build(docker_client, image_name, dockerfile_dir, docker_image):
+docker_socket_url='unix://var/run/docker.sock' #clients of worker threads are opened with it, since the base_url of a client is not a valid url to open another one
+
+def docker_build(docker_client, image_name, context_files, log):
+    with open(dict(context_files).get('Dockerfile'), 'r') as dockerfile: #old docker versions do not print the number of steps
+        build_steps=len([line for line in dockerfile if re.match(r'^[A-Z]+\s', line)])
+    line_reader=StreamLineReader()
     try:
-        oradock_image=[line for line in docker_client.build(path=dockerfile_dir, stream=True, rm=True, tag=image_name)]
-        docker_image.append(oradock_image)
+        for build_chunk in docker_client.build(fileobj=stream_build_context(context_files), custom_context=True, stream=True, rm=True, tag=image_name):
+            for build_line in line_reader.feed(build_chunk):
+                parse_build_event(build_line, build_steps, log)
+        for build_line in line_reader.close():
+            parse_build_event(build_line, build_steps, log)
     except docker_error.APIError as error:
         logging.error('error creating image \'%s\' [%s]' % (image_name, error.args[0]))
         sys.exit(-1)
@@ -539,9 +2095,30 @@ def docker_build(docker_client, image_name, dockerfile_dir, docker_image):
         sys.exit(-1)
     except KeyboardInterrupt as error:
         sys.exit(-1)
-   
 
-def docker_start(docker_client, image_name, container_name, container_volumes, container_volumes_config, container_port_config): #starts a container
+
+def parse_build_event(build_line, build_steps, log): #each line of docker build output is a json event
+    if build_line.strip()=='':
+        return
+    try:
+        build_event=json.loads(build_line)
+    except ValueError:
+        logging.debug('invalid docker build output: %s' % build_line)
+        return
+    if 'error' in build_event:
+        logging.error('docker build could not execute due to error [%s]' % build_event.get('error').strip())
+        sys.exit(-1)
+    build_output=(build_event.get('stream') or build_event.get('status') or '').rstrip('\n')
+    if build_output=='':
+        return
+    log.append(build_output)
+    logging.debug(build_output)
+    build_step=re.search(r'Step (\d+)(?:/(\d+))? ?:', build_output)
+    if build_step is not None:
+        log.emit('build', 'building image', int(build_step.group(1)), int(build_step.group(2) or build_steps))
+
+
+def docker_start(docker_client, image_name, container_name, container_volumes, container_volumes_config, container_port_config, numa_node=None, environment=None): #starts a container
     try:
         oradock_container=docker_client.create_container(image=image_name, 
                                                         name=container_name, 
@@ -550,6 +2127,7 @@ def docker_start(docker_client, image_name, container_name, container_volumes, c
                                                         detach=True, 
                                                         ports=[1521],
                                                         tty=True, 
+                                                        environment=environment, 
                                                         volumes=container_volumes, 
                                                         host_config = 
                                                             docker_client.create_host_config(
@@ -557,6 +2135,8 @@ def docker_start(docker_client, image_name, container_name, container_volumes, c
                                                                                             port_bindings=container_port_config, 
                                                                                             privileged=True)
                                                         )
+        if numa_node is not None: #cpus and memory of a single numa node
+            docker_client.update_container(oradock_container, cpuset_cpus=numa_node.get('cpus'), cpuset_mems=numa_node.get('node'))
         docker_client.start(oradock_container)
     except docker_error.APIError as error:
         logging.error('error while trying to start container [%s]' % error.args[0])
@@ -564,7 +2144,8 @@ def docker_start(docker_client, image_name, container_name, container_volumes, c
     return oradock_container
 
 
-def docker_run(docker_client, oradock_container, command, log): #executes a command inside the container
+def docker_run(docker_client, oradock_container, command, log, report=None, database=None, database_log=None): #executes a command inside the container
+    line_reader=StreamLineReader()
     try:
         logging.debug('executing bash inside container: %s' % command)
 
@@ -579,76 +2160,321 @@ def docker_run(docker_client, oradock_container, command, log): #executes a comm
                                                                 tty=False,
                                                                 detach=False,
                                                                 stream=True):
-            exec_output = ''.join(chr(x) for x in exec_log)
-            exec_output = exec_output.strip()
-            print('\r'+exec_output)
+            for exec_line in line_reader.feed(exec_log):
+                handle_exec_line(exec_line, log, report, database, database_log)
+        for exec_line in line_reader.close():
+            handle_exec_line(exec_line, log, report, database, database_log)
+        return docker_client.exec_inspect(config_exec['Id']).get('ExitCode')
     except docker_error.APIError as error:
         logging.error('error while trying to execute command \'%s\' on container: %s ' % (command, error.args[0]))
     except docker_error.DockerException as error:
         logging.error('error while trying to execute docker command: %s ' % error.args[0])
+    return -1
+
+
+def handle_exec_line(exec_line, log, report, database, database_log): #script messages are printed, database errors are logged as they arrive and everything goes to the database log file
+    exec_line=parse_script_phase(exec_line, report).strip() #phase timings from database scripts go to the run report
+    if exec_line=='':
+        return
+    log.append(exec_line)
+    if database_log is not None:
+        database_log.info(exec_line)
+    if re.match(r'^(ORA|RMAN)-\d+', exec_line):
+        logging.warn('%s%s' % ('' if database is None else 'database '+database+': ', exec_line))
+        log.emit('error', exec_line)
+        return
+    if re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [A-Z]+:', exec_line): #messages of the database scripts, the other lines are the database tools output
+        print('\r'+exec_line)
+    else:
+        logging.debug(exec_line)
+    rman_channel=re.search(r'channel (\S+): (.*)', exec_line)
+    if rman_channel is not None:
+        log.emit('rman', '%s: %s' % (rman_channel.group(1), rman_channel.group(2)))
+    else:
+        log.emit('exec', exec_line)
+
+
+def parse_script_phase(exec_line, report): #phase lines look like 'ORADOCK_PHASE|database|phase|elapsed seconds', others are returned as they are
+    if not exec_line.startswith('ORADOCK_PHASE|'):
+        return exec_line
+    try:
+        (marker, database, phase, elapsed_time)=exec_line.strip().split('|')
+        if report is not None:
+            report.add_phase(phase, float(elapsed_time), database)
+    except ValueError:
+        logging.debug('invalid phase line from database script: %s' % exec_line)
+    return ''
+
+
+def docker_exec_output(docker_client, oradock_container, command): #executes a short command inside the container and returns its whole output
+    try:
+        config_exec=docker_client.exec_create(container=oradock_container['Id'], cmd=command, user='oracle', stdout=True, stderr=True, tty=False)
+        return docker_client.exec_start(exec_id=config_exec['Id'], tty=False, detach=False, stream=False).decode('utf-8', 'replace')
+    except docker_error.DockerException as error:
+        logging.debug('error while trying to execute command \'%s\' on container: %s ' % (command, str(error)))
+    return ''
+
+
+def get_running_container(docker_client, container_name):
+    try:
+        oradock_container=docker_client.inspect_container(container_name)
+    except docker_error.NotFound:
+        logging.error('container \'%s\' does not exist' % container_name)
+        sys.exit(-1)
+    if not oradock_container.get('State', {}).get('Running'):
+        logging.error('container \'%s\' is not running' % container_name)
+        sys.exit(-1)
+    return oradock_container
+
+
+def read_database_checkpoint(docker_client, oradock_container, oradock_home, database): #role, scn and time of the oldest datafile checkpoint, from checkpoint_database.sh lines
+    checkpoint_output=docker_exec_output(docker_client, oradock_container, '/bin/bash '+ oradock_home +'/database/checkpoint_database.sh '+ database)
+    for checkpoint_line in checkpoint_output.split('\n'):
+        checkpoint_fields=checkpoint_line.strip().split('|')
+        if checkpoint_fields[0]=='ORADOCK_CHECKPOINT' and len(checkpoint_fields)==5 and re.match(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$', checkpoint_fields[4]):
+            break
+    else:
+        logging.error('could not read the checkpoint of database %s. Please check if it is mounted at container \'%s\'' % (database, oradock_container.get('Name', '').lstrip('/')))
+        sys.exit(-1)
+    if checkpoint_fields[2]!='PHYSICAL STANDBY': #a database opened read write has a new incarnation, which newer backups cannot recover
+        logging.error('database %s was opened read write. Only databases restored with --open-mode=read-only can be refreshed' % database)
+        sys.exit(-1)
+    return {'role':checkpoint_fields[2], 'scn':checkpoint_fields[3], 'time':checkpoint_fields[4]}
+
+
+def parse_rman_progress(database, monitor_output): #progress of each channel from monitor_restore.sh lines
+    channels_progress=[]
+    rman_operation=None
+    for line in monitor_output.split('\n'):
+        fields=line.strip().split('|')
+        if fields[0]=='ORADOCK_STATUS' and len(fields)==4: #operation running at v$rman_status, as RESTORE or RECOVER
+            rman_operation=fields[1]
+            continue
+        if fields[0]!='ORADOCK_PROGRESS' or len(fields)!=8:
+            continue
+        try:
+            channel_progress={'database':database,
+                              'channel':'total' if fields[2].find('aggregate')!=-1 else fields[1],
+                              'operation':fields[2],
+                              'done_mb':float(fields[3]),
+                              'total_mb':float(fields[4]),
+                              'elapsed_time':int(fields[5]),
+                              'eta_seconds':int(fields[6]),
+                              'wait_class':fields[7]}
+        except ValueError:
+            logging.debug('invalid progress line from monitor script: %s' % line)
+            continue
+        channel_progress['mb_s']=round(channel_progress['done_mb']/channel_progress['elapsed_time'], 2) if channel_progress['elapsed_time']>0 else None
+        channel_progress['bound']='io' if channel_progress['wait_class'].find('I/O')!=-1 else ('cpu' if channel_progress['wait_class']=='CPU' else 'wait')
+        channels_progress.append(channel_progress)
+    for channel_progress in channels_progress:
+        channel_progress['rman_operation']=rman_operation
+    return channels_progress
+
+
+def monitor_rman_progress(docker_client, oradock_container, oradock_home, database_status, monitor_interval, progress_file, monitor_stop, log): #polls v$session_longops of each running database
+    while not monitor_stop.wait(monitor_interval):
+        for database in [database for database, status in list(database_status.items()) if status.get('status')=='running']:
+            monitor_output=docker_exec_output(docker_client, oradock_container, '/bin/bash '+ oradock_home +'/database/monitor_restore.sh '+ database)
+            channels_progress=parse_rman_progress(database, monitor_output)
+            if len(channels_progress)==0:
+                continue
+            sample_time=time.strftime('%Y-%m-%dT%H:%M:%S')
+            for channel_progress in channels_progress:
+                channel_progress['time']=sample_time
+                logging.debug('%s %s: %s of %s mb, %s mb/s, eta %s seconds, %s bound' % (database, channel_progress['channel'], channel_progress['done_mb'], channel_progress['total_mb'], channel_progress['mb_s'], channel_progress['eta_seconds'], channel_progress['bound']))
+            channels=[channel_progress for channel_progress in channels_progress if channel_progress['channel']!='total']
+            total_progress=([channel_progress for channel_progress in channels_progress if channel_progress['channel']=='total'] or channels)[0]
+            channels_bound=collections.Counter(channel_progress['bound'] for channel_progress in channels)
+            log.emit('progress', '%s %s mb/s eta %ss %s' % (database, total_progress['mb_s'], total_progress['eta_seconds'], ' '.join('%s:%s' % (bound, count) for bound, count in sorted(channels_bound.items()))), total_progress['done_mb'], total_progress['total_mb'])
+            if progress_file is not None:
+                try:
+                    with open(progress_file, 'a') as progress_output:
+                        for channel_progress in channels_progress:
+                            progress_output.write(json.dumps(channel_progress)+'\n')
+                except OSError as error:
+                    logging.debug('error writing progress file \'%s\'. %s' % (progress_file, str(error)))
+
+
+def docker_run_databases(docker_client, oradock_container, database_commands, finish_command, database_parallel, report, monitor_settings, log_dir, log): #executes each database script in its own exec session, database_parallel at a time
+    database_status=collections.OrderedDict()
+    for database, command in database_commands:
+        database_status[database]={'status':'waiting', 'elapsed_time':None}
+
+    def run_database(database, command):
+        database_status[database]['status']='running'
+        start_time=time.time()
+        database_log=open_database_log(log_dir+'/'+database+'.log')
+        try:
+            exit_code=docker_run(docker_client, oradock_container, command, log, report, database, database_log)
+        finally:
+            close_database_log(database_log)
+        database_status[database]['elapsed_time']=round(time.time()-start_time, 1)
+        report.add_phase('database_script', time.time()-start_time, database)
+        database_status[database]['status']='success' if exit_code==0 else 'failed'
+        logging.debug('database %s script finished with status \'%s\' in %s seconds' % (database, database_status[database]['status'], database_status[database]['elapsed_time']))
+
+    monitor_stop=threading.Event()
+    if monitor_settings is not None: #(oradock home, seconds between checks, progress file)
+        monitor_thread=threading.Thread(name='monitor_rman_progress', target=monitor_rman_progress, args=(docker_client, oradock_container, monitor_settings[0], database_status, monitor_settings[1], monitor_settings[2], monitor_stop, log))
+        monitor_thread.daemon=True
+        monitor_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=int(database_parallel)) as executor:
+            for execution in [executor.submit(run_database, database, command) for database, command in database_commands]:
+                execution.result()
+    finally:
+        monitor_stop.set()
+
+    if finish_command is not None: #a refreshed container is already finished
+        with report.measure('finish_container'):
+            container_log=open_database_log(log_dir+'/container.log')
+            try:
+                docker_run(docker_client, oradock_container, finish_command, log, report, None, container_log)
+            finally:
+                close_database_log(container_log)
+    return dict(database_status)
 
 
 def docker_pull(docker_client, image_name, log):
+    layers_progress={}
+    line_reader=StreamLineReader()
     try:
-        docker_client.pull(repository=image_name, stream=False)
+        for pull_chunk in docker_client.pull(repository=image_name, stream=True):
+            for line in line_reader.feed(pull_chunk):
+                if line.strip()=='':
+                    continue
+                try:
+                    pull_status=json.loads(line)
+                except ValueError:
+                    logging.debug('invalid docker pull output: %s' % line)
+                    continue
+                if 'error' in pull_status:
+                    logging.error('error while trying to download docker image: %s ' % pull_status.get('error'))
+                    sys.exit(-1)
+                progress_detail=pull_status.get('progressDetail') or {}
+                if pull_status.get('status')=='Downloading' and progress_detail.get('total'):
+                    layers_progress[pull_status.get('id')]=(progress_detail.get('current', 0), progress_detail.get('total'))
+                    log.emit('pull', 'pulling image', sum(current for current, total in layers_progress.values()), sum(total for current, total in layers_progress.values()))
+                elif pull_status.get('status') in ('Download complete', 'Already exists', 'Pull complete') and pull_status.get('id') in layers_progress:
+                    layers_progress[pull_status.get('id')]=(layers_progress[pull_status.get('id')][1], layers_progress[pull_status.get('id')][1])
     except docker_error.DockerException as error:
         logging.error('error while trying to download docker image: %s ' % error.args[0])
         sys.exit(-1)
 
 
+def create_database_commands(args, database_list, config_dir): #one script execution for each database, so they can run at the same time
+    if args.get('refresh')==True:
+        script_name='refresh'
+    elif args['restore']==True:
+        script_name='restore'
+    elif args['restart']==True:
+        script_name='restart'
+    elif args['create']==True and args['database']==True:
+        script_name='create'
+
+    database_commands=[]
+    for database, info in database_list.items():
+        command_args=[]
+        if script_name=='refresh': #databases keep their files, memory and services from the restore
+            command_args.append(info.get('backup_directory'))
+            command_args.append(database)
+            command_args.append(args['--parallel'])
+        else:
+            if script_name=='restore':
+                command_args.append(info.get('backup_directory'))
+            elif script_name=='create':
+                command_args.append(args['PASSWORD'])
+
+            command_args.append(database)
+            command_args.append(info.get('memory'))
+            command_args.append(info.get('service_name'))
+            command_args.append(args['--oradock-home'])
+            command_args.append(args['--datafile-dir'])
+            command_args.append(args['--spfile-name'])
+            command_args.append(args['--control-file-name'])
+            command_args.append(str(info.get('channels', args['--parallel'])))
+
+        command_env='env ORADOCK_DATABASE_ONLY=Y ORADOCK_CONFIG_DIR='+ config_dir +' '
+        if args['--pipeline']==True:
+            command_env+='ORADOCK_PIPELINE=Y '
+        if args.get('clone_from') is not None:
+            command_env+='ORADOCK_CLONE_FROM='+ args['clone_from'] +' '
+        if script_name=='restore' and args['--until-time'] is not None:
+            command_env+='ORADOCK_UNTIL_TIME=\''+ args['--until-time'] +'\' '
+        if script_name=='restore':
+            command_env+='ORADOCK_OPEN_MODE='+ args['--open-mode'] +' '
+        command = command_env +'/bin/bash '+ args['--oradock-home'] +'/database/'+ script_name + '_database.sh '+ ' '.join(command_args)
+        database_commands.append((database, command))
+
+    finish_command=None
+    if script_name!='refresh':
+        finish_command='env ORADOCK_CONFIG_DIR='+ config_dir +' /bin/bash '+ args['--oradock-home'] +'/database/finish_database.sh '+ args['--oradock-home']
+    return database_commands, finish_command
+
+
 #oradock argument final function
 
 
 def restore_or_restart_or_create_database(args, database_list, docker_client): #restore all databases inside the container
-    if len(docker_client.images(name=args['--image-name']))==0 or args['--force-pull']==True:
+    if not args['preflight'].get('image_found') or args['--force-pull']==True:
         logging.info('Downloading or updating image \'%s\'' % args['--image-name'])
         process_args=(docker_client, args['--image-name'])
-        call_process_build(docker_pull, process_args, args['--animation'])
+        with args['report'].measure('pull_image'):
+            call_thread_build(docker_pull, process_args, args['--animation'])
 
     logging.debug('defining volumes to mount into container')
 
     for database, info in database_list.items():
-        create_directory(args['--datafile-dir']+'/'+database)    
-        create_directory('/tmp/' + database)
-        change_directory_owner(args['--datafile-dir']+'/'+database, 501, 503)
-        change_directory_owner('/tmp/' + database, 501, 503)
-        change_directory_owner(info.get('backup_directory'), 501, 503)
+        with args['report'].measure('change_directory_owner', database):
+            create_directory(args['--datafile-dir']+'/'+database)    
+            create_directory('/tmp/' + database)
+            change_directory_owner(args['--datafile-dir']+'/'+database, 501, 503)
+            change_directory_owner('/tmp/' + database, 501, 503)
+            change_directory_owner(info.get('backup_directory'), 501, 503)
     (container_volumes, container_volumes_config)=set_docker_volumes(database_list, args['--datafile-dir'], args['--oradock-home'])
     container_port_config={1521 : args['--port']}
 
+    memory_plan=args['preflight'].get('memory_plan')
+    args['report'].settings['memory_plan']=memory_plan
+    for database, info in database_list.items():
+        info['memory_plan']=memory_plan['databases'][database]
+
     logging.info('creating & starting container \'%s\'' % args['--container-name'])
-    oradock_container=docker_start(docker_client, args['--image-name'], args['--container-name'], container_volumes, container_volumes_config, container_port_config)
+    with args['report'].measure('docker_start'):
+        oradock_container=docker_start(docker_client, args['--image-name'], args['--container-name'], container_volumes, container_volumes_config, container_port_config, memory_plan.get('numa_node'), {'ORADOCK_STARTUP_PARALLEL':args['--database-parallel']})
 
     logging.info('container started')
     logging.info('executing database script inside container')
 
-    command_args=[]
-    if args['restore']==True:
-        command_args.append(args['--backup-directory'])
-        script_name='restore'
-    elif args['restart']==True:
-        script_name='restart'
-    elif args['create']==True and args['database']==True:
-        command_args.append(args['PASSWORD'])
-        script_name='create'
+    if args['restore']==True and args['--parallel']=='auto':
+        args['report'].settings['rman_channels']=plan_rman_channels(args, database_list)
+    config_dir=prepare_container_config(args, database_list)
+    (database_commands, finish_command)=create_database_commands(args, database_list, config_dir)
+    monitor_settings=None
+    if args['restore']==True and args['--monitor-interval']!='0':
+        monitor_settings=(args['--oradock-home'], int(args['--monitor-interval']), args['--progress-file'])
+    process_args=(docker_client, oradock_container, database_commands, finish_command, args['--database-parallel'], args['report'], monitor_settings, config_dir)
+    database_status=call_thread_build(docker_run_databases, process_args, args['--animation'])
+    log_database_status(database_status, config_dir)
+    return database_status
+
+
+def log_database_status(database_status, config_dir):
+    for database, status in database_status.items():
+        if status.get('status')=='success':
+            logging.info('database %s finished in %s seconds' % (database, status.get('elapsed_time')))
+        else:
+            logging.error('database %s failed after %s seconds. Please check its logfile \'%s\'' % (database, status.get('elapsed_time'), config_dir+'/'+database+'.log'))
 
-    command_args.append(args['DATABASE'])
-    command_args.append(args['MEMORY'])
-    command_args.append(args['SERVICE_NAME'])
-    command_args.append(args['--oradock-home'])
-    command_args.append(args['--datafile-dir'])
-    command_args.append(args['--spfile-name'])
-    command_args.append(args['--control-file-name'])
-    command_args.append(args['--parallel'])
-    command_args.append(' > /tmp/'+script_name+'_database.log')
 
-    command = '/bin/bash '+ args['--oradock-home'] +'/database/'+ script_name + '_database.sh '+ ' '.join(command_args)
-    process_args=(docker_client, oradock_container, command)
-    docker_exec_log=call_process_build(docker_run, process_args, args['--animation'])
+def exit_on_database_failure(database_status): #cli exits as the daemon client does when a database fails, while fleet and daemon jobs still get the status of each database
+    if any(status.get('status')!='success' for status in database_status.values()):
+        sys.exit(-1)
 
 
 def create_image(args, docker_client):
-    oinstall_dir=args['--oradock-home']+'/conf/dockerfile/config_files/database'
+    oinstall_dir=args['--oinstall-dir']
     with open(oinstall_dir+'/install/oraparam.ini', 'r') as config_file: #search for oracle binary install version
         install_version=None
         for line in config_file:
@@ -659,34 +2485,559 @@ def create_image(args, docker_client):
             sys.exit(-1)
 
     dockerfile=args['--oradock-home']+'/conf/dockerfile/Dockerfile'
-    if args['--dockerfile-template'].find('$ORADOCK_HOME')==0:
-        copyfile(dockerfile+'.template', dockerfile) #replace password and install versions into dockerfile
-    else:
-        copytree(args['--dockerfile-template'], dockerfile)
-    prepare_dockerfile(dockerfile, '\${password}', args['PASSWORD'])
-    prepare_dockerfile(dockerfile, '\${install_version}', install_version)
-    prepare_dockerfile(dockerfile, '\${oinstall_dir}', args['--oinstall-dir'])
-    prepare_dockerfile(dockerfile, '\${hostname}', socket.gethostname())
+    dockerfile_template=args['--dockerfile-template']
+    if dockerfile_template.find('$ORADOCK_HOME')==0:
+        dockerfile_template=dockerfile+'.template'
+    render_template(dockerfile_template, {'password':args['PASSWORD'], 'install_version':install_version, 'oinstall_dir':args['--oinstall-dir'], 'hostname':socket.gethostname()}, dockerfile) #replace password and install versions into dockerfile
+
+    (base_lines, settings_lines)=split_dockerfile(dockerfile)
+    with open(dockerfile, 'w') as dockerfile_output:
+        dockerfile_output.writelines(base_lines)
+    context_files=list_build_context(dockerfile, args['--oradock-home']+'/conf/dockerfile/config_files', oinstall_dir)
+    context_digest=hash_build_context(context_files, args['--oradock-home']+'/conf/dockerfile/.build_context.json')
+    base_image_name='%s:%s' % (base_image_repository, context_digest[:12])
     logging.info('dockerfile created at \'%s\'' % dockerfile)
-    logging.info('creating image \'%s\'' % args['IMAGE_NAME'])
-
-    process_args=(docker_client, args['IMAGE_NAME'], args['--oradock-home']+'/conf/dockerfile')
-    docker_build_log=call_process_build(docker_build, process_args, args['--animation'])
-
-    for exec_log in docker_build_log[0]:
-        exec_output = ''.join(chr(x) for x in exec_log)
-        exec_output = eval(exec_output.replace('\\n"}', '"}'))
-        try: 
-            logging.debug(exec_output['stream'])
-        except KeyError as error:
-            logging.error('docker build could not execute due to error [%s]' % str(error))
+
+    if find_base_image(docker_client, base_image_name, context_digest) is not None:
+        logging.info('reusing image \'%s\' built from the same build context %s' % (base_image_name, context_digest[:12]))
+    else:
+        with open(dockerfile, 'a') as dockerfile_output: #last base layer, so images built from the same files are found again
+            dockerfile_output.write('\nLABEL oradock.build_context=%s\n' % context_digest)
+        logging.info('creating image \'%s\' from build context %s' % (base_image_name, context_digest[:12]))
+        process_args=(docker_client, base_image_name, context_files)
+        call_thread_build(docker_build, process_args, args['--animation'])
+
+    if settings_lines is None:
+        (repository, tag)=split_image_name(args['IMAGE_NAME'])
+        try:
+            docker_client.tag(base_image_name, repository, tag=tag)
+        except docker_error.APIError as error:
+            logging.error('error creating image \'%s\' [%s]' % (args['IMAGE_NAME'], error.args[0]))
             sys.exit(-1)
+    else:
+        with open(dockerfile, 'w') as dockerfile_output: #password and host layers only, on top of the base image
+            dockerfile_output.write('FROM %s\n\n' % base_image_name)
+            dockerfile_output.writelines(settings_lines)
+        logging.info('creating image \'%s\' from image \'%s\'' % (args['IMAGE_NAME'], base_image_name))
+        process_args=(docker_client, args['IMAGE_NAME'], [('Dockerfile', dockerfile)]+list_settings_context(settings_lines, context_files))
+        call_thread_build(docker_build, process_args, args['--animation'])
 
-    rmtree(args['--oradock-home']+'/conf/dockerfile/config_files/database')
     logging.info('docker image successfully created')
     os.remove(args['--oradock-home']+'/conf/dockerfile/Dockerfile')
 
 
+def run_restore(args, docker_client):
+    args['report']=RunReport('restore')
+    s3connection=None
+    try:
+        check_restore_params(args)
+        preprocess_restore_args(args)
+        database=create_database_settings(args)
+        if args['--s3-bucket'].replace(',-','')!='-': #single s3 connection for the pre-flight listing and the download phase
+            s3connection=acquire_s3conn(args)
+        preflight_checks=create_preflight_checks(args, database, docker_client)
+        preflight_checks['backup_files']=(check_backup_files, (args, database, s3connection))
+        with args['report'].measure('preflight'):
+            args['preflight']=run_preflight_checks(preflight_checks)
+        set_backup_selection(database, args['preflight'].get('backup_files'))
+
+        download_thread=None
+        args['restore_finished']=threading.Event()
+        if s3connection is None:
+            args['--pipeline']=False
+        elif args['--pipeline']==True:
+            download_thread=download_s3_pipeline(database, s3connection, args)
+        else:
+            with args['report'].measure('download') as phase_info:
+                phase_info['bytes']=download_s3(database, s3connection, args['--s3-access-key'], args['--s3-secret-key'], args['--s3-endpoint'], args['--download-parallel'], args['--download-chunk-size'], args['--cache-dir'])
+        database_status=restore_or_restart_or_create_database(args, database, docker_client)
+        args['restore_finished'].set()
+        if download_thread is not None:
+            download_thread.join()
+        if args['--cache-dir'] is not None: #once per run, so files linked by this run are not evicted while it still needs them
+            evict_cache(args['--cache-dir'], int(args['--cache-size'])*1024*1024*1024)
+        return database_status
+    finally:
+        if args.get('restore_finished') is not None: #download thread stops waiting for controlfiles that were not restored
+            args['restore_finished'].set()
+        if s3connection is not None:
+            release_s3conn(args, s3connection)
+        write_run_report(args)
+
+
+def run_restart(args, docker_client):
+    args['report']=RunReport('restart')
+    try:
+        check_restart_params(args)
+        preprocess_restart_args(args)
+        database=create_database_settings(args)
+        with args['report'].measure('preflight'):
+            args['preflight']=run_preflight_checks(create_preflight_checks(args, database, docker_client))
+        remount_overlay_clones(args['--datafile-dir'], database)
+        return restore_or_restart_or_create_database(args, database, docker_client)
+    finally:
+        write_run_report(args)
+
+
+def run_create_database(args, docker_client):
+    args['report']=RunReport('create')
+    try:
+        check_create_database_params(args)
+        preprocess_create_database_args(args)
+        database=create_database_settings(args)
+        with args['report'].measure('preflight'):
+            args['preflight']=run_preflight_checks(create_preflight_checks(args, database, docker_client))
+        return restore_or_restart_or_create_database(args, database, docker_client)
+    finally:
+        write_run_report(args)
+
+
+def run_clone(args, docker_client):
+    args['report']=RunReport('clone')
+    try:
+        check_clone_params(args)
+        preprocess_clone_args(args)
+        database=create_database_settings(args)
+        preflight_checks=create_preflight_checks(args, database, docker_client)
+        preflight_checks['golden_copy']=(check_golden_copy, (docker_client, args['clone_from'], list(database.keys())))
+        with args['report'].measure('preflight'):
+            args['preflight']=run_preflight_checks(preflight_checks)
+
+        clone_count=collections.Counter()
+        for database_name in database:
+            with args['report'].measure('clone_datafiles', database_name):
+                clone_count.update(clone_directory(args['clone_from']+'/'+database_name, args['--datafile-dir']+'/'+database_name, args['--clone-method']))
+        args['report'].settings['cloned_files']=dict(clone_count)
+        args['restart']=True #clones start as restored datafiles do
+        return restore_or_restart_or_create_database(args, database, docker_client)
+    finally:
+        write_run_report(args)
+
+
+def run_refresh(args, docker_client):
+    args['report']=RunReport('refresh')
+    s3connection=None
+    try:
+        check_refresh_params(args)
+        preprocess_refresh_args(args)
+        database=create_database_settings(args)
+        oradock_container=get_running_container(docker_client, args['--container-name'])
+        container_mounts=set(mount.get('Source') for mount in oradock_container.get('Mounts', []))
+        with args['report'].measure('preflight'):
+            for database_name, info in database.items():
+                if info.get('backup_directory') not in container_mounts: #new pieces are cataloged from where the restore mounted its backup files
+                    logging.error('backup directory \'%s\' of database %s is not mounted at container \'%s\'. Please use the backup directory it was restored from' % (info.get('backup_directory'), database_name, args['--container-name']))
+                    sys.exit(-1)
+                info['checkpoint']=read_database_checkpoint(docker_client, oradock_container, args['--oradock-home'], database_name)
+            if args['--s3-bucket'].replace(',-','')!='-':
+                s3connection=acquire_s3conn(args)
+            with args['report'].measure('index_backup_files'):
+                index_refresh_files(args, database, s3connection)
+            check_disk_space(args, database)
+        if len(database)==0:
+            logging.info('all databases of container \'%s\' are up to date' % args['--container-name'])
+            return {}
+
+        if s3connection is not None:
+            with args['report'].measure('download') as phase_info:
+                phase_info['bytes']=download_s3(database, s3connection, args['--s3-access-key'], args['--s3-secret-key'], args['--s3-endpoint'], args['--download-parallel'], args['--download-chunk-size'], args['--cache-dir'])
+        for database_name, info in database.items():
+            with args['report'].measure('change_directory_owner', database_name):
+                change_directory_owner(info.get('backup_directory'), 501, 503)
+
+        logging.info('refreshing databases of container \'%s\'' % args['--container-name'])
+        config_dir=args['--oradock-home']+'/consume/'+args['--container-name']
+        create_directory(config_dir)
+        (database_commands, finish_command)=create_database_commands(args, database, config_dir)
+        monitor_settings=None
+        if args['--monitor-interval']!='0':
+            monitor_settings=(args['--oradock-home'], int(args['--monitor-interval']), args['--progress-file'])
+        process_args=(docker_client, oradock_container, database_commands, finish_command, args['--database-parallel'], args['report'], monitor_settings, config_dir)
+        database_status=call_thread_build(docker_run_databases, process_args, args['--animation'])
+        log_database_status(database_status, config_dir)
+        if args['--cache-dir'] is not None:
+            evict_cache(args['--cache-dir'], int(args['--cache-size'])*1024*1024*1024)
+        return database_status
+    finally:
+        if s3connection is not None:
+            release_s3conn(args, s3connection)
+        write_run_report(args)
+
+
+def get_operation_name(args):
+    if args.get('clone')==True:
+        return 'clone'
+    elif args.get('create')==True:
+        return 'create'
+    elif args.get('restore')==True:
+        return 'restore'
+    return 'restart'
+
+
+def run_operation(args, docker_client): #restore, restart, clone or create database, as chosen by args
+    if args.get('clone')==True:
+        return run_clone(args, docker_client)
+    elif args['restore']==True:
+        return run_restore(args, docker_client)
+    elif args['restart']==True:
+        return run_restart(args, docker_client)
+    return run_create_database(args, docker_client)
+
+
+def provision_container(args, docker_base_url): #provision a single fleet container, returning its status
+    container_status={'container':args['--container-name'], 'operation':get_operation_name(args), 'status':'failed'}
+    start_time=time.time()
+    try:
+        docker_client=Client(base_url=docker_base_url) #docker clients are not shared among threads
+        database_status=run_operation(args, docker_client)
+        if all(status.get('status')=='success' for status in database_status.values()):
+            container_status['status']='success'
+    except SystemExit: #errors are logged before exiting
+        pass
+    except Exception as error: #other containers of the fleet keep going
+        logging.exception('container \'%s\' failed with unexpected error [%s]' % (args['--container-name'], str(error)))
+    container_status['container']=args['--container-name']
+    container_status['elapsed_time']=round(time.time()-start_time, 1)
+    return container_status
+
+
+def run_fleet(args, docker_client):
+    check_positive_number(args['--fleet-parallel'], '--fleet-parallel')
+    fleet_args_list=create_fleet_settings(args)
+    check_fleet_params(fleet_args_list)
+    check_fleet_memory(fleet_args_list)
+
+    logging.info('provisioning %s containers, %s at a time' % (len(fleet_args_list), args['--fleet-parallel']))
+    start_time=time.time()
+    with ThreadPoolExecutor(max_workers=int(args['--fleet-parallel'])) as executor:
+        fleet_status=[execution.result() for execution in [executor.submit(provision_container, fleet_args, docker_socket_url) for fleet_args in fleet_args_list]]
+
+    logging.info('fleet provisioned in %s seconds' % str(round(time.time()-start_time, 1)))
+    for container_status in fleet_status:
+        logging.info('  %-30s %-8s %-8s %8s seconds' % (container_status.get('container'), container_status.get('operation'), container_status.get('status'), container_status.get('elapsed_time')))
+    if any(container_status.get('status')!='success' for container_status in fleet_status):
+        logging.error('one or more containers failed. Please check the log above')
+        sys.exit(-1)
+
+
+def run_status(args, docker_client): #readiness of each database of a container
+    oradock_container=get_running_container(docker_client, args['CONTAINER_NAME'])
+    status_output=docker_exec_output(docker_client, oradock_container, '/bin/bash '+ args['--oradock-home'].rstrip('/') +'/database/status_database.sh')
+    database_status=[line.strip().split('|')[1:] for line in status_output.split('\n') if line.startswith('ORADOCK_READY|') and len(line.strip().split('|'))==6]
+    if len(database_status)==0:
+        logging.warn('there are no databases at container \'%s\'' % args['CONTAINER_NAME'])
+        return database_status
+
+    logging.info('  %-20s %-10s %-10s %-10s %s' % ('database', 'instance', 'listener', 'startup', 'startup seconds'))
+    for database, instance_status, listener_status, startup_status, startup_time in database_status:
+        logging.info('  %-20s %-10s %-10s %-10s %s' % (database, instance_status, 'registered' if listener_status=='Y' else '-', startup_status, startup_time))
+    not_ready=[status[0] for status in database_status if status[1]!='OPEN' or status[2]!='Y']
+    if len(not_ready)>0:
+        logging.error('databases not ready: %s' % ', '.join(not_ready))
+        sys.exit(-1)
+    logging.info('all databases of container \'%s\' are ready' % args['CONTAINER_NAME'])
+    return database_status
+
+
+## daemon functions
+
+
+job_history=1000 #finished jobs kept by the daemon to show their status
+daemon_poll_interval=5 #seconds between job status checks of the cli
+daemon_path_options=['MANIFEST', '--oradock-home', '--oinstall-dir', '--dockerfile-template', '--backup-directory', '--datafile-dir', '--clone-dir', '--cache-dir', '--progress-file', '--report-file', '--prometheus-file']
+
+class ConnectionPool(object): #connections kept open by the daemon, each one used by a single job at a time
+    def __init__(self, create_connection):
+        self.create_connection=create_connection
+        self.idle_connections=collections.defaultdict(queue.LifoQueue)
+        self.lock=threading.Lock()
+
+    def acquire(self, *connection_key):
+        with self.lock:
+            idle_connections=self.idle_connections[connection_key]
+        try:
+            return idle_connections.get_nowait()
+        except queue.Empty:
+            return self.create_connection(*connection_key)
+
+    def release(self, connection, *connection_key):
+        with self.lock:
+            self.idle_connections[connection_key].put(connection)
+
+
+class JobQueue(object): #restore, restart and create database jobs, started in order while there are free slots and memory
+    def __init__(self, memory_limit):
+        self.jobs=collections.OrderedDict()
+        self.memory_limit=memory_limit
+        self.memory_in_use=0
+        self.last_job_id=0
+        self.condition=threading.Condition()
+
+    def submit(self, job_args):
+        job_memory=sum(int(memory) for memory in str(job_args.get('MEMORY') or '0').split(','))
+        if job_memory > self.memory_limit:
+            raise ValueError('job needs %s%% of memory, but the daemon memory limit is %s%%' % (job_memory, self.memory_limit))
+        with self.condition:
+            self.last_job_id+=1
+            job={'id':str(self.last_job_id),
+                 'operation':get_operation_name(job_args),
+                 'database':job_args.get('DATABASE'),
+                 'memory':job_memory,
+                 'state':'queued',
+                 'queued_at':time.time(),
+                 'started_at':None,
+                 'finished_at':None,
+                 'database_status':None,
+                 'args':job_args}
+            self.jobs[job['id']]=job
+            finished_jobs=[job_id for job_id, each_job in self.jobs.items() if each_job.get('finished_at') is not None]
+            for job_id in finished_jobs[:max(0, len(finished_jobs)-job_history)]:
+                del self.jobs[job_id]
+            self.condition.notify_all()
+        return job
+
+    def next_job(self): #waits for the first queued job whose memory is free
+        with self.condition:
+            while True:
+                for job in self.jobs.values():
+                    if job.get('state')=='queued' and self.memory_in_use+job.get('memory') <= self.memory_limit:
+                        job['state']='running'
+                        job['started_at']=time.time()
+                        self.memory_in_use+=job.get('memory')
+                        return job
+                self.condition.wait()
+
+    def finish_job(self, job, state, database_status):
+        with self.condition:
+            job['state']=state
+            job['finished_at']=time.time()
+            job['database_status']=database_status
+            self.memory_in_use-=job.get('memory')
+            self.condition.notify_all()
+
+    def list_jobs(self): #snapshot of the jobs, since submit removes old jobs while the api reads them
+        with self.condition:
+            return list(self.jobs.values())
+
+    def get_job(self, job_id):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def describe(self, job): #job status and timings, as sent by the daemon api
+        with self.condition:
+            job_status=dict((key, value) for key, value in job.items() if key!='args')
+        job_status['container']=job.get('args').get('--container-name')
+        job_status['queue_time']=round((job_status.get('started_at') or time.time())-job_status.get('queued_at'), 1)
+        job_status['elapsed_time']=None if job_status.get('started_at') is None else round((job_status.get('finished_at') or time.time())-job_status.get('started_at'), 1)
+        for time_key in ['queued_at', 'started_at', 'finished_at']:
+            if job_status.get(time_key) is not None:
+                job_status[time_key]=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(job_status.get(time_key)))
+        report=job.get('args').get('report')
+        job_status['report']=None if report is None else report.to_dict()
+        return job_status
+
+
+def run_job_worker(job_queue, docker_pool, docker_base_url): #each worker runs one job at a time, with a docker client from the pool
+    while True:
+        job=job_queue.next_job()
+        logging.info('job %s started: %s of %s' % (job.get('id'), job.get('operation'), job.get('database')))
+        database_status=None
+        job_state='failed'
+        docker_client=docker_pool.acquire(docker_base_url)
+        try:
+            database_status=run_operation(job.get('args'), docker_client)
+            if all(status.get('status')=='success' for status in database_status.values()):
+                job_state='success'
+        except SystemExit: #errors are logged before exiting
+            pass
+        except Exception as error:
+            logging.error('job %s failed with unexpected error [%s]' % (job.get('id'), str(error)))
+        finally:
+            docker_pool.release(docker_client, docker_base_url)
+            job_queue.finish_job(job, job_state, database_status)
+        logging.info('job %s finished with status \'%s\'' % (job.get('id'), job_state))
+
+
+class DaemonRequestHandler(http.server.BaseHTTPRequestHandler): #json api of the daemon: POST /jobs, GET /jobs and GET /jobs/JOB_ID
+    def send_json(self, status_code, content):
+        response=json.dumps(content).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self):
+        job_queue=self.server.job_queue
+        path=self.path.rstrip('/').split('/')
+        job=job_queue.get_job(path[2]) if len(path)==3 and path[1]=='jobs' else None
+        if path==['', 'jobs']:
+            self.send_json(200, [job_queue.describe(each_job) for each_job in job_queue.list_jobs()])
+        elif job is not None:
+            self.send_json(200, job_queue.describe(job))
+        else:
+            self.send_json(404, {'error':'not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/')!='/jobs':
+            self.send_json(404, {'error':'not found'})
+            return
+        try:
+            job_args=json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            if not (job_args.get('restore')==True or job_args.get('restart')==True or job_args.get('clone')==True or (job_args.get('create')==True and job_args.get('database')==True)):
+                raise ValueError('only restore, restart, clone and create database jobs are accepted')
+            job_args.update({'--daemon-socket':None, '--animation':'0', 's3_pool':self.server.s3_pool}) #jobs run inside the daemon, without terminal animations
+            job=self.server.job_queue.submit(job_args)
+        except (ValueError, AttributeError) as error:
+            self.send_json(400, {'error':str(error)})
+            return
+        logging.info('job %s queued: %s of %s' % (job.get('id'), job.get('operation'), job.get('database')))
+        self.send_json(202, self.server.job_queue.describe(job))
+
+    def log_message(self, format, *args): #unix socket clients have no address
+        logging.debug('daemon api: '+format % args)
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads=True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection): #http connection to the daemon unix socket
+    def __init__(self, socket_path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path=socket_path
+
+    def connect(self):
+        self.sock=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def daemon_request(daemon_socket, method, path, content=None): #returns http status and json content of a daemon api request
+    daemon_connection=UnixHTTPConnection(daemon_socket)
+    try:
+        body=None if content is None else json.dumps(content)
+        daemon_connection.request(method, path, body=body, headers={'Content-Type':'application/json'})
+        response=daemon_connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    except (OSError, http.client.HTTPException, ValueError) as error:
+        logging.error('could not talk to oradock daemon at \'%s\' [%s]' % (daemon_socket, str(error)))
+        sys.exit(-1)
+    finally:
+        daemon_connection.close()
+
+
+def check_daemon_params(args):
+    if args['--daemon-socket'] is None:
+        logging.error('option \'--daemon-socket\' is required to run oradock daemon')
+        sys.exit(-1)
+    check_positive_number(args['--job-parallel'], '--job-parallel')
+    check_positive_number(args['--memory-limit'], '--memory-limit')
+    if not args['--download-bandwidth'].isdigit():
+        logging.error('option \'--download-bandwidth\' must be a number of mb/s')
+        sys.exit(-1)
+    if os.path.exists(args['--daemon-socket']): #socket left by a daemon that is not running anymore is removed
+        daemon_connection=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            daemon_connection.connect(args['--daemon-socket'])
+            logging.error('oradock daemon is already running at \'%s\'' % args['--daemon-socket'])
+            sys.exit(-1)
+        except OSError:
+            os.remove(args['--daemon-socket'])
+        finally:
+            daemon_connection.close()
+
+
+def run_daemon(args, docker_client):
+    global download_limiter
+    check_daemon_params(args)
+    if args['--download-bandwidth']!='0':
+        download_limiter=BandwidthLimiter(int(args['--download-bandwidth'])*1024*1024)
+
+    docker_pool=ConnectionPool(lambda base_url: Client(base_url=base_url))
+    docker_pool.release(docker_client, docker_socket_url)
+    for worker_number in range(int(args['--job-parallel'])-1): #docker clients are opened before the first job
+        docker_pool.release(Client(base_url=docker_socket_url), docker_socket_url)
+
+    job_queue=JobQueue(int(args['--memory-limit']))
+    for worker_number in range(int(args['--job-parallel'])):
+        worker=threading.Thread(name='oradock_job_worker_%s' % worker_number, target=run_job_worker, args=(job_queue, docker_pool, docker_socket_url))
+        worker.daemon=True
+        worker.start()
+
+    daemon_server=DaemonServer(args['--daemon-socket'], DaemonRequestHandler)
+    daemon_server.job_queue=job_queue
+    daemon_server.s3_pool=ConnectionPool(create_s3conn)
+    logging.info('oradock daemon listening at \'%s\' (%s jobs at a time, %s%% of memory)' % (args['--daemon-socket'], args['--job-parallel'], args['--memory-limit']))
+    try:
+        daemon_server.serve_forever()
+    finally:
+        daemon_server.server_close()
+        os.remove(args['--daemon-socket'])
+
+
+def resolve_job_paths(job_args): #daemon runs jobs from its own working directory, so relative paths are made absolute by the cli
+    for option in daemon_path_options:
+        if job_args.get(option) is None:
+            continue
+        job_args[option]=','.join(path if path=='-' or path.startswith('$') else os.path.abspath(path) for path in job_args[option].split(','))
+
+
+def submit_daemon_job(args): #the daemon runs the operation, and the cli waits for it to finish
+    job_args=dict((key, value) for key, value in args.items() if key!='report')
+    resolve_job_paths(job_args)
+    (status_code, job)=daemon_request(args['--daemon-socket'], 'POST', '/jobs', job_args)
+    if status_code!=202:
+        logging.error('oradock daemon refused the job [%s]' % job.get('error'))
+        sys.exit(-1)
+    job_id=job.get('id')
+    logging.info('job %s queued at oradock daemon' % job_id)
+
+    job_state=job.get('state')
+    reported_phases=0
+    while job.get('state') in ('queued', 'running'):
+        time.sleep(daemon_poll_interval)
+        (status_code, job)=daemon_request(args['--daemon-socket'], 'GET', '/jobs/'+job_id)
+        if status_code!=200:
+            logging.error('job %s is not known by oradock daemon anymore' % job_id)
+            sys.exit(-1)
+        if job.get('state')!=job_state:
+            job_state=job.get('state')
+            logging.info('job %s is %s' % (job.get('id'), job_state))
+        phases=(job.get('report') or {}).get('phases', [])
+        for phase_info in phases[reported_phases:]:
+            logging.info('phase \'%s\'%s finished in %s seconds' % (phase_info.get('phase'), '' if phase_info.get('database') is None else ' of database '+phase_info.get('database'), phase_info.get('elapsed_time')))
+        reported_phases=len(phases)
+
+    for database, status in (job.get('database_status') or {}).items():
+        logging.info('database %s %s in %s seconds' % (database, 'finished' if status.get('status')=='success' else 'failed', status.get('elapsed_time')))
+    if job.get('state')!='success':
+        logging.error('job %s failed. Please check the oradock daemon log' % job.get('id'))
+        sys.exit(-1)
+    return job
+
+
+def run_jobs(args): #status of the jobs of the daemon
+    if args['--daemon-socket'] is None:
+        logging.error('option \'--daemon-socket\' is required to show daemon jobs')
+        sys.exit(-1)
+    if args['JOB_ID'] is not None:
+        (status_code, job)=daemon_request(args['--daemon-socket'], 'GET', '/jobs/'+args['JOB_ID'])
+        if status_code!=200:
+            logging.error('job %s does not exist' % args['JOB_ID'])
+            sys.exit(-1)
+        job_list=[job]
+    else:
+        (status_code, job_list)=daemon_request(args['--daemon-socket'], 'GET', '/jobs')
+
+    logging.info('  %-6s %-8s %-30s %-8s %12s %12s' % ('job', 'operation', 'container', 'state', 'queue time', 'elapsed time'))
+    for job in job_list:
+        logging.info('  %-6s %-8s %-30s %-8s %12s %12s' % (job.get('id'), job.get('operation'), job.get('container'), job.get('state'), job.get('queue_time'), job.get('elapsed_time')))
+    if args['JOB_ID'] is not None:
+        for phase_info in (job_list[0].get('report') or {}).get('phases', []):
+            logging.info('    %-28s %-12s %10s seconds %s' % (phase_info.get('phase'), phase_info.get('database') or '', phase_info.get('elapsed_time'), '' if phase_info.get('throughput_mb_s') is None else str(phase_info.get('throughput_mb_s'))+' mb/s'))
+    return job_list
+
+
 ## main
 
 
@@ -694,24 +3045,24 @@ if __name__ == '__main__':
     arguments = docopt(__doc__, version=__version__)
     #print(arguments)
     set_log(arguments['--log-level'])
-    docker_client=Client(base_url='unix://var/run/docker.sock') 
+    docker_client=Client(base_url=docker_socket_url) 
  
     try:
+        #restore, restart and create database are sent to the daemon when there is one
+        if arguments['--daemon-socket'] is not None and (arguments['restore']==True or arguments['restart']==True or arguments['clone']==True or (arguments['create']==True and arguments['database']==True)):
+            submit_daemon_job(arguments)
+
         #call for restore option
-        if arguments['restore']==True:
-            check_restore_params(arguments, docker_client)
-            preprocess_restore_args(arguments)
-            database=create_database_settings(arguments)
-            if arguments['--s3-bucket']!='-':
-                download_s3(database, arguments['--backup-directory'], arguments['--s3-access-key'], arguments['--s3-secret-key'])
-            restore_or_restart_or_create_database(arguments, database, docker_client)
+        elif arguments['restore']==True:
+            exit_on_database_failure(run_restore(arguments, docker_client))
 
         #call for restart option
         elif arguments['restart']==True:
-            check_restart_params(arguments, docker_client)
-            preprocess_restart_args(arguments)
-            database=create_database_settings(arguments)
-            restore_or_restart_or_create_database(arguments, database, docker_client)
+            exit_on_database_failure(run_restart(arguments, docker_client))
+
+        #call for clone option
+        elif arguments['clone']==True:
+            exit_on_database_failure(run_clone(arguments, docker_client))
 
         #call for create image/database option
         elif arguments['create']==True:
@@ -720,10 +3071,25 @@ if __name__ == '__main__':
                 preprocess_create_image_args(arguments)
                 create_image(arguments, docker_client)
             elif arguments['database']==True:
-                check_create_database_params(arguments, docker_client)
-                preprocess_create_database_args(arguments)
-                database=create_database_settings(arguments)
-                restore_or_restart_or_create_database(arguments, database, docker_client)
+                exit_on_database_failure(run_create_database(arguments, docker_client))
+
+        #call for refresh option
+        elif arguments['refresh']==True:
+            exit_on_database_failure(run_refresh(arguments, docker_client))
+
+        #call for status option
+        elif arguments['status']==True:
+            run_status(arguments, docker_client)
+
+        #call for fleet option
+        elif arguments['fleet']==True:
+            run_fleet(arguments, docker_client)
+
+        #call for daemon options
+        elif arguments['daemon']==True:
+            run_daemon(arguments, docker_client)
+        elif arguments['jobs']==True:
+            run_jobs(arguments)
 
     except KeyboardInterrupt as error:
         print('\nSee ya! ')
@@ -0,0 +1,540 @@
+#!/usr/bin/env python
+"""
+
+Benchmark suite of oradock own overhead. Backup files are downloaded from a local s3 stand-in serving synthetic backup sets, and docker output comes from a fake docker client, so results only change when oradock does.
+For more information, please visit https://github.com/rafaelmariotti/oradock
+
+Usage:
+    oradock_benchmark.py [options]
+    oradock_benchmark.py (-h | --help)
+
+Phases:
+    download
+                                        List the synthetic backup set and download it with download_s3, in byte ranges.
+    change_owner
+                                        Change owner of a directory tree with change_directory_owner.
+    backup_index
+                                        Group a synthetic backup listing in backup sets and select the pieces to restore.
+    build_log
+                                        Stream a docker build context and parse its json events, as create image does.
+    exec_log
+                                        Read database script output from an exec session into the database log, as restore does.
+
+Options:
+    -w WORK_DIR, --work-dir=WORK_DIR
+                                        Directory where synthetic files are created and backup files are downloaded [default: /tmp/oradock_benchmark].
+    --phases=PHASES
+                                        Phases to run, separated by comma [default: download,change_owner,backup_index,build_log,exec_log].
+    -r REPEAT, --repeat=REPEAT
+                                        Measured runs of each phase. Latency percentiles are taken among them [default: 5].
+    --warmup=WARMUP
+                                        Runs of each phase before measuring [default: 1].
+    --seed=SEED
+                                        Seed of the synthetic data, so each run gets the same files and output [default: 1].
+    -l LOG_LEVEL, --log-level=LOG_LEVEL
+                                        Log level to set. Oradock messages of each phase are shown from info on [default: warning].
+
+Synthetic data options:
+    -n PIECE_COUNT, --piece-count=PIECE_COUNT
+                                        Number of backup pieces served by the s3 stand-in [default: 16].
+    -z PIECE_SIZE, --piece-size=PIECE_SIZE
+                                        Size in mb of each backup piece, or sizes separated by comma used in turn [default: 32].
+    --index-pieces=INDEX_PIECES
+                                        Number of backup pieces of the synthetic listing of the backup index phase [default: 50000].
+    --owner-files=OWNER_FILES
+                                        Number of files of the directory tree of the change owner phase [default: 20000].
+    --log-lines=LOG_LINES
+                                        Number of lines of docker build and exec output [default: 200000].
+
+Download options:
+    -T DOWNLOAD_PARALLEL, --download-parallel=DOWNLOAD_PARALLEL
+                                        Number of byte ranges downloaded at the same time [default: 4].
+    -Z CHUNK_SIZE, --download-chunk-size=CHUNK_SIZE
+                                        Size in mb of each byte range [default: 8].
+
+Baseline options:
+    -o RESULT_FILE, --output=RESULT_FILE
+                                        JSON file to save the results.
+    -b BASELINE_FILE, --baseline=BASELINE_FILE
+                                        Results of a previous run to compare with. A phase slower than its baseline by more than the tolerance is a regression, and the benchmark fails.
+    --save-baseline
+                                        Save the results as the baseline file instead of comparing with it.
+    -t TOLERANCE, --tolerance=TOLERANCE
+                                        Percent of throughput, latency or peak memory a phase may lose against its baseline [default: 15].
+"""
+
+__author__  = 'Rafael dos Santos Mariotti <rafael.s.mariotti@gmail.com>'
+__version__ = 'oradock v1.0'
+
+try:
+    import logging
+    import sys
+    import os
+    import time
+    import math
+    import json
+    import random
+    import shutil
+    import hashlib
+    import platform
+    import resource
+    import threading
+    import socketserver
+    import http.server
+    from urllib.parse import urlparse, parse_qs
+    from xml.sax.saxutils import escape
+    from docopt import docopt
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__))) #oradock.py is next to this script
+    import oradock
+except ImportError as error: #check for all modules
+    print('ERROR: Could not find module \'%s\'' % error.name)
+    sys.exit(-1)
+
+
+## s3 stand-in functions
+
+
+synthetic_block_size=1024*1024 #each piece repeats its own block of random bytes
+synthetic_start_time=1767225600 #listing time of the first piece, so backup sets are the same on every run
+
+class SyntheticPiece(object): #backup piece content generated from its seed instead of stored
+    def __init__(self, seed, index, size):
+        block_random=random.Random('%s-%s' % (seed, index))
+        self.block=block_random.getrandbits(8*synthetic_block_size).to_bytes(synthetic_block_size, 'little')
+        self.size=size
+        self.modified=time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(synthetic_start_time+index*60))
+        checksum=hashlib.md5()
+        for data in self.read(0, size-1):
+            checksum.update(data)
+        self.etag='"%s"' % checksum.hexdigest()
+
+    def read(self, start, end): #yields the bytes from start to end, one block at most at a time
+        position=start
+        while position<=end:
+            offset=position % synthetic_block_size
+            length=min(synthetic_block_size-offset, end-position+1)
+            yield self.block[offset:offset+length]
+            position+=length
+
+
+def create_synthetic_pieces(seed, piece_count, piece_sizes_mb): #synthetic backup set, with spfile and controlfile as its last pieces
+    pieces={}
+    for index in range(piece_count):
+        piece_name='backup/piece_%05d.bkp' % index
+        if index==piece_count-2:
+            piece_name='backup/spfile.bkp'
+        elif index==piece_count-1:
+            piece_name='backup/controlfile.bkp'
+        pieces[piece_name]=SyntheticPiece(seed, index, max(1, int(float(piece_sizes_mb[index % len(piece_sizes_mb)])*1024*1024)))
+    return pieces
+
+
+class S3StandInHandler(http.server.BaseHTTPRequestHandler): #path style bucket listing, HEAD and ranged GET of the synthetic pieces
+    protocol_version='HTTP/1.1' #boto keeps its connections open between requests
+
+    def log_message(self, format, *args):
+        logging.debug('s3 stand-in: '+format % args)
+
+    def do_HEAD(self):
+        self.handle_s3_request(False)
+
+    def do_GET(self):
+        self.handle_s3_request(True)
+
+    def handle_s3_request(self, send_body):
+        request_url=urlparse(self.path)
+        (bucket_name, separator, key_name)=request_url.path.lstrip('/').partition('/')
+        if bucket_name!=self.server.bucket_name:
+            self.send_content(404, b'<Error><Code>NoSuchBucket</Code></Error>', send_body)
+        elif key_name=='':
+            self.send_content(200, self.list_bucket(parse_qs(request_url.query).get('prefix', [''])[0]), send_body)
+        elif key_name not in self.server.pieces:
+            self.send_content(404, b'<Error><Code>NoSuchKey</Code></Error>', send_body)
+        else:
+            self.send_piece(self.server.pieces[key_name], send_body)
+
+    def list_bucket(self, prefix):
+        contents=['<Contents><Key>%s</Key><LastModified>%s</LastModified><ETag>%s</ETag><Size>%s</Size><StorageClass>STANDARD</StorageClass></Contents>' % (escape(key_name), piece.modified, escape(piece.etag), piece.size)
+                  for key_name, piece in sorted(self.server.pieces.items()) if key_name.startswith(prefix)]
+        return ('<?xml version="1.0" encoding="UTF-8"?><ListBucketResult><Name>%s</Name><Prefix>%s</Prefix><IsTruncated>false</IsTruncated>%s</ListBucketResult>' % (self.server.bucket_name, escape(prefix), ''.join(contents))).encode('utf-8')
+
+    def send_content(self, status, content, send_body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(content)
+
+    def send_piece(self, piece, send_body):
+        (start, end)=(0, piece.size-1)
+        byte_range=self.headers.get('Range')
+        if byte_range is not None and byte_range.startswith('bytes='):
+            (range_start, range_end)=byte_range[len('bytes='):].split('-')
+            (start, end)=(int(range_start), min(int(range_end or piece.size-1), piece.size-1))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %s-%s/%s' % (start, end, piece.size))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end-start+1))
+        self.send_header('ETag', piece.etag)
+        self.send_header('Last-Modified', time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.strptime(piece.modified[:19], '%Y-%m-%dT%H:%M:%S')))
+        self.end_headers()
+        if send_body:
+            for data in piece.read(start, end):
+                self.wfile.write(data)
+
+
+class S3StandInServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads=True
+    bucket_name='oradock-benchmark'
+
+
+def start_s3_stand_in(pieces): #listens on a free local port, returning the server and its endpoint
+    s3_server=S3StandInServer(('127.0.0.1', 0), S3StandInHandler)
+    s3_server.pieces=pieces
+    server_thread=threading.Thread(name='s3_stand_in', target=s3_server.serve_forever)
+    server_thread.daemon=True
+    server_thread.start()
+    return s3_server, 'http://127.0.0.1:%s' % s3_server.server_address[1]
+
+
+## fake docker functions
+
+
+class FakeDockerClient(object): #docker client methods used by create image and database scripts, replaying synthetic output
+    base_url='unix://fake-docker.sock'
+
+    def __init__(self, seed, log_lines, chunk_size=4096):
+        output_random=random.Random(seed)
+        build_lines=[]
+        exec_lines=[]
+        for line_number in range(log_lines):
+            if line_number % 50==0:
+                build_lines.append(json.dumps({'stream':'Step %s/%s : RUN /bin/bash /tmp/config_files/step_%s.sh\n' % (line_number//50+1, log_lines//50+1, line_number//50)}))
+                exec_lines.append('ORADOCK_PHASE|benchmark|restore_database|%s' % round(output_random.uniform(0, 60), 3))
+            elif line_number % 7==0:
+                build_lines.append(json.dumps({'status':'Downloading', 'progressDetail':{'current':line_number, 'total':log_lines}, 'id':'%012x' % output_random.getrandbits(48)}))
+                exec_lines.append('channel channel%s: restoring datafile %05d to /data/benchmark/datafile/data_%05d.dbf' % (line_number % 8+1, line_number, line_number))
+            else:
+                build_lines.append(json.dumps({'stream':' ---> Running in %012x\n' % output_random.getrandbits(48)}))
+                exec_lines.append('channel channel%s: reading from backup piece /backup/benchmark/piece_%05d.bkp' % (line_number % 8+1, line_number))
+        self.build_output=('\r\n'.join(build_lines)+'\r\n').encode('utf-8')
+        self.exec_output=('\n'.join(exec_lines)+'\n').encode('utf-8')
+        self.chunk_size=chunk_size #chunks split lines, as docker streams do
+        self.context_bytes=0
+
+    def stream_chunks(self, output):
+        for start in range(0, len(output), self.chunk_size):
+            yield output[start:start+self.chunk_size]
+
+    def build(self, fileobj, **build_args):
+        self.context_bytes=sum(len(context_block) for context_block in fileobj) #the build context is read before any output, as the docker daemon does
+        return self.stream_chunks(self.build_output)
+
+    def exec_create(self, container, cmd, **exec_args):
+        return {'Id':'fake-exec'}
+
+    def exec_start(self, exec_id, **exec_args):
+        return self.stream_chunks(self.exec_output)
+
+    def exec_inspect(self, exec_id):
+        return {'ExitCode':0}
+
+
+## resource sampling functions
+
+
+sample_interval=0.01 #seconds between samples of memory, threads and processes
+
+def read_process_status(): #rss in kb, threads of this process and its child processes, from /proc
+    process_status={'rss_kb':0, 'threads':threading.active_count(), 'processes':1}
+    try:
+        with open('/proc/self/status', 'r') as status_file:
+            for status_line in status_file:
+                if status_line.startswith('VmRSS:'):
+                    process_status['rss_kb']=int(status_line.split()[1])
+                elif status_line.startswith('Threads:'):
+                    process_status['threads']=int(status_line.split()[1])
+        for task_id in os.listdir('/proc/self/task'):
+            with open('/proc/self/task/%s/children' % task_id, 'r') as children_file:
+                process_status['processes']+=len(children_file.read().split())
+    except OSError: #no procfs, only the peak rss of the whole run is known
+        process_status['rss_kb']=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return process_status
+
+
+class ResourceSampler(object): #peak rss, threads and processes while a phase runs
+    def __enter__(self):
+        self.peak=read_process_status()
+        self.stop_event=threading.Event()
+        self.sampler_thread=threading.Thread(name='resource_sampler', target=self.sample)
+        self.sampler_thread.daemon=True
+        self.sampler_thread.start()
+        return self
+
+    def sample(self):
+        while not self.stop_event.wait(sample_interval):
+            process_status=read_process_status()
+            for status_name, status_value in process_status.items():
+                self.peak[status_name]=max(self.peak[status_name], status_value)
+
+    def __exit__(self, *exception_info):
+        self.stop_event.set()
+        self.sampler_thread.join()
+        return False
+
+
+## benchmark phases
+
+
+def prepare_owner_tree(owner_dir, file_count): #directories of 100 empty files each
+    if os.path.isdir(owner_dir) and sum(len(files) for root, directories, files in os.walk(owner_dir))==file_count:
+        return
+    shutil.rmtree(owner_dir, ignore_errors=True)
+    for file_number in range(file_count):
+        file_dir='%s/dir_%05d' % (owner_dir, file_number//100)
+        if file_number % 100==0:
+            os.makedirs(file_dir)
+        open('%s/file_%05d' % (file_dir, file_number), 'w').close()
+
+
+def create_synthetic_index(seed, piece_count): #backup listing of daily backup sets of a few directories, with archived logs between them
+    index_random=random.Random(seed)
+    pieces=[]
+    for piece_number in range(piece_count):
+        backup_day=piece_number//1000
+        piece_name='piece_%07d.bkp' % piece_number
+        if piece_number % 1000==998:
+            piece_name='spfile_%05d.bkp' % backup_day
+        elif piece_number % 1000==999:
+            piece_name='controlfile_%05d.bkp' % backup_day
+        pieces.append({'key':'backup/'+piece_name, 'name':piece_name, 'directory':'level%s' % (backup_day % 2), 'size':index_random.randint(1, 1024)*1024*1024, 'etag':None, 'modified':synthetic_start_time+backup_day*86400+piece_number % 1000})
+    return {'source':'s3://oradock-benchmark/backup', 'listed_at':synthetic_start_time, 'pieces':pieces}
+
+
+def run_download(settings, phase_data): #returns bytes downloaded
+    backup_dir=settings.get('work_dir')+'/backup'
+    shutil.rmtree(backup_dir, ignore_errors=True)
+    oradock.create_directory(backup_dir)
+    info={'s3_bucket':'s3://%s/backup' % S3StandInServer.bucket_name, 'backup_directory':backup_dir}
+    s3connection=oradock.create_s3conn('benchmark', 'benchmark', phase_data.get('s3_endpoint'))
+    try:
+        info['backup_index']=oradock.list_backup_pieces(info, s3connection, 0)
+        return oradock.download_s3({'benchmark':info}, s3connection, 'benchmark', 'benchmark', phase_data.get('s3_endpoint'), settings.get('download_parallel'), settings.get('download_chunk_size'))
+    finally:
+        s3connection.close()
+
+
+def run_change_owner(settings, phase_data): #returns entries checked, with owners swapped on every run when running as root
+    phase_data['owner_run']=phase_data.get('owner_run', 0)+1
+    (uid, gid)=(os.getuid(), os.getgid())
+    if uid==0 and phase_data.get('owner_run') % 2==1:
+        (uid, gid)=(501, 503)
+    oradock.change_directory_owner(settings.get('work_dir')+'/owner', uid, gid)
+    return settings.get('owner_files')
+
+
+def run_backup_index(settings, phase_data): #returns backup pieces indexed
+    oradock.select_backup_pieces(phase_data.get('backup_index'), 'spfile*.bkp', 'controlfile*.bkp', None)
+    return len(phase_data.get('backup_index').get('pieces'))
+
+
+def run_build_log(settings, phase_data): #returns lines of docker build output
+    oradock.call_thread_build(oradock.docker_build, (phase_data.get('docker_client'), 'oradock-benchmark', [('Dockerfile', settings.get('work_dir')+'/Dockerfile')]), '0')
+    return settings.get('log_lines')
+
+
+def run_exec_log(settings, phase_data): #returns lines of database script output
+    process_args=(phase_data.get('docker_client'), {'Id':'fake-container'}, [('benchmark', 'restore_database.sh')], None, '1', oradock.RunReport('benchmark'), None, settings.get('work_dir'))
+    oradock.call_thread_build(oradock.docker_run_databases, process_args, '0')
+    return settings.get('log_lines')
+
+
+benchmark_phases={'download':(run_download, 'mb'),
+                  'change_owner':(run_change_owner, 'entries'),
+                  'backup_index':(run_backup_index, 'pieces'),
+                  'build_log':(run_build_log, 'lines'),
+                  'exec_log':(run_exec_log, 'lines')}
+
+
+def prepare_phase_data(settings): #synthetic data shared by all runs of the phases, created before any of them is measured
+    phase_data={}
+    phases=settings.get('phases')
+    oradock.create_directory(settings.get('work_dir'))
+    if 'download' in phases:
+        logging.info('generating %s synthetic backup pieces' % settings.get('piece_count'))
+        (phase_data['s3_server'], phase_data['s3_endpoint'])=start_s3_stand_in(create_synthetic_pieces(settings.get('seed'), settings.get('piece_count'), settings.get('piece_size')))
+    if 'change_owner' in phases:
+        logging.info('creating directory tree of %s files' % settings.get('owner_files'))
+        prepare_owner_tree(settings.get('work_dir')+'/owner', settings.get('owner_files'))
+    if 'backup_index' in phases:
+        phase_data['backup_index']=create_synthetic_index(settings.get('seed'), settings.get('index_pieces'))
+    if 'build_log' in phases or 'exec_log' in phases:
+        phase_data['docker_client']=FakeDockerClient(settings.get('seed'), settings.get('log_lines'))
+        with open(settings.get('work_dir')+'/Dockerfile', 'w') as dockerfile:
+            dockerfile.write('FROM oraclelinux:6\n' + ''.join('RUN /bin/bash /tmp/config_files/step_%s.sh\n' % step for step in range(settings.get('log_lines')//50+1)))
+    return phase_data
+
+
+def compute_percentile(values, percent): #nearest rank
+    sorted_values=sorted(values)
+    return sorted_values[max(0, int(math.ceil(percent/100.0*len(sorted_values)))-1)]
+
+
+def run_phase(phase, settings, phase_data):
+    (phase_function, unit)=benchmark_phases.get(phase)
+    for warmup_number in range(settings.get('warmup')):
+        phase_function(settings, phase_data)
+
+    latencies=[]
+    amount=0
+    with ResourceSampler() as resource_sampler:
+        for repeat_number in range(settings.get('repeat')):
+            start_time=time.time()
+            amount+=phase_function(settings, phase_data)
+            latencies.append(time.time()-start_time)
+    if unit=='mb':
+        amount=amount/(1024*1024)
+    return {'unit':unit,
+            'throughput':round(amount/max(sum(latencies), 0.000001), 2),
+            'latency_p50':round(compute_percentile(latencies, 50), 4),
+            'latency_p90':round(compute_percentile(latencies, 90), 4),
+            'latency_p99':round(compute_percentile(latencies, 99), 4),
+            'peak_rss_mb':round(resource_sampler.peak.get('rss_kb')/1024, 1),
+            'peak_threads':resource_sampler.peak.get('threads'),
+            'peak_processes':resource_sampler.peak.get('processes')}
+
+
+def run_benchmark(settings):
+    phase_data=prepare_phase_data(settings)
+    results={'version':__version__,
+             'started_at':time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime()),
+             'host':{'python':platform.python_version(), 'cpus':os.cpu_count(), 'platform':platform.platform()},
+             'settings':settings,
+             'phases':{}}
+    try:
+        for phase in settings.get('phases'):
+            logging.info('running phase \'%s\' %s times' % (phase, settings.get('repeat')))
+            results['phases'][phase]=run_phase(phase, settings, phase_data)
+    finally:
+        if phase_data.get('s3_server') is not None:
+            phase_data['s3_server'].shutdown()
+            phase_data['s3_server'].server_close()
+    return results
+
+
+## baseline functions
+
+
+def compare_with_baseline(results, baseline, tolerance): #returns regressions of each phase, as (phase, metric, baseline value, result value)
+    if baseline.get('settings')!=results.get('settings'):
+        logging.warn('baseline was measured with other settings, so results may not be comparable')
+    regressions=[]
+    for phase, phase_result in results.get('phases').items():
+        phase_baseline=baseline.get('phases', {}).get(phase)
+        if phase_baseline is None:
+            logging.warn('there is no baseline of phase \'%s\'' % phase)
+            continue
+        if phase_result.get('throughput') < phase_baseline.get('throughput')*(1-tolerance/100.0):
+            regressions.append((phase, 'throughput', phase_baseline.get('throughput'), phase_result.get('throughput')))
+        for metric in ['latency_p50', 'latency_p90', 'peak_rss_mb']: #bigger is worse
+            if phase_result.get(metric) > phase_baseline.get(metric)*(1+tolerance/100.0):
+                regressions.append((phase, metric, phase_baseline.get(metric), phase_result.get(metric)))
+    return regressions
+
+
+def print_results(results, baseline):
+    print('  %-14s %14s %-8s %10s %10s %10s %9s %8s %9s %9s' % ('phase', 'throughput', 'unit/s', 'p50 s', 'p90 s', 'p99 s', 'rss mb', 'threads', 'processes', 'baseline'))
+    for phase, phase_result in results.get('phases').items():
+        baseline_change='-'
+        phase_baseline=(baseline or {}).get('phases', {}).get(phase)
+        if phase_baseline is not None and phase_baseline.get('throughput') > 0:
+            baseline_change='%+.1f%%' % ((phase_result.get('throughput')/phase_baseline.get('throughput')-1)*100)
+        print('  %-14s %14s %-8s %10s %10s %10s %9s %8s %9s %9s' % (phase, phase_result.get('throughput'), phase_result.get('unit'), phase_result.get('latency_p50'), phase_result.get('latency_p90'), phase_result.get('latency_p99'), phase_result.get('peak_rss_mb'), phase_result.get('peak_threads'), phase_result.get('peak_processes'), baseline_change))
+
+
+## all params check
+
+
+def check_benchmark_params(args):
+    for option_name in ['--repeat', '--piece-count', '--index-pieces', '--owner-files', '--log-lines', '--download-parallel', '--download-chunk-size']:
+        oradock.check_positive_number(args[option_name], option_name)
+    if not args['--warmup'].isdigit():
+        logging.error('option \'--warmup\' must be a number of runs')
+        sys.exit(-1)
+    if int(args['--piece-count']) < 2:
+        logging.error('option \'--piece-count\' must be at least 2, for the spfile and controlfile pieces')
+        sys.exit(-1)
+    for piece_size in args['--piece-size'].split(','):
+        try:
+            float(piece_size)
+        except ValueError:
+            logging.error('option \'--piece-size\' must be sizes in mb, separated by comma')
+            sys.exit(-1)
+    for phase in args['--phases'].split(','):
+        if phase not in benchmark_phases:
+            logging.error('phase \'%s\' does not exist. Please choose among %s' % (phase, ', '.join(sorted(benchmark_phases.keys()))))
+            sys.exit(-1)
+    try:
+        float(args['--tolerance'])
+    except ValueError:
+        logging.error('option \'--tolerance\' must be a percent')
+        sys.exit(-1)
+    if args['--save-baseline']==True and args['--baseline'] is None:
+        logging.error('option \'--save-baseline\' needs a baseline file, set by \'--baseline\'')
+        sys.exit(-1)
+
+
+def create_benchmark_settings(args):
+    return {'work_dir':args['--work-dir'].rstrip('/'),
+            'phases':args['--phases'].split(','),
+            'repeat':int(args['--repeat']),
+            'warmup':int(args['--warmup']),
+            'seed':int(args['--seed']) if args['--seed'].isdigit() else args['--seed'],
+            'piece_count':int(args['--piece-count']),
+            'piece_size':args['--piece-size'].split(','),
+            'index_pieces':int(args['--index-pieces']),
+            'owner_files':int(args['--owner-files']),
+            'log_lines':int(args['--log-lines']),
+            'download_parallel':args['--download-parallel'],
+            'download_chunk_size':args['--download-chunk-size']}
+
+
+## main
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__, version=__version__)
+    oradock.set_log(arguments['--log-level'])
+
+    try:
+        check_benchmark_params(arguments)
+        benchmark_settings=create_benchmark_settings(arguments)
+        baseline=None
+        if arguments['--baseline'] is not None and arguments['--save-baseline']==False:
+            try:
+                with open(arguments['--baseline'], 'r') as baseline_file:
+                    baseline=json.load(baseline_file)
+            except (OSError, ValueError) as error:
+                logging.error('could not read baseline file \'%s\'. %s' % (arguments['--baseline'], str(error)))
+                sys.exit(-1)
+
+        benchmark_results=run_benchmark(benchmark_settings)
+        print_results(benchmark_results, baseline)
+        if arguments['--output'] is not None:
+            oradock.write_file_atomically(arguments['--output'], json.dumps(benchmark_results, indent=2)+'\n')
+        if arguments['--save-baseline']==True:
+            oradock.write_file_atomically(arguments['--baseline'], json.dumps(benchmark_results, indent=2)+'\n')
+            print('baseline saved at \'%s\'' % arguments['--baseline'])
+        elif baseline is not None:
+            regressions=compare_with_baseline(benchmark_results, baseline, float(arguments['--tolerance']))
+            for phase, metric, baseline_value, result_value in regressions:
+                logging.error('phase \'%s\' regressed on %s: %s against %s of its baseline' % (phase, metric, result_value, baseline_value))
+            if len(regressions) > 0:
+                sys.exit(-1)
+            print('no regressions against baseline \'%s\'' % arguments['--baseline'])
+
+    except KeyboardInterrupt as error:
+        print('\nSee ya! ')
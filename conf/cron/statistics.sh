@@ -3,68 +3,181 @@
 ###########################################
 # script: calculate statistics from db    #
 # date: 01/07/2016                        #
-# version: 1.0                            #
+# version: 2.0                            #
 # developed by: Rafael Mariotti           #
 ###########################################
 source ~/.bash_profile
 
+usage="SID [PERCENTAGE] [-p SESSIONS] [-d DEGREE] [-w WINDOW_MINUTES] [-m METHOD_OPT]"
+
 check_parameters(){
-  echo "checking parameters... (statistic_percentage)"
-  if [ $# -le 2 ] && [ $# -gt 0 ]; then
-    if [ $2 -gt 100 ] || [ $2 -le 0 ]; then
+  echo "checking parameters... (${usage})"
+  if [ $# -lt 1 ]; then
+    echo "  ERROR(1): wrong argument number (${usage})"
+    exit 1
+  fi
+  sid=$1
+  shift
+
+  sessions=4                                  #sqlplus sessions gathering statistics at the same time
+  degree=1                                    #parallel degree of each gather
+  window=240                                  #minutes to start new tables, running gathers are not interrupted
+  percent="dbms_stats.auto_sample_size"
+  method_opt="for all columns size auto"
+
+  if [ -n "$1" ] && [ "${1:0:1}" != "-" ]; then #percentage as the second argument, as in version 1.0
+    percent=$1
+    shift
+  fi
+
+  OPTIND=1
+  while getopts "p:d:w:m:" option; do
+    case ${option} in
+      p) sessions=${OPTARG} ;;
+      d) degree=${OPTARG} ;;
+      w) window=${OPTARG} ;;
+      m) method_opt=${OPTARG} ;;
+      *) echo "  ERROR(1): wrong argument (${usage})"
+         exit 1 ;;
+    esac
+  done
+
+  if [ "${percent}" != "dbms_stats.auto_sample_size" ]; then
+    if ! [[ "${percent}" =~ ^[0-9]+$ ]] || [ ${percent} -gt 100 ] || [ ${percent} -le 0 ]; then
       echo "  ERROR(2): statistic percentage not valid (must be between 1 and 100)"
       exit 2
     fi
-  else
-    echo "  ERROR(1): wrong argument number (SID PERCENTAGE)"
-    exit 1
   fi
+  for number in ${sessions} ${degree} ${window}; do
+    if ! [[ "${number}" =~ ^[0-9]+$ ]] || [ ${number} -le 0 ]; then
+      echo "  ERROR(3): sessions, degree and window must be positive numbers"
+      exit 3
+    fi
+  done
 
   echo "  Ok."
   return 0
 }
 
-run_statistic(){
-  PERCENT=$1
-  export ORACLE_SID=$2
-  echo "Starting statistic process.. ($(date +"%d/%m/%Y %H:%M"))"
+list_tables(){ #tables with stale or missing statistics, biggest first so the last ones to finish are the small ones
+  sqlplus -s / as sysdba << EOF | grep "^ORADOCK_TABLE|" | cut -d"|" -f2- > ${work_dir}/tables
+  set pages 0;
+  set lines 500;
+  set feedback off;
+  set heading off;
+  exec dbms_stats.flush_database_monitoring_info;
 
-  sqlplus / as sysdba <<EOF
-SET serveroutput ON;
-DECLARE
-BEGIN
-  FOR object_info IN
-  (SELECT dt.owner,
-    dt.table_name
-  FROM dba_tables dt
-  WHERE lower(owner) NOT IN ('system', 'sys', 'outln', 'dip', 'oracle_ocm', 'dbsnmp', 'appqossys', 'wmsys', 'exfsys', 'xdb', 'anonymous', 'xs\$null', 'sysman', 'mgmt_view')
-  AND TEMPORARY       = 'N'
-  AND (dt.iot_type   IS NULL
-  OR dt.iot_type     != 'IOT_OVERFLOW')
-  AND table_name NOT IN
-    (SELECT table_name FROM dba_external_tables det WHERE det.owner = dt.owner
+  SELECT 'ORADOCK_TABLE|' || dt.owner || '|' || dt.table_name || '|' || round(nvl(sum(seg.bytes), 0)/1048576)
+  FROM dba_tables dt, dba_segments seg
+  WHERE lower(dt.owner) NOT IN ('system', 'sys', 'outln', 'dip', 'oracle_ocm', 'dbsnmp', 'appqossys', 'wmsys', 'exfsys', 'xdb', 'anonymous', 'xs\$null', 'sysman', 'mgmt_view')
+  AND dt.temporary       = 'N'
+  AND (dt.iot_type      IS NULL
+  OR dt.iot_type        != 'IOT_OVERFLOW')
+  AND NOT EXISTS
+    (SELECT 1 FROM dba_external_tables det WHERE det.owner = dt.owner AND det.table_name = dt.table_name
     )
-  ORDER BY owner,
-    table_name
-  )
-  LOOP
-    BEGIN
-      dbms_stats.gather_table_stats(ownname=> object_info.owner, tabname=> object_info.table_name , CASCADE=> true, method_opt => 'for all columns size skewonly', estimate_percent=>$PERCENT);
-      dbms_output.put_line('(success) statistic from ' || lower(object_info.owner || '.' || object_info.table_name));
-    EXCEPTION
-    WHEN OTHERS THEN
-      dbms_output.put_line('error calculating statistic from ' || object_info.owner ||'.' || object_info.table_name || ': ' || sqlerrm);
-    END;
-  END LOOP;
-END;
-/
+  AND EXISTS
+    (SELECT 1 FROM dba_tab_statistics dts
+    WHERE dts.owner = dt.owner
+    AND dts.table_name = dt.table_name
+    AND (dts.stale_stats = 'YES' OR dts.last_analyzed IS NULL)
+    AND dts.stattype_locked IS NULL
+    )
+  AND seg.owner(+)        = dt.owner
+  AND seg.segment_name(+) = dt.table_name
+  GROUP BY dt.owner,
+    dt.table_name
+  ORDER BY nvl(sum(seg.bytes), 0) DESC;
 EOF
+}
+
+next_table(){ #each session takes the next table of the list, until the list or the window ends
+  (
+    flock -x 200
+    position=$(cat ${work_dir}/position)
+    if [ $(date +%s) -ge ${deadline} ]; then
+      return
+    fi
+    echo $((position+1)) > ${work_dir}/position
+    sed -n "$((position+1))p" ${work_dir}/tables
+  ) 200> ${work_dir}/position.lock
+}
+
+statistic_session(){
+  session=$1
+
+  table_info=$(next_table)
+  while [ -n "${table_info}" ]; do
+    owner=$(echo "${table_info}" | cut -d"|" -f1)
+    table_name=$(echo "${table_info}" | cut -d"|" -f2)
+    table_mb=$(echo "${table_info}" | cut -d"|" -f3)
+
+    table_start=$(date +%s.%N)
+    gather_output=$(sqlplus -s / as sysdba << EOF
+      set feedback off;
+      whenever sqlerror exit failure;
+      exec dbms_stats.gather_table_stats(ownname=> '"${owner}"', tabname=> '"${table_name}"', CASCADE=> true, method_opt => '${method_opt}', estimate_percent=> ${percent}, degree=> ${degree});
+      exit;
+EOF
+)
+    gather_status=$?
+    table_seconds=$(awk -v table_start=${table_start} -v table_end=$(date +%s.%N) 'BEGIN {printf "%.1f", table_end-table_start}')
+
+    if [ ${gather_status} -eq 0 ]; then
+      echo "(success) statistic from $(echo "${owner}.${table_name}" | tr 'A-Z' 'a-z') (${table_mb} mb) in ${table_seconds} seconds, session ${session}"
+      echo "success|${owner}.${table_name}|${table_mb}|${table_seconds}" >> ${work_dir}/results
+    else
+      echo "error calculating statistic from ${owner}.${table_name}: $(echo "${gather_output}" | grep -e "^ORA-" | head -1)"
+      echo "error|${owner}.${table_name}|${table_mb}|${table_seconds}" >> ${work_dir}/results
+    fi
+    table_info=$(next_table)
+  done
+}
+
+report_statistic(){ #per-table durations, slowest first
+  table_count=$(cat ${work_dir}/tables | wc -l)
+  success_count=$(grep -c "^success|" ${work_dir}/results)
+  error_count=$(grep -c "^error|" ${work_dir}/results)
+
+  echo "Slowest tables:"
+  sort -t"|" -k4 -n -r ${work_dir}/results | head -20 | awk -F"|" '{printf "  %-60s %10s mb %10s seconds %s\n", tolower($2), $3, $4, $1}'
+  echo "${success_count} tables gathered and ${error_count} failed, of ${table_count} with stale or missing statistics"
+  if [ $((success_count+error_count)) -lt ${table_count} ]; then
+    echo "WARN: window of ${window} minutes ended, $((table_count-success_count-error_count)) tables are left for the next run"
+  fi
+}
+
+run_statistic(){
+  export ORACLE_SID=${sid}
+  work_dir=/tmp/statistics_${sid}
+  mkdir -p ${work_dir}
+
+  exec 300> ${work_dir}/run.lock
+  if ! flock -n 300; then
+    echo "  ERROR(4): statistic process of ${sid} is already running"
+    exit 4
+  fi
+
+  echo "Starting statistic process.. ($(date +"%d/%m/%Y %H:%M"))"
+  deadline=$(($(date +%s)+window*60))
+  echo 0 > ${work_dir}/position
+  : > ${work_dir}/results
+
+  list_tables
+  echo "$(cat ${work_dir}/tables | wc -l) tables with stale or missing statistics, gathering with ${sessions} sessions of degree ${degree} for ${window} minutes"
+
+  for ((session=1; session <= ${sessions}; session++)); do
+    statistic_session ${session} &
+  done
+  wait
+
+  report_statistic
   echo "Done ($(date +"%d/%m/%Y %H:%M"))"
 }
 
 main(){
-  check_parameters $1 $2
-  run_statistic $1 $2
+  check_parameters "$@"
+  run_statistic
 }
 
-main $1 $2
+main "$@"
@@ -19,27 +19,52 @@ echo "oracle soft memlock ${memlock_env}" >> /tmp/new_limits.conf
 echo "oracle hard memlock ${memlock_env}" >> /tmp/new_limits.conf
 sudo mv /tmp/new_limits.conf /etc/security/limits.conf
 
+startup_database(){ #opens one database and records its status and startup time at /tmp/oradock_startup
+  database=$1
+  export ORACLE_SID=${database}
+  start_time=$(date +%s)
+  echo "starting|0" > /tmp/oradock_startup/${database}
+
+  sqlplus -S / as sysdba > /tmp/startup_${database}.log << EOF
+  startup;
+  alter system register;
+EOF
+
+  if [ -n "$(cat /tmp/startup_${database}.log | grep "Database opened.")" ];
+  then
+    echo "open|$(($(date +%s)-start_time))" > /tmp/oradock_startup/${database}
+    echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: Database ${database} opened in $(($(date +%s)-start_time)) seconds."
+    rm -f /tmp/startup_${database}.log
+  else
+    echo "failed|$(($(date +%s)-start_time))" > /tmp/oradock_startup/${database}
+    echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: Error at startup. Please, check log file /tmp/startup_${database}.log"
+  fi
+}
+
 if [ -e /etc/oratab ] && [ $(cat /etc/oratab | grep -v -e "^#" -e "^$" | wc -l) -eq 0 ];
 then
   echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: There are no databases installed to startup."
 else
+  #listener first, so each database registers its services as soon as it is open
+  lsnrctl start >> /tmp/start_listener.log
+
+  startup_parallel=${ORADOCK_STARTUP_PARALLEL:-$(getconf _NPROCESSORS_ONLN)}
+  rm -rf /tmp/oradock_startup
+  mkdir -p /tmp/oradock_startup
   for database in $(cat /etc/oratab | grep -v -e "^#" -e "^$" | awk -F: '{print $1}')
   do
-    export ORACLE_SID=${database}
-    sqlplus -S / as sysdba > /tmp/startup_${database}.log << EOF
-    startup;
-EOF
-
-    if [ -n "$(cat /tmp/startup_${database}.log | grep "Database opened.")" ];
-    then
-      echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: Database ${database} opened."
-      rm -f /tmp/startup_${database}.log
-    else
-      echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: Error at startup. Please, check log file /tmp/startup_${database}.log"
-    fi
+    echo "waiting|0" > /tmp/oradock_startup/${database}
   done
 
-  lsnrctl start >> /tmp/start_listener.log
+  for database in $(cat /etc/oratab | grep -v -e "^#" -e "^$" | awk -F: '{print $1}')
+  do
+    while [ $(jobs -rp | wc -l) -ge ${startup_parallel} ]
+    do
+      sleep 1
+    done
+    startup_database ${database} &
+  done
+  wait
 fi
 
 sudo /etc/init.d/crond restart
@@ -0,0 +1,25 @@
+#!/bin/bash
+source ~/.bash_profile
+
+database_checkpoint(){
+  database=$1
+  export ORACLE_SID=${database}
+
+  #each line: ORADOCK_CHECKPOINT|database|database role|oldest datafile checkpoint scn|oldest datafile checkpoint time
+  sqlplus -S / as sysdba << EOF | grep "^ORADOCK_CHECKPOINT|"
+  set pages 0;
+  set lines 500;
+  set feedback off;
+  select 'ORADOCK_CHECKPOINT|${database}|' || db.database_role || '|' || min(headers.checkpoint_change#) || '|' || to_char(min(headers.checkpoint_time), 'YYYY-MM-DD HH24:MI:SS')
+    from v\$database db, v\$datafile_header headers
+    group by db.database_role;
+EOF
+}
+
+main(){
+  database=$1
+
+  database_checkpoint ${database}
+}
+
+main $1
@@ -1,5 +1,6 @@
 #!/bin/bash
 source ~/.bash_profile
+source $(dirname $0)/functions.sh
 
 create_database(){
   sys_password=$1
@@ -9,16 +10,13 @@ create_database(){
   script_home=$5
   data_dir=$6
   position=1
-
-  cp ${script_home}/conf/listener/listener_template.ora $ORACLE_HOME/network/admin/listener.ora
-  sed -i "s|\${hostname}|$(hostname)|g" $ORACLE_HOME/network/admin/listener.ora
+  exit_code=0
 
   for database in ${db_create}
   do
     echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: Creating ${database} database"
 
     export ORACLE_SID=${database}
-    memory_distribution=$(echo "${db_memory_distribution}" | awk -F"," '{print $'${position}'}')
     main_service=$(echo "${db_main_service}" | awk -F"," '{print $'${position}'}')
 
     mkdir -p /u01/app/oracle/admin/${database}/adump
@@ -38,24 +36,22 @@ create_database(){
       echo "$(date +"%Y-%m-%d %H:%M:%S") WARN: The directory '${data_dir}/${database}' is not empty."
     fi
 
-    cp /u01/pfile_template.ora /u01/pfile.ora
-    sed -i "s|\${database}|${database}|g" /u01/pfile.ora
-    sed -i "s|\${data_dir}|${data_dir}|g" /u01/pfile.ora
-
-    total_mem_gb=$(free -m | grep "Mem:" | awk '{print $2}')
-    sga_and_process_size=$(echo "scale=1; ${total_mem_gb}*${memory_distribution}/100*0.6" | bc -l | awk -F. '{print $1}')
-    echo "sga_max_size=${sga_and_process_size}M" >> /u01/pfile.ora
-    echo "sga_target=${sga_and_process_size}M" >> /u01/pfile.ora
-    pga_size=$(echo "scale=1; ${total_mem_gb}*${memory_distribution}/100*0.4" | bc -l | awk -F. '{print $1}')
-    echo "pga_aggregate_target=${pga_size}M" >> /u01/pfile.ora
-    echo "processes=${sga_and_process_size}" >> /u01/pfile.ora
+    if [ ! -e "${ORADOCK_CONFIG_DIR}/pfile_${database}.ora" ] #rendered by oradock, with memory parameters
+    then
+      echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: pfile of database ${database} was not created by oradock"
+      exit_code=1
+      position=$((position+1))
+      continue
+    fi
+    cp ${ORADOCK_CONFIG_DIR}/pfile_${database}.ora /tmp/pfile_${database}.ora
 
     spfile="${data_dir}/${database}/spfile/spfile${database}.ora"
     echo "SPFILE='${spfile}'" > $ORACLE_HOME/dbs/init${database}.ora
 
 	echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: executing create database. Log will be save at '/tmp/create_${database}.log' on inside container"
+    phase_start
     sqlplus / as sysdba > /tmp/create_${database}.log << EOF
-      create spfile='${spfile}' from pfile='/u01/pfile.ora';
+      create spfile='${spfile}' from pfile='/tmp/pfile_${database}.ora';
       startup nomount;
 
       CREATE DATABASE ${database}
@@ -94,11 +90,13 @@ create_database(){
       alter database archivelog;
       alter database open;
 EOF
+    phase_end ${database} create_database
 
     position=$((position+1))
     if [ $(grep -e "^ORA-" /tmp/create_${database}.log | wc -l) -ne 583 ] #number of errors when executing scripts to create database. lol?
     then
       echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: fail to create database ${database}. Please check logfile /tmp/create_${database}.log"
+      exit_code=1
       continue
     fi
 
@@ -106,15 +104,8 @@ EOF
     echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: ${database} database created"
   done
 
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: starting listener, logfile '/tmp/start_listener.log' inside container"
-  lsnrctl start > /tmp/start_listener.log
-  crontab_config ${script_home}
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: Container ready to use"
-}
-
-crontab_config(){
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: configuring crontab"
-  crontab ${script_home}/conf/cron/crontab.config
+  finish_container ${script_home}
+  return ${exit_code}
 }
 
 main(){
@@ -0,0 +1,34 @@
+#!/bin/bash
+source ~/.bash_profile
+
+start_listener(){
+  script_home=$1
+
+  if [ -e "${ORADOCK_CONFIG_DIR}/listener.ora" ] #rendered by oradock
+  then
+    cp ${ORADOCK_CONFIG_DIR}/listener.ora $ORACLE_HOME/network/admin/listener.ora
+  else
+    cp ${script_home}/conf/listener/listener_template.ora $ORACLE_HOME/network/admin/listener.ora
+    sed -i "s|\${hostname}|$(hostname)|g" $ORACLE_HOME/network/admin/listener.ora
+  fi
+
+  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: starting listener, logfile '/tmp/start_listener.log' inside container"
+  lsnrctl start > /tmp/start_listener.log
+}
+
+crontab_config(){
+  script_home=$1
+
+  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: configuring crontab"
+  crontab ${script_home}/conf/cron/crontab.config
+}
+
+main(){
+  script_home=$1
+
+  start_listener ${script_home}
+  crontab_config ${script_home}
+  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: container ready to use"
+}
+
+main $1
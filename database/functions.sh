@@ -0,0 +1,54 @@
+#!/bin/bash
+#functions shared by the database scripts, which source this file
+
+database_state(){ #prints log mode, flashback mode and service names of the mounted or open database, separated by |
+  sqlplus -S / as sysdba << EOF | grep "^ORADOCK_STATE|" | cut -d"|" -f2-
+  set pages 0;
+  set lines 500;
+  set feedback off;
+  select 'ORADOCK_STATE|' || db.log_mode || '|' || db.flashback_on || '|' || services.value from v\$database db, v\$parameter services where services.name = 'service_names';
+EOF
+}
+
+apply_pfile_rules(){ #comments out the parameters listed by oradock and adds its parameters, in a single pass over the old pfile
+  pfile_database=$1
+  old_pfile=$2
+  new_pfile=$3
+
+  awk -v pfile_database="${pfile_database}" -v rules_file="${ORADOCK_CONFIG_DIR}/pfile_${pfile_database}.comment" '
+    BEGIN { while ((getline rule < rules_file) > 0) comment_rules[rule]=1 }
+    index($0, pfile_database".__")==1 { next }
+    {
+      parameter=$0
+      sub(/=.*/, "", parameter)
+      sub(/^\*\./, "", parameter)
+      for (rule in comment_rules) if (parameter ~ "^(" rule ")$") { $0="#" $0; break }
+      print
+    }' ${old_pfile} > ${new_pfile}
+  cat ${ORADOCK_CONFIG_DIR}/pfile_${pfile_database}.ora >> ${new_pfile}
+}
+
+follow_log(){ #database tools output is also streamed to oradock as it is written, so database errors show up while the script runs
+  log_file=$1
+  : > ${log_file}
+  tail -n +1 -F --pid=$$ ${log_file} 2> /dev/null &
+}
+
+phase_start(){
+  phase_start_time=$(date +%s.%N)
+}
+
+phase_end(){ #oradock reads these lines to build its run report
+  database=$1
+  phase=$2
+  echo "ORADOCK_PHASE|${database}|${phase}|$(echo "$(date +%s.%N) - ${phase_start_time}" | bc -l)"
+}
+
+finish_container(){ #oradock runs each database on its own, and finishes the container at the end
+  script_home=$1
+
+  if [ "${ORADOCK_DATABASE_ONLY}" != "Y" ]
+  then
+    /bin/bash ${script_home}/database/finish_database.sh ${script_home}
+  fi
+}
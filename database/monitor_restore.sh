@@ -0,0 +1,45 @@
+#!/bin/bash
+source ~/.bash_profile
+
+rman_progress(){
+  database=$1
+  export ORACLE_SID=${database}
+
+  #each line: ORADOCK_PROGRESS|channel|operation|done mb|total mb|elapsed seconds|remaining seconds|wait class or CPU
+  sqlplus -s / as sysdba << EOF
+    set lines 500;
+    set pages 0;
+    set feedback off;
+    set heading off;
+
+    SELECT 'ORADOCK_PROGRESS|'
+      || nvl(regexp_substr(sessions.client_info, 'channel=(\w+)', 1, 1, null, 1), 'rman') || '|'
+      || longops.opname || '|'
+      || round(longops.sofar*block_size.value/1048576, 1) || '|'
+      || round(longops.totalwork*block_size.value/1048576, 1) || '|'
+      || longops.elapsed_seconds || '|'
+      || nvl(longops.time_remaining, 0) || '|'
+      || decode(sessions.state, 'WAITING', sessions.wait_class, 'CPU')
+    FROM v\$session_longops longops, v\$session sessions, v\$parameter block_size
+    WHERE longops.sid = sessions.sid(+)
+      AND longops.serial# = sessions.serial#(+)
+      AND block_size.name = 'db_block_size'
+      AND longops.opname LIKE 'RMAN%'
+      AND longops.units = 'Blocks'
+      AND longops.totalwork > 0
+      AND longops.sofar < longops.totalwork;
+
+    SELECT 'ORADOCK_STATUS|' || operation || '|' || status || '|' || mbytes_processed
+    FROM v\$rman_status
+    WHERE status LIKE 'RUNNING%';
+    exit;
+EOF
+}
+
+main(){
+  database=$1
+
+  rman_progress ${database}
+}
+
+main $1
@@ -0,0 +1,76 @@
+#!/bin/bash
+source ~/.bash_profile
+source $(dirname $0)/functions.sh
+
+refresh(){
+  backup_dir=$1
+  db_refresh=$(echo "$2" | sed 's/,/ /g')
+  parallel_level=$3
+  position=0
+  exit_code=0
+
+  for database in ${db_refresh}
+  do
+    position=$((position+1))
+    echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: refreshing ${database} database. Log will be save at '/tmp/refresh_${database}.log' on inside container"
+
+    export ORACLE_SID=${database}
+    backup_db_dir=$(echo "${backup_dir}" | awk -F"," '{print $'${position}'}')
+
+    channels=""
+    release_channels=""
+    for ((cpu_count=1; cpu_count <= ${parallel_level}; cpu_count++))
+    do
+      channels=$(echo -e "${channels} allocate channel channel${cpu_count} device type disk;")
+      release_channels=$(echo -e "${release_channels} release channel channel${cpu_count};")
+    done
+
+    follow_log /tmp/refresh_${database}.log
+    phase_start
+    rman target=/ >> /tmp/refresh_${database}.log << EOF
+      shutdown immediate;
+      startup mount;
+      catalog start with '${backup_db_dir}' noprompt;
+EOF
+    phase_end ${database} catalog_backup
+
+    #rman applies the newer incremental backups first and then the archivelogs after them, until it runs out of logs
+    phase_start
+    rman target=/ >> /tmp/refresh_${database}.log << EOF
+      RUN {
+        ${channels}
+
+        recover database;
+        ${release_channels}
+      }
+EOF
+    phase_end ${database} recover_database
+
+    phase_start
+    sqlplus / as sysdba >> /tmp/refresh_${database}.log << EOF
+      alter database open read only;
+EOF
+    phase_end ${database} open_database
+
+    if [ $(grep -e "^ORA-" /tmp/refresh_${database}.log | wc -l) -ne 0 ]
+    then
+      echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: fail to refresh database ${database}. Please check logfile '/tmp/refresh_${database}.log'"
+      exit_code=1
+      continue
+    fi
+
+    echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: refresh of ${database} database finished"
+  done
+
+  return ${exit_code}
+}
+
+main(){
+  backup_dir=$1
+  db_refresh=$2
+  parallel_level=$3
+
+  refresh ${backup_dir} ${db_refresh} ${parallel_level}
+}
+
+main $1 $2 $3
@@ -1,11 +1,13 @@
 #!/bin/bash
 source ~/.bash_profile
+source $(dirname $0)/functions.sh
 
 recreate(){
   db_restart=$(echo "$1" | sed 's/,/ /g')
   db_memory_distribution=$2
   db_main_service=$3
   position=1
+  exit_code=0
 
   memory_check=$(echo "${db_memory_distribution}" | sed 's/,/+/g')
   if [ $(echo ${memory_check} | bc) -gt 100 ]
@@ -19,63 +21,62 @@ recreate(){
     export ORACLE_SID=${database}
 
     spfile="${data_dir}/${database}/spfile/spfile${database}.ora"
-    memory_distribution=$(echo "${db_memory_distribution}" | awk -F"," '{print $'${position}'}')
     main_service=$(echo "${db_main_service}" | awk -F"," '{print $'${position}'}')
 
     mkdir -p /u01/app/oracle/admin/${database}/adump
-    cp ${script_home}/conf/listener/listener_template.ora $ORACLE_HOME/network/admin/listener.ora
-    sed -i "s|\${hostname}|$(hostname)|g" $ORACLE_HOME/network/admin/listener.ora
 
+    follow_log /tmp/restart_${database}.log
+    phase_start
     if [ -e ${spfile} ]; then
-      sqlplus / as sysdba > /tmp/restart_${database}.log << EOF
+      sqlplus / as sysdba >> /tmp/restart_${database}.log << EOF
         create pfile='/tmp/old_pfile${database}.ora' from spfile='${spfile}';
         exit;
 EOF
-      cat /tmp/old_pfile${database}.ora | grep -v -e "^*.sga_max_size=" -e "^*.sga_target=" -e "^*.pga_aggregate_target=" -e "^*.processes=" > /tmp/new_pfile${database}.ora
+      apply_pfile_rules ${database} /tmp/old_pfile${database}.ora /tmp/new_pfile${database}.ora
       rm -f ${spfile}
     else
       echo "$(date +"%Y-%m-%d %H:%M:%S") WARN: there are no spfile restored. Recreating spfile to startup instance."
-
-      rm -f /tmp/new_pfile${database}.ora
-      echo "*.db_name='${database}'" > /tmp/new_pfile${database}.ora
-      echo "*.control_files='${data_dir}/${database}/controlfile/control01.ctl','${data_dir}/${database}/controlfile/control02.ctl'" >> /tmp/new_pfile${database}.ora
-      echo "*.db_create_file_dest='${data_dir}/${database}/datafile'" >> /tmp/new_pfile${database}.ora
-      echo "*.db_create_online_log_dest_1='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-      echo "*.db_create_online_log_dest_2='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-      echo "*.db_create_online_log_dest_3='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-      echo "*.db_create_online_log_dest_4='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-      echo "*.db_create_online_log_dest_5='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-      echo "*.db_recovery_file_dest='${data_dir}/${database}/fast_recovery_area'" >> /tmp/new_pfile${database}.ora
-      echo "*.db_recovery_file_dest_size=50G" >> /tmp/new_pfile${database}.ora
+      cp ${ORADOCK_CONFIG_DIR}/pfile_${database}_default.ora /tmp/new_pfile${database}.ora
     fi
 
-    total_mem_gb=$(free -m | grep "Mem:" | awk '{print $2}')
-    sga_and_process_size=$(echo "scale=1; ${total_mem_gb}*${memory_distribution}/100*0.6" | bc -l | awk -F. '{print $1}')
-    echo "*.sga_max_size=${sga_and_process_size}M" >> /tmp/new_pfile${database}.ora
-    echo "*.sga_target=${sga_and_process_size}M" >> /tmp/new_pfile${database}.ora
-    pga_size=$(echo "scale=1; ${total_mem_gb}*${memory_distribution}/100*0.4" | bc -l | awk -F. '{print $1}')
-    echo "*.pga_aggregate_target=${pga_size}M" >> /tmp/new_pfile${database}.ora
-    echo "*.processes=${sga_and_process_size}" >> /tmp/new_pfile${database}.ora
-
     echo "SPFILE='${spfile}'" > $ORACLE_HOME/dbs/init${database}.ora
     sqlplus / as sysdba >> /tmp/restart_${database}.log << EOF
       create spfile='${spfile}' from pfile='/tmp/new_pfile${database}.ora';
-      startup nomount;
-      alter database mount;
-      alter database flashback off;
-      alter database open;
-      alter system set service_names='${main_service}';
-
-      shutdown immediate;
       startup mount;
-      alter database archivelog;
-      alter database open;
 EOF
 
+    if [ -n "${ORADOCK_CLONE_FROM}" ] #files of a clone are still named after its golden copy
+    then
+      rename_clone_files ${database} ${ORADOCK_CLONE_FROM}/${database} ${data_dir}/${database}
+    fi
+
+    #only what differs from the wanted state is changed, and the database is restarted only to enable archivelog mode
+    current_state=$(database_state)
+    open_commands="alter database open;"
+    if [ "$(echo "${current_state}" | cut -d"|" -f1)" != "ARCHIVELOG" ]
+    then
+      echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: enabling archivelog mode of ${database} database"
+      open_commands="alter database open; shutdown immediate; startup mount; alter database archivelog; alter database open;"
+    fi
+    if [ "$(echo "${current_state}" | cut -d"|" -f2)" != "NO" ]
+    then
+      open_commands="${open_commands} alter database flashback off;"
+    fi
+    if [ "$(echo "${current_state}" | cut -d"|" -f3)" != "${main_service}" ]
+    then
+      open_commands="${open_commands} alter system set service_names='${main_service}';"
+    fi
+
+    sqlplus / as sysdba >> /tmp/restart_${database}.log << EOF
+      $(echo "${open_commands}" | sed 's/; */;\n/g')
+EOF
+    phase_end ${database} startup_database
+
     position=$((position+1))
     if [ $(grep -e "^ORA-" /tmp/restart_${database}.log | wc -l) -ne 0 ]
     then
       echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: fail to start database ${database}. Please check logfile"
+      exit_code=1
       continue
     fi
 
@@ -83,15 +84,30 @@ EOF
     echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: database ${database} startup finished"
   done
 
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: starting listener, logfile '/tmp/start_listener.log' inside container"
-  lsnrctl start > /tmp/start_listener.log
-  crontab_config ${script_home}
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: container ready to use"
+  finish_container ${script_home}
+  return ${exit_code}
 }
 
-crontab_config(){
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: configuring crontab"
-  crontab ${script_home}/conf/cron/crontab.config
+rename_clone_files(){ #points datafiles, tempfiles and redo logs of a mounted clone to its own directory
+  clone_database=$1
+  golden_dir=$2
+  clone_dir=$3
+
+  sqlplus -S / as sysdba << EOF | grep "^ALTER DATABASE RENAME FILE" > /tmp/rename_clone_${clone_database}.sql
+  set pages 0;
+  set lines 1000;
+  set feedback off;
+  select 'ALTER DATABASE RENAME FILE ''' || name || ''' TO ''' || replace(name, '${golden_dir}/', '${clone_dir}/') || ''';' from v\$datafile where name like '${golden_dir}/%'
+  union all
+  select 'ALTER DATABASE RENAME FILE ''' || name || ''' TO ''' || replace(name, '${golden_dir}/', '${clone_dir}/') || ''';' from v\$tempfile where name like '${golden_dir}/%'
+  union all
+  select 'ALTER DATABASE RENAME FILE ''' || member || ''' TO ''' || replace(member, '${golden_dir}/', '${clone_dir}/') || ''';' from v\$logfile where member like '${golden_dir}/%';
+EOF
+
+  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: renaming $(cat /tmp/rename_clone_${clone_database}.sql | wc -l) files of ${clone_database} database clone"
+  sqlplus / as sysdba >> /tmp/restart_${clone_database}.log << EOF
+    @/tmp/rename_clone_${clone_database}.sql
+EOF
 }
 
 main(){
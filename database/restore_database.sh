@@ -1,5 +1,6 @@
 #!/bin/bash
 source ~/.bash_profile
+source $(dirname $0)/functions.sh
 
 restore(){
   backup_dir=$1
@@ -11,36 +12,43 @@ restore(){
   spfile_backup_name=$7
   controlfile_backup_name=$8
   parallel_level=$9
-  position=1
-
-  cp ${script_home}/conf/listener/listener_template.ora $ORACLE_HOME/network/admin/listener.ora
-  sed -i "s|\${hostname}|$(hostname)|g" $ORACLE_HOME/network/admin/listener.ora
+  position=0
+  exit_code=0
 
   for database in ${db_restore}
   do
+    position=$((position+1))
     echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: restore & recovering ${database} database. Log will be save at '/tmp/restore_${database}.log' on inside container"
 
     export ORACLE_SID=${database}
-    memory_distribution=$(echo "${db_memory_distribution}" | awk -F"," '{print $'${position}'}')
 	backup_db_dir=$(echo "${backup_dir}" | awk -F"," '{print $'${position}'}')
     main_service=$(echo "${db_main_service}" | awk -F"," '{print $'${position}'}')
 
     echo "DB_NAME='${database}'" > $ORACLE_HOME/dbs/init${database}.ora
     
-	if [ -d ${backup_db_dir} ]
+	if [ -e ${ORADOCK_CONFIG_DIR}/backup_${database}.files ] #spfile and controlfile resolved by oradock backup index
+	then
+		backup_spfile=$(grep "^spfile=" ${ORADOCK_CONFIG_DIR}/backup_${database}.files | cut -d"=" -f2-)
+		backup_controlfile=$(grep "^controlfile=" ${ORADOCK_CONFIG_DIR}/backup_${database}.files | cut -d"=" -f2-)
+	elif [ -d ${backup_db_dir} ]
 	then
 		backup_spfile=$(find ${backup_db_dir} -iname ${spfile_backup_name} -exec ls -trh "{}" + | tail -1)
+		backup_controlfile=$(find ${backup_db_dir} -iname ${controlfile_backup_name} -exec ls -trh "{}" + | tail -1)
 	else
 		echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: spfile does not exists"
+		exit_code=1
 		continue
 	fi
 
-    rman target=/ > /tmp/restore_${database}.log << EOF
+    follow_log /tmp/restore_${database}.log
+    phase_start
+    rman target=/ >> /tmp/restore_${database}.log << EOF
     startup nomount force;
     restore spfile from '${backup_spfile}';
     shutdown abort;
     exit;
 EOF
+    phase_end ${database} spfile_restore
 
     echo "SPFILE='$ORACLE_HOME/dbs/spfile${database}.ora'" > $ORACLE_HOME/dbs/init${database}.ora
     mkdir -p /u01/app/oracle/admin/${database}/adump
@@ -61,78 +69,16 @@ EOF
 
     rm -f $ORACLE_HOME/dbs/spfile${database}.ora
 
-	if [ -e /tmp/old_pfile${database}.ora ]; then
-	  grep -v "^${database}.__" /tmp/old_pfile${database}.ora > /tmp/new_pfile${database}.ora
-	else
-	  echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: spfile does not exists"
-	  exit 1
-	fi
-    #comment all parameters to rewrite
-    sed -i "s|\*.control_files=|\#\*.control_files=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.db_create_file_dest=|\#\*.db_create_file_dest=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.db_file_name_convert=|\#\*.db_file_name_convert=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.db_create_online_log_dest_|\#\*.db_create_online_log_dest_|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_file_name_convert=|\#\*.log_file_name_convert=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.db_recovery_file_dest=|\#\*.db_recovery_file_dest=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.db_recovery_file_dest_size=|\#\*.db_recovery_file_dest_size=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.local_listener=|\#\*.local_listener=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.sga_max_size=|\#\*.sga_max_size=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.sga_target=|\#\*.sga_target=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.pga_aggregate_target=|\#\*.pga_aggregate_target=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.memory_max_target=|\#\*.memory_max_target=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.memory_target=|\#\*.memory_target=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.processes=|\#\*.processes=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.use_large_pages=|\#\*.use_large_pages=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_config=|\#\*.log_archive_config=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_1=|\#\*.log_archive_dest_1=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_2=|\#\*.log_archive_dest_2=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_3=|\#\*.log_archive_dest_3=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_4=|\#\*.log_archive_dest_4=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_5=|\#\*.log_archive_dest_5=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_6=|\#\*.log_archive_dest_6=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_7=|\#\*.log_archive_dest_7=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_8=|\#\*.log_archive_dest_8=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_9=|\#\*.log_archive_dest_9=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_10=|\#\*.log_archive_dest_10=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_11=|\#\*.log_archive_dest_11=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_12=|\#\*.log_archive_dest_12=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_13=|\#\*.log_archive_dest_13=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_14=|\#\*.log_archive_dest_14=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_15=|\#\*.log_archive_dest_15=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_16=|\#\*.log_archive_dest_16=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_17=|\#\*.log_archive_dest_17=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_18=|\#\*.log_archive_dest_18=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_19=|\#\*.log_archive_dest_19=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_20=|\#\*.log_archive_dest_20=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_21=|\#\*.log_archive_dest_21=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_22=|\#\*.log_archive_dest_22=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_23=|\#\*.log_archive_dest_23=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_24=|\#\*.log_archive_dest_24=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_25=|\#\*.log_archive_dest_25=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_26=|\#\*.log_archive_dest_26=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_27=|\#\*.log_archive_dest_27=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_28=|\#\*.log_archive_dest_28=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_29=|\#\*.log_archive_dest_29=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_30=|\#\*.log_archive_dest_30=|g" /tmp/new_pfile${database}.ora
-    sed -i "s|\*.log_archive_dest_31=|\#\*.log_archive_dest_31=|g" /tmp/new_pfile${database}.ora
-
-    #setting min parameters to restore
-    echo "*.control_files='${data_dir}/${database}/controlfile/control01.ctl','${data_dir}/${database}/controlfile/control02.ctl'" >> /tmp/new_pfile${database}.ora
-    echo "*.db_create_file_dest='${data_dir}/${database}/datafile'" >> /tmp/new_pfile${database}.ora
-    echo "*.db_create_online_log_dest_1='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-    echo "*.db_create_online_log_dest_2='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-    echo "*.db_create_online_log_dest_3='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-    echo "*.db_create_online_log_dest_4='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-    echo "*.db_create_online_log_dest_5='${data_dir}/${database}/redolog'" >> /tmp/new_pfile${database}.ora
-    echo "*.db_recovery_file_dest='${data_dir}/${database}/fast_recovery_area'" >> /tmp/new_pfile${database}.ora
-    echo "*.db_recovery_file_dest_size=50G" >> /tmp/new_pfile${database}.ora
-    total_mem_gb=$(free -m | grep "Mem:" | awk '{print $2}')
-    sga_and_process_size=$(echo "scale=1; ${total_mem_gb}*${memory_distribution}/100*0.6" | bc -l | awk -F. '{print $1}')
-    echo "*.sga_max_size=${sga_and_process_size}M" >> /tmp/new_pfile${database}.ora
-    echo "*.sga_target=${sga_and_process_size}M" >> /tmp/new_pfile${database}.ora
-    pga_size=$(echo "scale=1; ${total_mem_gb}*${memory_distribution}/100*0.4" | bc -l | awk -F. '{print $1}')
-    echo "*.pga_aggregate_target=${pga_size}M" >> /tmp/new_pfile${database}.ora
-    echo "*.processes=${sga_and_process_size}" >> /tmp/new_pfile${database}.ora
+    if [ ! -e "${ORADOCK_CONFIG_DIR}/pfile_${database}.ora" ]; then
+      echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: pfile parameters of database ${database} were not created by oradock"
+      exit_code=1
+      continue
+    elif [ -e /tmp/old_pfile${database}.ora ]; then
+      apply_pfile_rules ${database} /tmp/old_pfile${database}.ora /tmp/new_pfile${database}.ora
+    else
+      echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: spfile does not exists"
+      exit 1
+    fi
 
     echo "SPFILE='${data_dir}/${database}/spfile/spfile${database}.ora'" > $ORACLE_HOME/dbs/init${database}.ora
     sqlplus / as sysdba >> /tmp/restore_${database}.log << EOF
@@ -140,8 +86,7 @@ EOF
       startup nomount;
 EOF
 
-    backup_controlfile=$(find ${backup_db_dir} -iname ${controlfile_backup_name} -exec ls -trh "{}" + | tail -1)
-
+    phase_start
     rman target=/ >> /tmp/restore_${database}.log << EOF
       restore controlfile from '${backup_controlfile}';
       alter database mount;
@@ -151,6 +96,7 @@ EOF
     sqlplus -s / as sysdba > /dev/null << EOF
       alter database disable block change tracking;
 EOF
+    phase_end ${database} controlfile_restore
 
     channels=""
     for ((cpu_count=1; cpu_count <= ${parallel_level}; cpu_count++))
@@ -158,26 +104,65 @@ EOF
       channels=$(echo -e "${channels} allocate channel channel${cpu_count} device type disk;")
     done
 
+    until_clause=""
+    if [ -n "${ORADOCK_UNTIL_TIME}" ]
+    then
+      until_clause="set until time \"to_date('${ORADOCK_UNTIL_TIME}', 'YYYY-MM-DD HH24:MI:SS')\";"
+    fi
+
     release_channels=""
-    for ((cpu_count=1; cpu_count <= $(cat /proc/cpuinfo | grep processor | wc -l); cpu_count++))
+    for ((cpu_count=1; cpu_count <= ${parallel_level}; cpu_count++))
     do
       release_channels=$(echo -e "${release_channels} release channel channel${cpu_count};")
     done
 
+    crosscheck=""
+    if [ "${ORADOCK_PIPELINE}" == "Y" ]
+    then
+      write_backup_sets ${backup_db_dir}
+      phase_start
+      restore_backup_waves ${backup_db_dir} ${database}
+      download_status=$?
+      phase_end ${database} wait_download
+      crosscheck="crosscheck backup;" #pieces read from the controlfile before they were downloaded are expired, so restore uses the cataloged ones
+      if [ ${download_status} -ne 0 ]
+      then
+        echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: fail to download backup files of database ${database}"
+        exit_code=1
+        continue
+      fi
+    fi
+
+    phase_start
     rman target=/ >> /tmp/restore_${database}.log << EOF
       RUN {
         set newname for database to '${data_dir}/${database}/datafile/%b';
+        ${until_clause}
 
         ${channels}
 
         catalog start with '${backup_db_dir}' noprompt;
+        ${crosscheck}
         restore database;
         switch datafile all;
+        ${release_channels}
+      }
+EOF
+    phase_end ${database} restore_database
+
+    phase_start
+    rman target=/ >> /tmp/restore_${database}.log << EOF
+      RUN {
+        ${until_clause}
+        ${channels}
+
         recover database;
         ${release_channels}
       }
 EOF
+    phase_end ${database} recover_database
 
+    phase_start
     sqlplus -s / as sysdba > /tmp/rename_redolog_${database}.sql << EOF
     set lines 500;
     set pages 500;
@@ -217,38 +202,151 @@ EOF
   WHERE old_redo.group_number = new_redo.group_number;
 EOF
 
-    sqlplus / as sysdba >> /tmp/restore_${database}.log << EOF
-      @/tmp/rename_redolog_${database}.sql;
-      alter database open resetlogs;
-      alter system set service_names='${main_service}';
-
-      shutdown immediate;
-      startup mount;
-      alter database archivelog;
-      alter database open;
+    log_mode=$(database_state | cut -d"|" -f1)
+    if [ "${ORADOCK_OPEN_MODE}" == "read-only" ] #a standby opened read only keeps the incarnation of the backups, so refresh can recover it further
+    then
+      sqlplus / as sysdba >> /tmp/restore_${database}.log << EOF
+        @/tmp/rename_redolog_${database}.sql;
+        alter database convert to physical standby;
+        startup force mount;
+        alter database open read only;
+        alter system set service_names='${main_service}';
+EOF
+    else
+      sqlplus / as sysdba >> /tmp/restore_${database}.log << EOF
+        @/tmp/rename_redolog_${database}.sql;
+        alter database open resetlogs;
+        alter system set service_names='${main_service}';
+EOF
+    fi
+
+    if [ "${log_mode}" != "ARCHIVELOG" ] && [ "${ORADOCK_OPEN_MODE}" != "read-only" ] #archivelog mode needs a clean mount, so only a database restored without it is restarted
+    then
+      sqlplus / as sysdba >> /tmp/restore_${database}.log << EOF
+        shutdown immediate;
+        startup mount;
+        alter database archivelog;
+        alter database open;
 EOF
+    fi
+    phase_end ${database} open_database
 
     if [ $(grep -e "^ORA-" /tmp/restore_${database}.log | wc -l) -ne 0 ]
     then
       echo "$(date +"%Y-%m-%d %H:%M:%S") ERROR: fail to restore database ${database}. Please check logfile '/tmp/restore_${database}.log'"
+      exit_code=1
       continue
     fi
 
     echo "${database}:$ORACLE_HOME:Y		# line added by Agent" >> /etc/oratab
 
     echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: restore & recover of ${database} database finished"
-    position=$((position+1))
   done
 
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: starting listener, logfile '/tmp/start_listener.log' inside container"
-  lsnrctl start > /tmp/start_listener.log
-  crontab_config ${script_home}
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: container ready to use"
+  finish_container ${script_home}
+  return ${exit_code}
+}
+
+write_backup_sets(){ #backup pieces known by the restored controlfile, so oradock downloads only the newest full or level 0 backup of each datafile and the backups after it
+  backup_db_dir=$1
+
+  until_condition="1=1"
+  if [ -n "${ORADOCK_UNTIL_TIME}" ]
+  then
+    until_condition="bd.completion_time <= to_date('${ORADOCK_UNTIL_TIME}', 'YYYY-MM-DD HH24:MI:SS')"
+  fi
+
+  sqlplus -S / as sysdba << EOF | grep "^ORADOCK_" > ${backup_db_dir}/.oradock_backup_sets.tmp
+  set pages 0;
+  set lines 1000;
+  set feedback off;
+  set trimspool on;
+  with base as (
+    select set_stamp, set_count, file# from (
+      select bd.set_stamp, bd.set_count, bd.file#, row_number() over (partition by bd.file# order by bd.completion_time desc) newest
+        from v\$backup_datafile bd
+       where bd.file# > 0 and nvl(bd.incremental_level, 0) = 0 and ${until_condition}
+         and exists (select 1 from v\$backup_piece bp where bp.set_stamp = bd.set_stamp and bp.set_count = bd.set_count and bp.deleted = 'NO'))
+     where newest = 1),
+  base_start as (
+    select min(bs.start_time) start_time from v\$backup_set bs where (bs.set_stamp, bs.set_count) in (select set_stamp, set_count from base))
+  select 'ORADOCK_BASE|' || set_stamp || '.' || set_count || '|' || listagg(file#, ' ') within group (order by file#) from base group by set_stamp, set_count
+  union all
+  select 'ORADOCK_PIECE|' || bp.set_stamp || '.' || bp.set_count || '|' || bp.piece# || '|' || regexp_substr(bp.handle, '[^/]+$') || '|'
+         || case when (bs.set_stamp, bs.set_count) in (select set_stamp, set_count from base) then 'Y'
+                 when bs.backup_type in ('I', 'L') and bs.completion_time >= (select start_time from base_start) then 'Y'
+                 else 'N' end
+    from v\$backup_piece bp, v\$backup_set bs
+   where bp.set_stamp = bs.set_stamp and bp.set_count = bs.set_count and bp.deleted = 'NO'
+  union all
+  select 'ORADOCK_MISSING|' || count(*) from v\$datafile where file# not in (select file# from base);
+EOF
+  mv ${backup_db_dir}/.oradock_backup_sets.tmp ${backup_db_dir}/.oradock_backup_sets
+}
+
+ready_backup_sets(){ #full and level 0 backup sets whose pieces are all downloaded. Downloaded pieces are renamed to their final name once complete
+  backup_db_dir=$1
+
+  ls -1 ${backup_db_dir} | awk -F"|" '
+    NR==FNR { downloaded[$0]=1; next }
+    $1=="ORADOCK_BASE" { base[$2]=1 }
+    $1=="ORADOCK_PIECE" && !($4 in downloaded) { missing[$2]=1 }
+    END { for (backup_set in base) if (!(backup_set in missing)) print backup_set }' - ${backup_db_dir}/.oradock_backup_sets
 }
 
-crontab_config(){
-  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: configuring crontab"
-  crontab ${script_home}/conf/cron/crontab.config
+restore_backup_waves(){ #datafiles are restored as soon as the pieces of their backup set are downloaded, while the later sets are still downloading. Datafiles restored and switched in a wave are skipped by the final restore
+  backup_db_dir=$1
+  database=$2
+
+  restored_sets=" "
+  echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: restoring datafiles of ${database} database as their backup files are downloaded"
+  while true
+  do
+    if [ -e ${backup_db_dir}/.oradock_download_complete ]
+    then
+      return 0
+    elif [ -e ${backup_db_dir}/.oradock_download_failed ]
+    then
+      return 1
+    fi
+
+    for backup_set in $(ready_backup_sets ${backup_db_dir})
+    do
+      if [[ "${restored_sets}" == *" ${backup_set} "* ]]
+      then
+        continue
+      fi
+      restored_sets="${restored_sets}${backup_set} "
+      datafiles=$(grep "^ORADOCK_BASE|${backup_set}|" ${backup_db_dir}/.oradock_backup_sets | cut -d"|" -f3 | tr ' ' ',')
+      newnames=""
+      for datafile in ${datafiles//,/ }
+      do
+        newnames="${newnames} set newname for datafile ${datafile} to '${data_dir}/${database}/datafile/%b';"
+      done
+      backup_pieces=$(awk -F"|" -v backup_set="${backup_set}" -v backup_db_dir="${backup_db_dir}" '$1=="ORADOCK_PIECE" && $2==backup_set { printf "%s'"'"'%s/%s'"'"'", separator, backup_db_dir, $4; separator=", " }' ${backup_db_dir}/.oradock_backup_sets)
+
+      echo "$(date +"%Y-%m-%d %H:%M:%S") INFO: restoring datafiles ${datafiles} of ${database} database from backup set ${backup_set}"
+      rman target=/ >> /tmp/restore_${database}.log << EOF
+        catalog backuppiece ${backup_pieces};
+        crosscheck backup;
+        RUN {
+          ${newnames}
+          ${until_clause}
+
+          ${channels}
+
+          restore datafile ${datafiles};
+          switch datafile all;
+          ${release_channels}
+        }
+EOF
+      if [ $? -ne 0 ]
+      then
+        echo "$(date +"%Y-%m-%d %H:%M:%S") WARNING: fail to restore backup set ${backup_set} of ${database} database, its datafiles are restored once all backup files are downloaded"
+      fi
+    done
+    sleep 10
+  done
 }
 
 main(){
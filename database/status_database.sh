@@ -0,0 +1,42 @@
+#!/bin/bash
+source ~/.bash_profile
+
+database_status(){
+  database=$1
+  export ORACLE_SID=${database}
+
+  instance_status=$(sqlplus -S / as sysdba << EOF | grep -e "^OPEN" -e "^MOUNTED" -e "^STARTED" | head -1
+  set pages 0;
+  set feedback off;
+  select status from v\$instance;
+EOF
+)
+  if [ -z "${instance_status}" ]
+  then
+    instance_status="DOWN"
+  fi
+
+  listener_status="N"
+  if [ -n "$(lsnrctl status | grep "Instance \"${database}\", status READY")" ]
+  then
+    listener_status="Y"
+  fi
+
+  startup_status="-|-"
+  if [ -e /tmp/oradock_startup/${database} ]
+  then
+    startup_status=$(cat /tmp/oradock_startup/${database})
+  fi
+
+  #each line: ORADOCK_READY|database|instance status|registered at listener|startup status|startup seconds
+  echo "ORADOCK_READY|${database}|${instance_status}|${listener_status}|${startup_status}"
+}
+
+main(){
+  for database in $(cat /etc/oratab | grep -v -e "^#" -e "^$" | awk -F: '{print $1}')
+  do
+    database_status ${database}
+  done
+}
+
+main